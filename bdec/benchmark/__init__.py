@@ -0,0 +1,320 @@
+#   Copyright (C) 2010 Henry Ludemann
+#   Copyright (C) 2010 PRESENSE Technologies GmbH
+#
+#   This file is part of the bdec decoder library.
+#
+#   The bdec decoder library is free software; you can redistribute it
+#   and/or modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 2.1 of the License, or (at your option) any later version.
+#
+#   The bdec decoder library is distributed in the hope that it will be
+#   useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public
+#   License along with this library; if not, see
+#   <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark loading, decoding and encoding of specifications.
+
+The benchmarks run over the example specifications (with their sample files)
+and the regression corpora. Each sample is processed repeatedly until the
+requested number of bytes has been processed, for both the builtin python
+decoder and the compiled C decoder.
+
+See bdec.benchmark.runner for the command line interface.
+"""
+
+import glob
+import gzip
+import json
+import logging
+import math
+import os
+import os.path
+import shutil
+import subprocess
+import tempfile
+from timeit import default_timer
+
+import bdec
+import bdec.compiler as comp
+import bdec.data as dt
+import bdec.output.xmlout as xmlout
+from bdec.spec import load_specs
+
+PYTHON = 'python'
+C = 'c'
+
+LOAD = 'load'
+DECODE = 'decode'
+XML = 'xml'
+ENCODE = 'encode'
+
+class Result:
+    """The result of a single benchmark."""
+    def __init__(self, name, stage, language, seconds, bytes=0, events=0):
+        self.name = name
+        self.stage = stage
+        self.language = language
+        self.seconds = seconds
+        self.bytes = bytes
+        self.events = events
+
+    def key(self):
+        """The key used to match results across benchmark runs."""
+        return (self.name, self.stage, self.language)
+
+    def mb_per_second(self):
+        if not self.bytes or not self.seconds:
+            return None
+        return self.bytes / self.seconds / (1024 * 1024)
+
+    def events_per_second(self):
+        if not self.events or not self.seconds:
+            return None
+        return self.events / self.seconds
+
+    def to_dict(self):
+        return {'name':self.name, 'stage':self.stage,
+                'language':self.language, 'seconds':self.seconds,
+                'bytes':self.bytes, 'events':self.events,
+                'mb_per_second':self.mb_per_second(),
+                'events_per_second':self.events_per_second()}
+
+    @staticmethod
+    def from_dict(item):
+        return Result(item['name'], item['stage'], item['language'],
+                item['seconds'], item['bytes'], item['events'])
+
+    def __str__(self):
+        rate = ''
+        if self.mb_per_second() is not None:
+            rate += '%10.3f MB/s' % self.mb_per_second()
+        if self.events_per_second() is not None:
+            rate += '%12.0f events/s' % self.events_per_second()
+        return '%-60s %-7s %-7s %9.4fs %s' % (self.name, self.language,
+                self.stage, self.seconds, rate)
+
+
+class Corpus:
+    """A specification and the sample files it can decode."""
+    def __init__(self, name, spec_filename, data_filenames):
+        self.name = name
+        self.spec_filename = spec_filename
+        self.data_filenames = data_filenames
+
+
+def find_specs(root):
+    """Find the example specifications and their sample files.
+
+    root -- The directory containing the 'specs' folder.
+    """
+    specs_dir = os.path.join(root, 'specs')
+    for filename in sorted(glob.glob(os.path.join(specs_dir, '*.xml'))):
+        name = os.path.splitext(os.path.basename(filename))[0]
+        data_dir = os.path.join(specs_dir, 'test', name)
+        if os.path.isdir(data_dir):
+            samples = sorted(os.path.join(data_dir, f) for f in os.listdir(data_dir))
+            yield Corpus('specs/%s' % name, filename, samples)
+
+def find_regression(root):
+    """Find the regression specifications that have successful sample files.
+
+    root -- The directory containing the 'regression' folder.
+    """
+    regression_dir = os.path.join(root, 'regression')
+    for format in ['xml', 'asn1']:
+        format_dir = os.path.join(regression_dir, format)
+        for filename in sorted(glob.glob(os.path.join(format_dir, '*.%s' % format))):
+            if filename.endswith('.expected.xml'):
+                continue
+            base = os.path.splitext(filename)[0]
+            samples = []
+            for extension in ['bin', 'ber', 'der']:
+                samples.extend(f for f in glob.glob('%s.*.%s' % (base, extension))
+                        if '.failure.' not in f)
+            if samples:
+                name = 'regression/%s/%s' % (format, os.path.basename(base))
+                yield Corpus(name, filename, sorted(samples))
+
+def read_sample(filename):
+    """Read the contents of a sample file, uncompressing gzip'ed files."""
+    if filename.endswith('.gz'):
+        input = gzip.GzipFile(filename, 'rb')
+    else:
+        input = open(filename, 'rb')
+    try:
+        return input.read()
+    finally:
+        input.close()
+
+def _repeats(data, size, max_repeats):
+    """The number of times to process the data to reach 'size' bytes."""
+    repeats = int(math.ceil(size / float(max(len(data), 1))))
+    return max(1, min(repeats, max_repeats))
+
+def _time(function, repeats):
+    start = default_timer()
+    for i in xrange(repeats):
+        function()
+    return default_timer() - start
+
+
+class _NullOutput:
+    def write(self, text):
+        pass
+
+
+def benchmark_python(corpus, size, max_repeats):
+    """Benchmark the builtin python decoder and encoder.
+
+    Returns a list of Result instances."""
+    start = default_timer()
+    spec, common, lookup = load_specs([(corpus.spec_filename, None, None)])
+    results = [Result(corpus.name, LOAD, PYTHON, default_timer() - start)]
+
+    for filename in corpus.data_filenames:
+        name = '%s:%s' % (corpus.name, os.path.basename(filename))
+        data = read_sample(filename)
+        repeats = _repeats(data, size, max_repeats)
+        num_bytes = len(data) * repeats
+
+        events = [0]
+        def decode():
+            for event in spec.decode(dt.Data(data)):
+                events[0] += 1
+        try:
+            seconds = _time(decode, repeats)
+        except bdec.DecodeError:
+            # We can only benchmark samples that decode successfully.
+            continue
+        results.append(Result(name, DECODE, PYTHON, seconds, num_bytes, events[0]))
+
+        seconds = _time(lambda: xmlout.to_file(spec, dt.Data(data), _NullOutput()), repeats)
+        results.append(Result(name, XML, PYTHON, seconds, num_bytes, events[0]))
+
+        xml = xmlout.to_string(spec, dt.Data(data))
+        try:
+            seconds = _time(lambda: xmlout.encode(spec, xml).bytes(), repeats)
+        except (bdec.DecodeError, xmlout.UnknownIntegerError), ex:
+            # Not all specifications can be encoded.
+            logging.warning("Unable to encode '%s' (%s); skipping its encode benchmark.",
+                    name, ex)
+            continue
+        results.append(Result(name, ENCODE, PYTHON, seconds, num_bytes, events[0]))
+    return results
+
+def _count_events(spec, data):
+    count = 0
+    for event in spec.decode(dt.Data(data)):
+        count += 1
+    return count
+
+def _startup_time(executable, empty_filename, devnull, runs=5):
+    """Measure the time to start the decoder and decode an empty file.
+
+    Returns the fastest of several runs, in seconds."""
+    command = [executable, '-q', empty_filename]
+    return min(_time(lambda: subprocess.call(command, stdout=devnull,
+        stderr=devnull), 1) for i in range(runs))
+
+def benchmark_c(corpus, size, max_repeats, compiler=None, flags=['-O2']):
+    """Benchmark the compiled C decoder.
+
+    The 'load' stage is the time to generate and compile the decoder. Each
+    run starts a new process; the time to start the decoder on an empty file
+    is measured and subtracted from each run. The 'encode' stage decodes and
+    re-encodes the sample.
+
+    compiler -- The C compiler to use; defaults to $CC (or gcc).
+    Returns a list of Result instances, which is empty if the decoder could
+    not be compiled."""
+    if compiler is None:
+        compiler = os.getenv('CC', 'gcc')
+    output_dir = tempfile.mkdtemp()
+    try:
+        start = default_timer()
+        spec, common, lookup = load_specs([(corpus.spec_filename, None, None)])
+        templates = comp.load_templates(comp.BuiltinTemplate('c'))
+        comp.generate_code(spec, templates, output_dir, common, {'generate_encoder':True})
+        executable = os.path.join(output_dir, 'decode')
+        sources = glob.glob(os.path.join(output_dir, '*.c'))
+        try:
+            if subprocess.call([compiler] + flags + ['-o', executable] + sources) != 0:
+                return []
+        except OSError:
+            # The compiler isn't available.
+            return []
+        results = [Result(corpus.name, LOAD, C, default_timer() - start)]
+
+        devnull = open(os.devnull, 'w')
+        try:
+            empty_filename = os.path.join(output_dir, 'empty.bin')
+            open(empty_filename, 'wb').close()
+            startup = _startup_time(executable, empty_filename, devnull)
+            for filename in corpus.data_filenames:
+                name = '%s:%s' % (corpus.name, os.path.basename(filename))
+                data = read_sample(filename)
+                try:
+                    events = _count_events(spec, data)
+                except bdec.DecodeError:
+                    continue
+                data_filename = os.path.join(output_dir, 'data.bin')
+                datafile = open(data_filename, 'wb')
+                datafile.write(data)
+                datafile.close()
+
+                repeats = _repeats(data, size, max_repeats)
+                num_bytes = len(data) * repeats
+                encoded = os.path.join(output_dir, 'encoded.bin')
+                commands = [(DECODE, [executable, '-q', data_filename]),
+                        (XML, [executable, data_filename]),
+                        (ENCODE, [executable, '-q', '-e', encoded, data_filename])]
+                for stage, command in commands:
+                    failed = []
+                    def run():
+                        if subprocess.call(command, stdout=devnull, stderr=devnull) != 0:
+                            failed.append(command)
+                    seconds = max(0.0, _time(run, repeats) - startup * repeats)
+                    if not failed:
+                        results.append(Result(name, stage, C, seconds, num_bytes, events * repeats))
+        finally:
+            devnull.close()
+        return results
+    finally:
+        shutil.rmtree(output_dir)
+
+def save(results, output):
+    """Save a list of results to a file as json."""
+    json.dump({'results':[result.to_dict() for result in results]}, output, indent=2)
+    output.write('\n')
+
+def load(input):
+    """Load a list of results that were previously saved."""
+    return [Result.from_dict(item) for item in json.load(input)['results']]
+
+def compare(old, new, threshold=0.1):
+    """Find the benchmarks that have slowed down.
+
+    old -- The list of previous results.
+    new -- The list of current results.
+    threshold -- The fractional slowdown that is flagged as a regression.
+    return -- A list of (old, new) result tuples.
+    """
+    previous = dict((result.key(), result) for result in old)
+    regressions = []
+    for result in new:
+        try:
+            before = previous[result.key()]
+        except KeyError:
+            continue
+        if result.bytes != before.bytes or not before.seconds:
+            # The results aren't comparable.
+            continue
+        if result.seconds > before.seconds * (1 + threshold):
+            regressions.append((before, result))
+    return regressions
@@ -0,0 +1,134 @@
+#   Copyright (C) 2010 Henry Ludemann
+#   Copyright (C) 2010 PRESENSE Technologies GmbH
+#
+#   This file is part of the bdec decoder library.
+#
+#   The bdec decoder library is free software; you can redistribute it
+#   and/or modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 2.1 of the License, or (at your option) any later version.
+#
+#   The bdec decoder library is distributed in the hope that it will be
+#   useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public
+#   License along with this library; if not, see
+#   <http://www.gnu.org/licenses/>.
+
+import getopt
+import os.path
+import sys
+
+import bdec.benchmark as bench
+
+def usage(program):
+    print 'Benchmark the bundled specifications and regression corpus.'
+    print 'Usage:'
+    print '   %s [options] [filter]' % program
+    print
+    print 'Arguments:'
+    print '   filter -- Only run benchmarks whose name contains this text.'
+    print
+    print 'Options:'
+    print '  --compare=<filename>'
+    print '                    Compare against previously saved results, and exit with'
+    print '                    an error if any benchmark has slowed down.'
+    print '  -h, --help        Print this help.'
+    print '  --languages=<list>'
+    print "                    Comma separated list of decoders to benchmark. Defaults"
+    print "                    to 'python,c'."
+    print '  --max-repeats=<count>'
+    print '                    The maximum number of times to process each sample.'
+    print '                    Defaults to 100.'
+    print '  -o <filename>     Save the results as json to filename.'
+    print '  --root=<dir>      The directory containing the specs and regression'
+    print '                    folders. Defaults to the current directory.'
+    print '  --size=<bytes>    Process each sample until this many bytes have been'
+    print '                    processed. Defaults to 65536.'
+    print '  --threshold=<fraction>'
+    print '                    The slowdown that is reported as a regression when'
+    print '                    comparing. Defaults to 0.1.'
+
+def _parse_args():
+    options = {'root':'.', 'languages':[bench.PYTHON, bench.C],
+            'size':65536, 'max_repeats':100, 'output':None, 'compare':None,
+            'threshold':0.1, 'filter':''}
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], 'ho:', ['compare=', 'help',
+            'languages=', 'max-repeats=', 'root=', 'size=', 'threshold='])
+    except getopt.GetoptError, ex:
+        sys.exit("%s\nSee '%s -h' for correct usage." % (ex, sys.argv[0]))
+    try:
+        for opt, arg in opts:
+            if opt == '--compare':
+                options['compare'] = arg
+            elif opt in ['-h', '--help']:
+                usage(sys.argv[0])
+                sys.exit(0)
+            elif opt == '--languages':
+                options['languages'] = arg.split(',')
+                for language in options['languages']:
+                    if language not in [bench.PYTHON, bench.C]:
+                        sys.exit("Unknown language '%s'!" % language)
+            elif opt == '--max-repeats':
+                options['max_repeats'] = int(arg)
+            elif opt == '-o':
+                options['output'] = arg
+            elif opt == '--root':
+                options['root'] = arg
+            elif opt == '--size':
+                options['size'] = int(arg)
+            elif opt == '--threshold':
+                options['threshold'] = float(arg)
+            else:
+                assert 0, 'Unhandled option %s!' % opt
+    except ValueError, ex:
+        sys.exit("Invalid value for '%s'; %s" % (opt, ex))
+
+    if len(args) > 1:
+        sys.exit("Too many arguments! See '%s -h' for more info." % sys.argv[0])
+    if args:
+        options['filter'] = args[0]
+    return options
+
+def main():
+    options = _parse_args()
+    root = options['root']
+    if not os.path.isdir(os.path.join(root, 'specs')):
+        sys.exit("Unable to find the specifications in '%s'!" % root)
+
+    benchmarks = {bench.PYTHON:bench.benchmark_python, bench.C:bench.benchmark_c}
+    results = []
+    for corpus in list(bench.find_specs(root)) + list(bench.find_regression(root)):
+        if options['filter'] not in corpus.name:
+            continue
+        for language in options['languages']:
+            try:
+                found = benchmarks[language](corpus, options['size'], options['max_repeats'])
+            except Exception, ex:
+                sys.stderr.write('Failed to benchmark %s (%s): %s\n' % (corpus.name, language, ex))
+                continue
+            for result in found:
+                print result
+            results.extend(found)
+
+    if options['output'] is not None:
+        output = open(options['output'], 'w')
+        bench.save(results, output)
+        output.close()
+
+    if options['compare'] is not None:
+        input = open(options['compare'], 'r')
+        previous = bench.load(input)
+        input.close()
+        regressions = bench.compare(previous, results, options['threshold'])
+        for before, after in regressions:
+            sys.stderr.write('Regression: %s %s %s took %.4fs (was %.4fs)\n' % (
+                after.name, after.language, after.stage, after.seconds, before.seconds))
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
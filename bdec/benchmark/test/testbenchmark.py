@@ -0,0 +1,91 @@
+#   Copyright (C) 2010 Henry Ludemann
+#
+#   This file is part of the bdec decoder library.
+#
+#   The bdec decoder library is free software; you can redistribute it
+#   and/or modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 2.1 of the License, or (at your option) any later version.
+#
+#   The bdec decoder library is distributed in the hope that it will be
+#   useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public
+#   License along with this library; if not, see
+#   <http://www.gnu.org/licenses/>.
+
+import os
+import os.path
+import shutil
+import StringIO
+import tempfile
+import unittest
+
+import bdec.benchmark as bench
+
+class TestBenchmark(unittest.TestCase):
+    def test_save_and_load(self):
+        results = [bench.Result('a', bench.DECODE, bench.PYTHON, 2.0, 1024 * 1024, 10)]
+        output = StringIO.StringIO()
+        bench.save(results, output)
+        loaded = bench.load(StringIO.StringIO(output.getvalue()))
+        self.assertEqual(1, len(loaded))
+        self.assertEqual(('a', 'decode', 'python'), loaded[0].key())
+        self.assertEqual(0.5, loaded[0].mb_per_second())
+        self.assertEqual(5, loaded[0].events_per_second())
+
+    def test_compare(self):
+        old = [bench.Result('a', bench.DECODE, bench.PYTHON, 1.0, 100),
+                bench.Result('b', bench.DECODE, bench.PYTHON, 1.0, 100),
+                bench.Result('c', bench.DECODE, bench.PYTHON, 1.0, 100)]
+        new = [bench.Result('a', bench.DECODE, bench.PYTHON, 1.05, 100),
+                bench.Result('b', bench.DECODE, bench.PYTHON, 1.5, 100),
+                bench.Result('c', bench.DECODE, bench.PYTHON, 1.5, 200),
+                bench.Result('d', bench.DECODE, bench.PYTHON, 9.0, 100)]
+        regressions = bench.compare(old, new, 0.1)
+        self.assertEqual(1, len(regressions))
+        self.assertEqual('b', regressions[0][1].name)
+
+    def _benchmark_python(self, text, data):
+        root = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(root, 'specs', 'test', 'simple'))
+            spec = open(os.path.join(root, 'specs', 'simple.xml'), 'w')
+            spec.write(text)
+            spec.close()
+            sample = open(os.path.join(root, 'specs', 'test', 'simple', 'a.bin'), 'wb')
+            sample.write(data)
+            sample.close()
+
+            corpora = list(bench.find_specs(root))
+            self.assertEqual(1, len(corpora))
+            return bench.benchmark_python(corpora[0], 4, 100)
+        finally:
+            shutil.rmtree(root)
+
+    def test_python_benchmark(self):
+        results = self._benchmark_python(
+                '<protocol><field name="a" length="8" type="integer" /></protocol>', '\x05')
+        self.assertEqual(['load', 'decode', 'xml', 'encode'],
+                [result.stage for result in results])
+        self.assertEqual(4, results[1].bytes)
+        self.assertEqual(8, results[1].events)
+
+    def test_encode_failure_is_skipped(self):
+        # This specification decodes, but fails to encode (see regression
+        # test 074).
+        results = self._benchmark_python("""
+            <protocol>
+              <sequence name="a">
+                <reference name="b" type="digit" min="3" max="5" />
+              </sequence>
+              <common>
+                <sequence name="digit" value="${text digit:} - 48">
+                  <field name="text digit:" length="8" min="48" max="57" />
+                </sequence>
+              </common>
+            </protocol>""", '3')
+        self.assertEqual(['load', 'decode', 'xml'],
+                [result.stage for result in results])
@@ -81,6 +81,16 @@ class Templates:
 
 _SETTINGS = "settings.py"
 
+# Templates can have this extension appended to stop them being mistaken for
+# source files (for example, python templates). It is removed from the
+# generated filename.
+_TEMPLATE_EXTENSION = ".mako"
+
+def _output_filename(filename):
+    if filename.endswith(_TEMPLATE_EXTENSION):
+        return filename[:-len(_TEMPLATE_EXTENSION)]
+    return filename
+
 def is_template(filename):
     # We ignore all 'hidden' files, and the setting files, when looking for templates.
     return not filename.startswith('.') and not filename.endswith('.pyc') \
@@ -118,17 +128,20 @@ def _generate_template(output_dir, filename, lookup, template):
         output.close()
 
 
-class _EscapedParameters(prm.CompoundParameters):
+class _EscapedParameters(prm.CachedParameters):
     def __init__(self, utils, params):
         self._utils = utils
-        prm.CompoundParameters.__init__(self, params)
+        prm.CachedParameters.__init__(self, prm.CompoundParameters(params))
 
     def _get_name_map(self, entry):
+        return self.memoise('names', entry, self._create_name_map, entry)
+
+    def _create_name_map(self, entry):
         """Map an unescaped name to an escaped 'local' name."""
         # We escape the parameter names first to give them the first change of
         # getting the name they want.
-        param_names = [param.name for param in prm.CompoundParameters.get_params(self, entry)]
-        local_names = [local.name for local in prm.CompoundParameters.get_locals(self, entry)]
+        param_names = [param.name for param in prm.CachedParameters.get_params(self, entry)]
+        local_names = [local.name for local in prm.CachedParameters.get_locals(self, entry)]
         param_escaped = self._utils.esc_names(param_names, self._utils.variable_name)
         local_escaped = self._utils.esc_names(local_names, self._utils.variable_name, param_escaped)
 
@@ -148,27 +161,39 @@ class _EscapedParameters(prm.CompoundParameters):
         return self._get_name_map(entry)[name]
 
     def get_locals(self, entry):
+        return self.memoise('escaped locals', entry, self._escape_locals, entry)
+
+    def _escape_locals(self, entry):
         # We don't to have a local that has the same name as the parent, so we
         # escape the name with respect to the parameter names. We can get
         # similar names for references with constraints (see the 060 sequence
         # with constraint xml regression test).
         names = self._get_name_map(entry)
-        for local in prm.CompoundParameters.get_locals(self, entry):
-            yield prm.Local(names[local.name], local.type)
+        return [prm.Local(names[local.name], local.type)
+                for local in prm.CachedParameters.get_locals(self, entry)]
 
     def get_params(self, entry):
+        return self.memoise('escaped params', entry, self._escape_params, entry)
+
+    def _escape_params(self, entry):
         names = self._get_name_map(entry)
-        for param in prm.CompoundParameters.get_params(self, entry):
-            yield prm.Param(names[param.name], param.direction, param.type)
-            
+        return [prm.Param(names[param.name], param.direction, param.type)
+                for param in prm.CachedParameters.get_params(self, entry)]
+
     def get_passed_variables(self, entry, child):
+        return self.memoise('escaped passed', (entry, child),
+                self._escape_passed_variables, entry, child)
+
+    def _escape_passed_variables(self, entry, child):
         names = self._get_name_map(entry)
-        for param in prm.CompoundParameters.get_passed_variables(self, entry, child):
+        result = []
+        for param in prm.CachedParameters.get_passed_variables(self, entry, child):
             if param.name == prm.MAGIC_UNKNOWN_NAME:
                 name = param.name
             else:
                 name = names[param.name]
-            yield prm.Param(name, param.direction, param.type)
+            result.append(prm.Param(name, param.direction, param.type))
+        return result
 
 
 class _Settings:
@@ -195,26 +220,14 @@ class _Utils:
         self._entries = self._detect_entries()
         self._settings = settings
 
-        self._reachable_entries = {}
-        for entry in self._entries:
-            reachable = set()
-            self._update_reachable(entry, reachable)
-            self._reachable_entries[entry] = reachable
-
-    def _update_reachable(self, entry, reached):
-        if entry in reached:
-            return
-        reached.add(entry)
-
-        for child in entry.children:
-            try:
-                reached.update(self._reachable_entries[child.entry])
-            except KeyError:
-                self._update_reachable(child.entry, reached)
+        self._components = {}
+        for component in prm.components(common):
+            for entry in component:
+                self._components[entry] = component
 
     def is_recursive(self, parent, child):
-        "Is the parent entry reachable from the given child."
-        return parent in self._reachable_entries[child]
+        "Is the parent entry reachable from the given child (one of its children)."
+        return self._components[parent] is self._components[child]
 
     def _detect_recursive(self, parent, child, parents):
         pass
@@ -344,7 +357,7 @@ class _Utils:
 def _crange(start, end):
     return [chr(i) for i in range(ord(start), ord(end)+1)]
 _NUMBERS = _crange('0', '9')
-_VALID_CHARS = _NUMBERS + _crange('a', 'z') + _crange('A', 'Z') + ['_', ' ']
+_VALID_CHARS = set(_NUMBERS + _crange('a', 'z') + _crange('A', 'Z') + ['_', ' '])
 
 
 def _whitespace(offset):
@@ -373,15 +386,20 @@ def generate_code(spec, templates, output_dir, common_entries=[], options={}):
     entries.sort(key=lambda a:a.name)
 
     lookup = options.copy()
-    data_checker = prm.DataChecker(entries)
     lookup['settings'] = _Settings.load(templates.settings, lookup)
     utils = _Utils(entries, lookup['settings'])
 
-    params = prm.CompoundParameters([
-        prm.ResultParameters(entries),
-        prm.ExpressionParameters(entries),
+    # The same analyses are used by both the decode and encode parameters, and
+    # the queries the templates make are cached so they are only calculated
+    # once.
+    data_checker = prm.DataChecker(entries)
+    result_params = prm.ResultParameters(entries, data_checker)
+    expression_params = prm.ExpressionParameters(entries)
+    params = prm.CachedParameters(prm.CompoundParameters([
+        result_params,
+        expression_params,
         prm.EndEntryParameters(entries),
-        ])
+        ]))
     info = _EscapedParameters(utils, [params])
 
     lookup['protocol'] = spec
@@ -414,20 +432,20 @@ def generate_code(spec, templates, output_dir, common_entries=[], options={}):
 
     lookup['decode_params'] = info
     lookup['raw_decode_params'] = params
-    lookup['raw_encode_expression_params'] = prm.EncodeExpressionParameters(entries)
+    lookup['raw_encode_expression_params'] = prm.EncodeExpressionParameters(entries, expression_params)
     lookup['stupid_ugly_expression_encode_params'] = _EscapedParameters(utils, [lookup['raw_encode_expression_params']])
     # No need for the 'should end' when encoding, as we already know how long
     # the array is.
-    lookup['raw_encode_params'] = prm.CompoundParameters([
-        prm.EncodeResultParameters(entries),
-        lookup['raw_encode_expression_params']])
+    lookup['raw_encode_params'] = prm.CachedParameters(prm.CompoundParameters([
+        prm.EncodeResultParameters(entries, result_params),
+        lookup['raw_encode_expression_params']]))
     lookup['encode_params'] = _EscapedParameters(utils, [lookup['raw_encode_params']])
 
     for filename, template in templates.common:
-        _generate_template(output_dir, filename, lookup, template)
+        _generate_template(output_dir, _output_filename(filename), lookup, template)
     for filename, template in templates.entries:
         for entry in entries:
             lookup['entry'] = entry
-            extension = os.path.splitext(filename)[1]
+            extension = os.path.splitext(_output_filename(filename))[1]
             _generate_template(output_dir, utils.filename(entry.name) + extension, lookup, template)
 
@@ -17,8 +17,9 @@
 #   License along with this library; if not, see
 #   <http://www.gnu.org/licenses/>.
 
-import itertools
+import mmap
 import os
+import stat
 import string
 import struct
 import weakref
@@ -113,6 +114,17 @@ class BadTextEncodingError(DataError):
     def __str__(self):
         return "'%s' can't convert '%s'" % (self.encoding, self.data)
 
+class StreamWindowError(DataError):
+    """Data was requested from a stream that has already been discarded."""
+    def __init__(self, offset, window_start):
+        self.offset = offset
+        self.window_start = window_start
+
+    def __str__(self):
+        return "Cannot read byte %i of the stream; bytes before %i have " \
+                "been discarded (is the stream window too small?)" % (
+                        self.offset, self.window_start)
+
 class _OutOfDataError(Exception):
     """Not derived from DataError as this is an internal error."""
 
@@ -120,18 +132,31 @@ class _OutOfDataError(Exception):
 _HEX_CHARACTERS = ['a', 'b', 'c', 'd', 'e', 'f', 'A', 'B', 'C', 'D', 'E', 'F', '0', '1', '2', '3', '4', '5', '6', '7', '8', '9']
 
 class _ByteBuffer(object):
+    # If not None, a weak dictionary of id(data) to the data instances using
+    # this buffer.
+    views = None
+
     def read_byte(self, offset):
         raise NotImplementedError()
 
     def __len__(self):
         raise NotImplementedError()
 
-    def _byte_iter(self):
-        for i in range(len(self)):
-            yield self.read_byte(i)
+    def read_bytes(self, start, end):
+        """Read the bytes in the range [start, end) as a string.
+
+        If the buffer doesn't hold all of the requested bytes, the returned
+        string will be shorter than requested."""
+        chars = []
+        try:
+            for offset in xrange(start, end):
+                chars.append(chr(self.read_byte(offset)))
+        except _OutOfDataError:
+            pass
+        return ''.join(chars)
 
     def _bytes(self):
-        return ''.join(chr(c) for c in self._byte_iter())
+        return self.read_bytes(0, len(self))
 
     def __add__(self, other):
         return _MemoryBuffer(self._bytes() + other._bytes())
@@ -153,8 +178,7 @@ class _ByteBuffer(object):
         return _MemoryBuffer(''.join(self._shift_chars(num_bits)))
 
     def __getslice__(self, start, end):
-        result = _MemoryBuffer(self._bytes()[start:end])
-        return result
+        return _MemoryBuffer(self.read_bytes(start, min(end, len(self))))
 
 
 class _FileBuffer(_ByteBuffer):
@@ -172,6 +196,13 @@ class _FileBuffer(_ByteBuffer):
         self._offset = offset + 1
         return ord(result)
 
+    def read_bytes(self, start, end):
+        if start != self._offset:
+            self._file.seek(start)
+        result = self._file.read(max(0, end - start))
+        self._offset = start + len(result)
+        return result
+
     def __len__(self):
         pos = self._file.tell()
         self._file.seek(0, os.SEEK_END)
@@ -183,25 +214,94 @@ class _FileBuffer(_ByteBuffer):
 class _NonSeekingFileBuffer(_ByteBuffer):
     """Byte buffer that reads from a non-seekable file.
 
-    NOTE: Will keep the file in memory as it is read in to support streaming."""
-    def __init__(self, file):
+    The file is read in blocks of BLOCK_SIZE bytes. Blocks that are before the
+    start of every live data instance using this buffer are discarded, so
+    streams can be decoded in constant memory. If 'window' is not None and
+    more than 'window' bytes are buffered, the oldest blocks are discarded
+    even if they are still referenced, and attempting to read them will raise
+    a StreamWindowError."""
+    BLOCK_SIZE = 64 * 1024
+
+    def __init__(self, file, window=None):
         self._file = file
-        self._buffer = ''
+        self._blocks = []
+        # The stream offset of the first buffered byte
+        self._offset = 0
+        self._is_eof = False
+        self._max_blocks = None
+        if window is not None:
+            self._max_blocks = max(1, window / self.BLOCK_SIZE)
+        self.views = weakref.WeakValueDictionary()
+
+    def _end(self):
+        if not self._blocks:
+            return self._offset
+        return self._offset + (len(self._blocks) - 1) * self.BLOCK_SIZE + len(self._blocks[-1])
+
+    def _discard(self):
+        """Discard the blocks that are no longer needed."""
+        if self.views:
+            start = min(view._start for view in self.views.itervalues())
+            unused = (start / 8 - self._offset) / self.BLOCK_SIZE
+        else:
+            unused = len(self._blocks)
+        if self._max_blocks is not None:
+            # Make room for the next block
+            unused = max(unused, len(self._blocks) + 1 - self._max_blocks)
+        unused = min(unused, len(self._blocks))
+        if unused > 0:
+            del self._blocks[:unused]
+            self._offset += unused * self.BLOCK_SIZE
+
+    def _read_block(self):
+        chars = self._file.read(self.BLOCK_SIZE)
+        while chars and len(chars) < self.BLOCK_SIZE:
+            # Some file objects return less data than was requested.
+            extra = self._file.read(self.BLOCK_SIZE - len(chars))
+            if not extra:
+                break
+            chars += extra
+        return chars
+
+    def _fill(self, end):
+        """Read blocks until all data up to 'end' is buffered (if available)."""
+        while not self._is_eof and self._end() < end:
+            self._discard()
+            block = self._read_block()
+            if len(block) < self.BLOCK_SIZE:
+                self._is_eof = True
+            if block:
+                self._blocks.append(block)
 
     def read_byte(self, offset):
-        extra_bytes_needed = offset + 1 - len(self._buffer)
-        if extra_bytes_needed > 0:
-            self._buffer += self._file.read(extra_bytes_needed)
-            if len(self._buffer) < offset + 1:
-                raise _OutOfDataError()
-        return ord(self._buffer[offset])
+        self._fill(offset + 1)
+        if offset < self._offset:
+            raise StreamWindowError(offset, self._offset)
+        offset -= self._offset
+        try:
+            return ord(self._blocks[offset / self.BLOCK_SIZE][offset % self.BLOCK_SIZE])
+        except IndexError:
+            raise _OutOfDataError()
+
+    def read_bytes(self, start, end):
+        self._fill(end)
+        if start >= end:
+            return ''
+        if start < self._offset:
+            raise StreamWindowError(start, self._offset)
+        first = (start - self._offset) / self.BLOCK_SIZE
+        last = (end - self._offset - 1) / self.BLOCK_SIZE + 1
+        chars = ''.join(self._blocks[first:last])
+        offset = self._offset + first * self.BLOCK_SIZE
+        return chars[start - offset:end - offset]
+
+    def __getslice__(self, start, end):
+        return _MemoryBuffer(self.read_bytes(start, end))
 
     def __len__(self):
-        try:
-            for offset in itertools.count():
-                self.read_byte(offset)
-        except _OutOfDataError:
-            return offset
+        while not self._is_eof:
+            self._fill(self._end() + 1)
+        return self._end()
 
 
 class _MemoryBuffer(_ByteBuffer):
@@ -216,6 +316,9 @@ class _MemoryBuffer(_ByteBuffer):
             raise _OutOfDataError()
         return ord(self._buffer[offset])
 
+    def read_bytes(self, start, end):
+        return self._buffer[start:end]
+
     def __len__(self):
         return len(self._buffer)
 
@@ -223,6 +326,53 @@ class _MemoryBuffer(_ByteBuffer):
         return self._buffer
 
 
+class _MappedFileBuffer(_ByteBuffer):
+    """Byte buffer that reads from a memory mapped file.
+
+    Slices of the buffer share the mapping, so no data is copied until it is
+    actually read."""
+    def __init__(self, map, offset=0, length=None):
+        self._map = map
+        self._offset = offset
+        if length is None:
+            length = len(map) - offset
+        self._length = length
+
+    def read_byte(self, offset):
+        if offset >= self._length:
+            raise _OutOfDataError()
+        return ord(self._map[self._offset + offset])
+
+    def read_bytes(self, start, end):
+        end = min(end, self._length)
+        return self._map[self._offset + start:self._offset + end]
+
+    def __len__(self):
+        return self._length
+
+    def __getslice__(self, start, end):
+        start = min(start, self._length)
+        end = max(start, min(end, self._length))
+        return _MappedFileBuffer(self._map, self._offset + start, end - start)
+
+
+def _map_file(file):
+    """Memory map a file object.
+
+    Returns None if the file isn't a regular file, or cannot be mapped."""
+    try:
+        fileno = file.fileno()
+        if hasattr(file, 'flush'):
+            # Make sure anything written to the file is visible in the mapping.
+            file.flush()
+        info = os.fstat(fileno)
+        if not stat.S_ISREG(info.st_mode) or info.st_size == 0:
+            return None
+        return mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+    except (AttributeError, EnvironmentError, ValueError):
+        return None
+
+
 class Data(object):
     """
     A class to hold information about data to be decoded.
@@ -251,13 +401,19 @@ class Data(object):
         elif isinstance(buffer, _ByteBuffer):
             self._buffer = buffer
         elif hasattr(buffer, 'seek'):
-            # Treat the buffer as a file object.
-            try:
-                buffer.tell()
-                self._buffer = _FileBuffer(buffer)
-            except IOError:
-                # This file doesn't appear to support seeking
-                self._buffer = _NonSeekingFileBuffer(buffer)
+            # Treat the buffer as a file object. Regular files are mapped
+            # into memory, which is much faster than reading them a byte at
+            # a time.
+            map = _map_file(buffer)
+            if map is not None:
+                self._buffer = _MappedFileBuffer(map)
+            else:
+                try:
+                    buffer.tell()
+                    self._buffer = _FileBuffer(buffer)
+                except IOError:
+                    # This file doesn't appear to support seeking
+                    self._buffer = _NonSeekingFileBuffer(buffer)
         else:
             raise Exception("Unknown data source '%s'" % type(buffer))
 
@@ -267,6 +423,9 @@ class Data(object):
         assert end is None or start <= end
         self._start = start
         self._end = end
+        if self._buffer.views is not None:
+            # The buffer needs to know what data is still in use.
+            self._buffer.views[id(self)] = self
 
     def pop(self, length):
         """Return a data instance for representing the start of this data.
@@ -301,7 +460,16 @@ class Data(object):
 
         If the data length isn't a multiple of 8 bits, a DataError will be
         raised."""
-        return "".join(chr(byte) for byte in self._get_bytes())
+        length = len(self)
+        if not length:
+            return ''
+        chars = self._read_bytes()
+        if length % 8:
+            raise ConversionNeedsBytesError(self)
+        if self._start % 8 == 0:
+            return chars
+        # The data isn't byte aligned; shift all of the bytes in one go.
+        return ('%0*x' % (length / 4, self._to_int(chars))).decode('hex')
 
     def text(self, encoding):
         """Return a unicode object that represents the data buffer.
@@ -344,29 +512,35 @@ class Data(object):
         if not isinstance(other, Data):
             return NotImplemented
 
-        # TODO: This bit by bit comparison is slow...
-        a = self._get_bits()
-        b = other._get_bits()
-        while 1:
-            try:
-                a_bit = a.next()
-            except StopIteration:
-                try:
-                    b.next()
-                    # Not equal, as 'other' is longer then we are
-                    return False
-                except StopIteration:
-                    # Equal, as same size, same values
-                    return True
-
-            try:
-                b_bit = b.next()
-            except StopIteration:
-                # Not equal, as we are longer than 'other'
-                return False
-
-            if a_bit != b_bit:
-                return False
+        length = len(self)
+        if length != len(other):
+            return False
+        if not length:
+            return True
+
+        a = self._read_bytes()
+        b = other._read_bytes()
+        if self._start % 8 != other._start % 8:
+            # The bits are at different offsets in the two buffers; compare
+            # them as integers.
+            return self._to_int(a) == other._to_int(b)
+
+        # Both buffers have the same alignment, so we can compare the whole
+        # bytes directly, and only need to mask the leading and trailing bits.
+        head = 0xff >> (self._start % 8)
+        tail = (0xff << ((8 - self._end % 8) % 8)) & 0xff
+        if len(a) == 1:
+            return ord(a) & head & tail == ord(b) & head & tail
+        return ord(a[0]) & head == ord(b[0]) & head and \
+                ord(a[-1]) & tail == ord(b[-1]) & tail and \
+                a[1:-1] == b[1:-1]
+
+    def __hash__(self):
+        """Data instances with equal bits have the same hash.
+
+        Note that the hash changes when data is popped, so data used as a key
+        shouldn't be modified."""
+        return hash((len(self), int(self)))
 
     def __ne__(self, other):
         if not isinstance(other, Data):
@@ -445,6 +619,35 @@ class Data(object):
             available_bits = num_bytes * 8 - self._start
             raise NotEnoughDataError(length, available_bits)
 
+    def _read_bytes(self):
+        """Read all of the bytes covering this data instance.
+
+        The bytes are read from the backing store in a single request. The
+        first bit of the data is at bit 'self._start % 8' of the first
+        returned byte, and the data ends at bit 'self._end % 8' of the last.
+
+        Can throw NotEnoughDataError if the backing store doesn't have the
+        required amount of data for this instance.
+        """
+        length = len(self)
+        first = self._start / 8
+        last = (self._end + 7) / 8
+        chars = self._buffer.read_bytes(first, last)
+        if len(chars) != last - first:
+            available = max(0, len(chars) * 8 - self._start % 8)
+            raise NotEnoughDataError(length, available)
+        return chars
+
+    def _to_int(self, chars):
+        """Convert the bytes returned from _read_bytes to an integer.
+
+        The bytes are converted in one operation, then shifted and masked to
+        remove the bits outside of this data instance."""
+        result = int(chars.encode('hex'), 16) >> ((8 - self._end % 8) % 8)
+        if self._start % 8:
+            result &= (1 << (self._end - self._start)) - 1
+        return result
+
     def __int__(self):
         """
         Convert the buffer to an integer
@@ -453,14 +656,7 @@ class Data(object):
         """
         if not len(self):
             return 0
-
-        data = self.copy()
-        result = 0
-        for bit in data.pop(len(data) % 8)._get_bits():
-            result = (result << 1) | bit
-        for byte in data._get_bytes():
-            result = (result << 8) | byte
-        return result
+        return self._to_int(self._read_bytes())
 
     def __add__(self, other):
         if not isinstance(other, Data):
@@ -518,31 +714,6 @@ class Data(object):
 
         return Data(left + right, left_start, left_start + len(self) + len(other))
 
-    def _get_bytes(self):
-        """
-        Return an iterator to a series of byte values in the data.
-        """
-        if self._start % 8 == 0 and self._end is not None and self._end % 8 == 0:
-            # Optimise for the case where we know the length of the data, and
-            # it is byte aligned.
-            for i in xrange(self._start / 8, self._end / 8):
-                try:
-                    yield self._buffer.read_byte(i)
-                except _OutOfDataError:
-                    raise NotEnoughDataError(self._end - self._start, i * 8 - self._start)
-        else:
-            # Read as many of the bits as possible, yielding the results.
-            value = 0
-            i = None
-            for i, bit in enumerate(self._get_bits()):
-                value = (value << 1) | bit
-                if (i + 1) % 8 == 0:
-                    # We have a new byte!
-                    yield value
-                    value = 0
-            if i is not None and i % 8 != 7:
-                raise ConversionNeedsBytesError(self)
-
     def __float__(self):
         """
         Convert the data buffer to a float that has been encoded in big endian.
@@ -587,10 +758,10 @@ class Data(object):
         """
         Get an integer that has been encoded in little endian format
         """
-        result = 0
-        for byte, value in enumerate(self._get_bytes()):
-            result = result | (value << (8 * byte))
-        return result
+        chars = self.bytes()
+        if not chars:
+            return 0
+        return int(chars[::-1].encode('hex'), 16)
 
     def get_binary_text(self):
         """
@@ -620,11 +791,7 @@ class Data(object):
         result = ""
         if size % 8:
             result += "%x" % int(data.pop(4))
-
-        for num in data._get_bytes():
-            result += '%02x' % num
-
-        return result
+        return result + data.bytes().encode('hex')
 
     @staticmethod
     def from_int_little_endian(value, length):
@@ -667,6 +834,19 @@ class Data(object):
             raise IntegerTooLongError(value, length)
         return result
 
+    @staticmethod
+    def from_stream(file, window=None):
+        """Create a data object that reads from a (possibly non-seekable) file.
+
+        The file is read in blocks, and data that is no longer referenced is
+        discarded as the decode progresses.
+
+        window -- The maximum number of bytes to buffer. If more than this is
+            buffered, the oldest data is discarded, and attempting to read it
+            will raise a StreamWindowError. If None, there is no limit.
+        """
+        return Data(_NonSeekingFileBuffer(file, window))
+
     @staticmethod
     def from_hex(hex):
         """
@@ -720,3 +900,60 @@ class Data(object):
         return Data("".join(buffer), 0, len(buffer) * 8 - (8 - length))
 
 
+def _write(items, write):
+    """Write the bytes of an iterable of data objects as they become available.
+
+    write -- Called with strings of whole bytes. If the data isn't a whole
+        number of bytes, the trailing bits are written last, padded with zeros.
+    return -- The length of the data in bits.
+    """
+    length = 0
+    # The bits that haven't yet made up a whole byte
+    pending = 0
+    num_pending = 0
+    for data in items:
+        data_length = len(data)
+        if not data_length:
+            continue
+        chars = data._read_bytes()
+        length += data_length
+        if not num_pending and data._start % 8 == 0 and data_length % 8 == 0:
+            # The common case; whole bytes appended to a byte aligned buffer.
+            write(chars)
+            continue
+
+        value = (pending << data_length) | data._to_int(chars)
+        num_pending += data_length
+        num_bytes = num_pending / 8
+        num_pending %= 8
+        if num_bytes:
+            write(('%0*x' % (num_bytes * 2, value >> num_pending)).decode('hex'))
+        pending = value & ((1 << num_pending) - 1)
+
+    if num_pending:
+        write(chr(pending << (8 - num_pending)))
+    return length
+
+def join(items):
+    """Join an iterable of data objects into a single data object.
+
+    This is equivalent to reduce(operator.add, items, Data()), but the bits
+    are accumulated into a list of whole bytes, and only joined into a single
+    buffer once at the end (instead of copying the result for every addition).
+    """
+    chunks = []
+    length = _write(items, chunks.append)
+    return Data(''.join(chunks), 0, length)
+
+def write(items, output):
+    """Write an iterable of data objects to a file as they are generated.
+
+    Whole bytes are written as soon as they are available, so the data doesn't
+    have to be held in memory. If the data isn't a whole number of bytes, the
+    last byte is padded with zeros.
+
+    items -- An iterable of Data instances.
+    output -- A file-like object to write the bytes to.
+    return -- The length of the data in bits.
+    """
+    return _write(items, output.write)
@@ -19,7 +19,7 @@
 from bdec.choice import Choice
 from bdec.decode.choice import ChoiceDecoder
 from bdec.decode.entry import Child
-from bdec.decode.field import FieldDecoder
+from bdec.decode.field import create_field_decoder
 from bdec.decode.sequence import SequenceDecoder
 from bdec.decode.sequenceof import SequenceOfDecoder
 from bdec.field import Field
@@ -27,31 +27,113 @@ from bdec.sequence import Sequence
 from bdec.sequenceof import SequenceOf
 
 _decoders = {
-        Field : FieldDecoder,
+        Field : create_field_decoder,
         Sequence : SequenceDecoder,
         SequenceOf : SequenceOfDecoder,
         Choice : ChoiceDecoder,
         }
 
+class UnknownSelectionError(Exception):
+    """Raised when a selected path doesn't match an entry."""
+    def __init__(self, path):
+        Exception.__init__(self)
+        self.path = path
+
+    def __str__(self):
+        return "No entry matches selected path '%s'!" % self.path
+
+def _select(entry, paths):
+    """Convert a list of entry paths to the selection used when decoding.
+
+    The selection is a dictionary mapping child names to the selection for
+    that child, where None selects the child and all of its children.
+    """
+    for path in paths:
+        names = path.split('.')
+        if names[0] != entry.name:
+            raise UnknownSelectionError(path)
+        current = entry
+        for name in names[1:]:
+            matches = [child for child in current.children if child.name == name]
+            if not matches:
+                raise UnknownSelectionError(path)
+            current = matches[0].entry
+
+    result = {}
+    for path in paths:
+        names = path.split('.')
+        if len(names) == 1:
+            # The whole entry has been selected.
+            return None
+        select = result
+        for name in names[1:-1]:
+            select = select.setdefault(name, {})
+            if select is None:
+                # A parent of this entry has already been selected.
+                break
+        else:
+            select[names[-1]] = None
+    return result
+
 class Decoder:
     """ Decode instance data based on a specification. """
-    def __init__(self, entry):
+    def __init__(self, entry, profiler=None, select=None, arrays=False):
         """Construct a decoder instance.
 
         entry -- The entry that will be used for the decoding.
+        profiler -- If not None, a bdec.decode.profile.Profiler instance to
+            record the cost of decoding each entry.
+        select -- If not None, a list of the paths of the entries to decode,
+            such as 'png.chunks.chunk'. Only the selected entries (and the
+            entries that contain them) are emitted; other entries are
+            skipped over by length where possible.
+        arrays -- If true, sequenceofs of fixed size integer records are
+            decoded to numpy arrays (see bdec.decode.arrays). The items of
+            these sequenceofs aren't emitted; the value of the sequenceof is
+            the array. Requires numpy. Cannot be used with a profiler, as
+            the items of the arrays wouldn't be profiled.
         """
+        if profiler is not None and arrays:
+            raise ValueError('Decoding to arrays cannot be profiled!')
+        self._profiler = profiler
+        self._select = None
+        if select is not None:
+            self._select = _select(entry, select)
 
         # Inspect the parameters for the entries to decode.
         import bdec.inspect.param
         end_entry_params = bdec.inspect.param.EndEntryParameters([entry])
         expression_params = bdec.inspect.param.ExpressionParameters([entry])
-        params = bdec.inspect.param.CompoundParameters([end_entry_params, expression_params])
+        params = bdec.inspect.param.CachedParameters(
+                bdec.inspect.param.CompoundParameters([end_entry_params, expression_params]))
 
         self._entries = {}
         self._decoder = self._get_decoder(entry, params)
+        # Compile the decoders to use lists of values for their contexts
+        # instead of dictionaries.
+        decoders = self._entries.values()
+        for decoder in decoders:
+            decoder.assign_slots([local.name for local in params.get_locals(decoder.entry)])
+        for decoder in decoders:
+            decoder.compile()
+        if profiler is None:
+            # Sequences with a fixed layout are decoded in one pass. This
+            # isn't done when profiling, as the children of the sequences
+            # wouldn't be profiled.
+            for decoder in decoders:
+                if isinstance(decoder, SequenceDecoder):
+                    decoder.compile_layout()
+        if arrays:
+            import bdec.decode.arrays
+            for decoder in decoders:
+                if isinstance(decoder, SequenceOfDecoder):
+                    decoder._array = bdec.decode.arrays.compile_array(decoder)
 
-    def decode(self, data, context, name):
-        return self._decoder.decode(data, context, name)
+    def decode(self, data, context=None, name=None):
+        if context is None:
+            context = {}
+        return self._decoder.decode(data, self._decoder.new_context(context),
+                name, self._select)
 
     def _get_decoder(self, entry, lookup):
         try:
@@ -62,6 +144,7 @@ class Decoder:
                     lookup.is_end_sequenceof(entry),
                     lookup.is_value_referenced(entry),
                     lookup.is_length_referenced(entry))
+            decoder.profiler = self._profiler
 
             self._entries[entry] = decoder
 
@@ -71,5 +154,4 @@ class Decoder:
                         lookup.get_params(child.entry))
                 decoder.children.append(Child(child.name,
                     self._get_decoder(child.entry, lookup), passed_params))
-
             return decoder
@@ -0,0 +1,179 @@
+#   Copyright (C) 2010 Henry Ludemann
+#
+#   This file is part of the bdec decoder library.
+#
+#   The bdec decoder library is free software; you can redistribute it
+#   and/or modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 2.1 of the License, or (at your option) any later version.
+#
+#   The bdec decoder library is distributed in the hope that it will be
+#   useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public
+#   License along with this library; if not, see
+#   <http://www.gnu.org/licenses/>.
+
+"""
+Decode sequenceofs of fixed size integer records to numpy arrays.
+
+A sequenceof whose child is an integer field (or a sequence of integer
+fields) with byte sized widths has every item laid out in the same way, so
+the whole sequenceof can be converted to a numpy array in one operation.
+The constraints of the fields are checked over the whole array.
+
+Requires numpy; this module is only imported when array decoding is
+requested (see bdec.decode.Decoder).
+"""
+
+import numpy
+
+from bdec.constraints import Equals, Maximum, Minimum
+import bdec.data as dt
+from bdec.decode.field import FieldDecoder
+from bdec.decode.sequence import SequenceDecoder, _FIELD, _add_steps
+from bdec.entry import is_hidden
+from bdec.field import Field
+
+_WIDTHS = [8, 16, 32, 64]
+
+# Lookup of constraint types to the function that finds the values
+# that fail the constraint.
+_CHECKS = {
+        Minimum : lambda values, limit: values < limit,
+        Maximum : lambda values, limit: values > limit,
+        Equals : lambda values, limit: values != limit,
+        }
+
+def _escape(name):
+    return name.replace(' ', '_')
+
+class ArrayLayout:
+    """The layout of the items of a sequenceof decoded to an array."""
+    def __init__(self, sequenceof, steps, length, is_record):
+        """Construct an array layout.
+
+        sequenceof -- The SequenceOfDecoder whose items are decoded.
+        steps -- The static layout steps of the fields of an item.
+        length -- The length of an item in bits.
+        is_record -- True if the items are sequences of fields, or False if
+            the items are fields.
+        """
+        self._sequenceof = sequenceof
+        self._steps = steps
+        self._length = length
+
+        # The dtype of every field (used to check the constraints), and the
+        # dtype of the visible fields (used for the decoded array).
+        names = []
+        formats = []
+        visible = {'names':[], 'formats':[], 'offsets':[], 'itemsize':length / 8}
+        for i, step in enumerate(steps):
+            format = '%su%i' % ('<' if step.entry.encoding == Field.LITTLE_ENDIAN else '>', step.width / 8)
+            names.append('f%i' % i)
+            formats.append(format)
+            if not is_hidden(step.name):
+                visible['names'].append(_escape(step.name))
+                visible['formats'].append(format)
+                visible['offsets'].append(step.offset / 8)
+        self._all = numpy.dtype({'names':names, 'formats':formats,
+            'offsets':[step.offset / 8 for step in steps], 'itemsize':length / 8})
+        if is_record:
+            self._visible = numpy.dtype(visible)
+        else:
+            # The items are fields; decode to an array of integers.
+            self._visible = numpy.dtype(formats[0])
+
+    def decode(self, data, context):
+        """Decode the items of the sequenceof.
+
+        Returns a (length, array) tuple, or None if the items cannot be
+        decoded as an array (eg: if there isn't enough data). In that case
+        the items should be decoded one at a time, so the error is reported
+        in the same way."""
+        sequenceof = self._sequenceof
+        if sequenceof._count is not None:
+            count = int(sequenceof._count(context))
+            if count < 0:
+                return None
+        else:
+            # The sequenceof continues until the end of its data.
+            if len(data) % self._length:
+                return None
+            count = len(data) / self._length
+        try:
+            buffer = data.copy().pop(count * self._length).bytes()
+        except dt.DataError:
+            return None
+
+        items = numpy.frombuffer(buffer, self._all)
+        self._check(items)
+        return count * self._length, numpy.frombuffer(buffer, self._visible)
+
+    def _check(self, items):
+        """Check the constraints of all of the items."""
+        failures = []
+        for i, step in enumerate(self._steps):
+            values = items['f%i' % i]
+            for constraint in step.constraints:
+                failed = numpy.flatnonzero(_CHECKS[constraint.__class__](
+                    values, constraint.limit.evaluate({})))
+                if len(failed):
+                    failures.append((failed[0], i, constraint))
+        if failures:
+            # Report the constraint that fails first when decoding the items
+            # in order.
+            index, i, constraint = min(failures)
+            step = self._steps[i]
+            constraint.check(step.entry, int(items['f%i' % i][index]), {})
+
+
+def compile_array(decoder):
+    """Create an ArrayLayout for a SequenceOfDecoder.
+
+    Returns None if the items of the sequenceof can't be decoded as an
+    array."""
+    entry = decoder.entry
+    if entry.end_entries or entry.constraints or decoder._outputs:
+        return None
+    if entry.count is None and entry.length is None:
+        # The items are decoded until the end of the data; we can only
+        # decode them as an array if the amount of data is known.
+        return None
+
+    child = decoder.children[0]
+    child_decoder = child.decoder
+    steps = []
+    if child_decoder.__class__ is SequenceDecoder:
+        if child_decoder._layout is None or child.outputs:
+            return None
+        steps = child_decoder._layout
+    elif isinstance(child_decoder, FieldDecoder):
+        if child.outputs or _add_steps(child_decoder, child.name, child, 0, steps, set()) is None:
+            return None
+    else:
+        return None
+
+    length = 0
+    names = set()
+    for step in steps:
+        if step.kind != _FIELD or step.outputs is not None:
+            # Nested sequences and referenced fields aren't supported.
+            return None
+        if step.entry.format != Field.INTEGER or step.width not in _WIDTHS or \
+                step.offset % 8:
+            return None
+        for constraint in step.constraints:
+            if constraint.__class__ not in _CHECKS or \
+                    not isinstance(constraint.limit.evaluate({}), (int, long)):
+                return None
+        if not is_hidden(step.name):
+            if step.name in names:
+                return None
+            names.add(step.name)
+        length = max(length, step.offset + step.width)
+    if not names:
+        return None
+    return ArrayLayout(decoder, steps, length, child_decoder.__class__ is SequenceDecoder)
@@ -16,11 +16,15 @@
 #   License along with this library; if not, see
 #   <http://www.gnu.org/licenses/>.
 
-import bdec
 import bdec.data as dt
-from bdec.decode.entry import EntryDecoder
+from bdec.decode.entry import Decision, EntryDecoder, Replay, Trial
 import bdec.inspect.chooser as chsr
 
+# The maximum number of events buffered while trial decoding a choice option.
+# Options with more events will be decoded again when chosen (reusing the
+# options chosen by the choices within them).
+MAX_BUFFERED_EVENTS = 10000
+
 class ChoiceDecoder(EntryDecoder):
     def __init__(self, *args, **kwargs):
         EntryDecoder.__init__(self, *args, **kwargs)
@@ -29,15 +33,12 @@ class ChoiceDecoder(EntryDecoder):
     def _decode(self, data, context, name):
         if self._chooser is None:
             self._chooser = chsr.Chooser([child.decoder.entry for child in self.children])
+            # Map the chosen entries to the first child using that entry.
+            self._children = {}
+            for child in reversed(self.children):
+                self._children[id(child.decoder.entry)] = child
         # Convert the list of entries to a list of children.
-        possibles = []
-        for entry in self._chooser.choose(data):
-            for child in self.children:
-                if child.decoder.entry is entry:
-                    possibles.append(child)
-                    break
-            else:
-                raise Exception('Failed to find child from possible option %s!' % entry)
+        possibles = [self._children[id(entry)] for entry in self._chooser.choose(data)]
 
         yield (True, name, self.entry, data, None)
 
@@ -49,46 +50,55 @@ class ChoiceDecoder(EntryDecoder):
             possibles = self.children
             failure_expected = True
 
+        # The trial decode of the best option.
+        trial = None
         if len(possibles) == 1:
             best_guess = possibles[0]
         else:
+            decision = yield Decision()
+            best_guess = decision.child
+
+        if best_guess is None:
             # We have multiple possibilities. We'll decode them one
             # at a time until one of them succeeds; if none decode,
             # we'll re-raise the exception of the 'best guess'.
             #
-            # Note: If we get in here, at best we'll decode the successfully
-            # decoding item twice. This can have severe performance
-            # implications if choices are embedded within choices (as
-            # we get O(N^2) runtime cost).
+            # The events of each trial decode are buffered, so the best option
+            # can be replayed instead of decoded a second time (which has an
+            # O(N^2) runtime cost if choices are embedded within choices).
+            # Options that decode too many events to buffer will be decoded
+            # again, with the choices within them using the options chosen
+            # during the trial.
             #
             # We should possibly emit a warning if we get in here (as it
             # indicates that the specification could be better written).
-            best_guess = None
-            best_guess_bits = 0
-            best_guess_entries = 0
             for child in possibles:
-                try:
-                    bits_decoded = 0
-                    entries_decoded = 0
-                    for is_starting, child_name, entry, entry_data, value in self._decode_child(child, data.copy(), context.copy()):
-                        if not is_starting:
-                            bits_decoded += len(entry_data)
-                            entries_decoded += 1
-
+                result = yield Trial(child, data.copy(), list(context), MAX_BUFFERED_EVENTS)
+                if self.profiler is not None:
+                    self.profiler.trial(self.entry, result.error is None)
+                if result.error is None:
                     # We successfully decoded the entry!
                     best_guess = child
+                    trial = result
                     break
-                except bdec.DecodeError:
-                    if best_guess is None or \
-                        bits_decoded > best_guess_bits or \
-                        (bits_decoded == best_guess_bits and entries_decoded > best_guess_entries):
-                        best_guess = child
-                        best_guess_bits = bits_decoded
-                        best_guess_entries = entries_decoded
+                if best_guess is None or \
+                    result.length > trial.length or \
+                    (result.length == trial.length and result.entries > trial.entries):
+                    best_guess = child
+                    trial = result
 
-        # Decode the best option.
-        for is_starting, child_name, entry, data, value in self._decode_child(best_guess, data, context):
-            yield is_starting, child_name, entry, data, value
+        if trial is not None:
+            # Replay the decode of the best option.
+            replay = Replay(trial)
+            yield replay
+            if not replay.decoded:
+                if trial.error is not None:
+                    raise trial.error
+                data.pop(trial.length)
+                context[:] = trial.context
+        else:
+            # Decode the best option.
+            yield best_guess
 
         assert not failure_expected
         yield (False, name, self.entry, dt.Data(), None)
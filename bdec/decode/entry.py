@@ -17,8 +17,23 @@
 #   License along with this library; if not, see
 #   <http://www.gnu.org/licenses/>.
 
+"""
+Decode entries using an explicit stack.
+
+Entry decoders implement '_decode' as a generator that yields the decode
+events of their own entry, and yields their children when a child entry
+should be decoded. The children are decoded by the loop in
+EntryDecoder.decode, so each event is emitted once (instead of being
+re-yielded by each of its ancestors), and the depth of the decoded data isn't
+limited by the python recursion limit.
+"""
+
+from timeit import default_timer
+
+import bdec
 import bdec.data as dt
 from bdec.entry import DecodeLengthError, EntryDataError
+from bdec.expression import SlotContext, UNSET
 
 class Param:
     def __init__(self, parent_name, child_name):
@@ -44,12 +59,314 @@ class Child:
                 self.inputs.append(names)
             else:
                 self.outputs.append(names)
+        # The inputs and outputs as (our_slot, child_slot) tuples; set by
+        # the parent's EntryDecoder.compile.
+        self.input_slots = None
+        self.output_slots = None
 
     def __str__(self):
         return '%s %s' % (str(self.decoder), self.name)
 
 
+class Trial:
+    """A request to trial decode a child entry.
+
+    The events of the child are buffered instead of being emitted, and a
+    decode error is stored instead of being raised. When the child has been
+    decoded (or has failed) the request is sent back to the generator that
+    yielded it.
+
+    The options chosen by the ambiguous choices within the child are also
+    recorded, so if there are too many events to buffer the child can be
+    decoded again without trial decoding its choices (see Decision).
+    """
+    def __init__(self, child, data, context, max_events):
+        """Construct a trial request.
+
+        child -- The Child instance to decode.
+        data -- The data to decode the child from.
+        context -- The context to update with the child's output values.
+        max_events -- The maximum number of events to buffer (including
+            the buffered events of nested trials). If the child decodes more
+            events, 'events' will be set to None.
+        """
+        self.child = child
+        self.data = data
+        self.context = context
+        self.error = None
+        # The buffered events, or None if there were too many to buffer. The
+        # buffered replays of nested trials are stored as Trial instances.
+        self.events = []
+        # The number of bits and entries decoded by the child.
+        self.length = 0
+        self.entries = 0
+        # The number of buffered events, including those of nested trials.
+        self._count = 0
+        self._max_events = max_events
+        # The options chosen by ambiguous choices in decode order. Holds
+        # Child instances, and the Trial instances whose choices follow.
+        self._choices = []
+
+    def add(self, event, is_selected=True):
+        """Buffer an event decoded by the child.
+
+        Events that aren't selected are counted, but not buffered."""
+        is_starting, name, entry, data, value = event
+        if not is_starting:
+            self.length += len(data)
+            self.entries += 1
+        if self.events is not None and is_selected:
+            if self._count >= self._max_events:
+                self.events = None
+            else:
+                if is_starting:
+                    # The starting data will be popped by the entry, so keep
+                    # a copy.
+                    event = (is_starting, name, entry, data.copy(), value)
+                self.events.append(event)
+                self._count += 1
+
+    def skip(self, length):
+        """Count an entry that was skipped by the child."""
+        self.length += length
+        self.entries += 1
+
+    def add_replay(self, trial):
+        """Buffer the replay of a nested trial."""
+        self.length += trial.length
+        self.entries += trial.entries
+        if self.events is not None:
+            if trial.events is None or \
+                    self._count + trial._count > self._max_events:
+                # Too many events to buffer; the child will be decoded again
+                # if it is chosen.
+                self.events = None
+            else:
+                # The nested trial is stored instead of copying its events,
+                # so replays within replays don't cost O(depth) per event.
+                self.events.append(trial)
+                self._count += trial._count
+
+    def add_choice(self, trial):
+        """Record the option chosen by a choice from one of its trials."""
+        self._choices.append(trial.child)
+        self._choices.append(trial)
+
+    def choices(self):
+        """Iterate over the options chosen by ambiguous choices."""
+        stack = [iter(self._choices)]
+        while stack:
+            for choice in stack[-1]:
+                if choice.__class__ is Child:
+                    yield choice
+                else:
+                    stack.append(iter(choice._choices))
+                    break
+            else:
+                stack.pop()
+
+    def __iter__(self):
+        """Iterate over the buffered events."""
+        stack = [iter(self.events)]
+        while stack:
+            for event in stack[-1]:
+                if type(event) is tuple:
+                    yield event
+                else:
+                    stack.append(iter(event.events))
+                    break
+            else:
+                stack.pop()
+
+
+class Replay:
+    """A request to reproduce the decode of a Trial.
+
+    If the trial's events were buffered they are emitted; otherwise the
+    child is decoded again, with its choices using the options chosen
+    during the trial, and 'decoded' is set to True. Within another trial
+    the replay is buffered by the enclosing trial.
+    """
+    def __init__(self, trial):
+        self.trial = trial
+        self.decoded = False
+
+
+class Decision:
+    """A request for the option chosen when the entry was trial decoded.
+
+    Yielded by ambiguous choices; 'child' is set to the chosen Child if the
+    entry is being decoded again after a trial, otherwise it is None (and
+    the options must be trial decoded).
+    """
+    def __init__(self):
+        self.child = None
+
+
+class _Frame:
+    """The state of an entry that is being decoded."""
+    def __init__(self, decoder, data, context, name, child, parent_context,
+            trial, select, choices=None):
+        entry = decoder.entry
+        if name is None:
+            name = entry.name
+
+        # Validate our context
+        for param in decoder._inputs:
+            assert context[decoder._slots[param.name]] is not UNSET, \
+                    "Context to '%s' must include %s!" % (entry, param.name)
+
+        if entry.length is not None:
+            try:
+                data = data.pop(decoder._length(context))
+            except dt.DataError, ex:
+                raise EntryDataError(entry, ex)
+
+        self.decoder = decoder
+        self.entry = entry
+        self.data = data
+        self.context = context
+        # The child being decoded, and the context of the parent that will
+        # receive its output values (both None for the entry being decoded).
+        self.child = child
+        self.parent_context = parent_context
+        # The trial request, if this frame is being trial decoded.
+        self.trial = trial
+        # The selected children of the entry (see EntryDecoder.decode).
+        self.select = select
+        # If not None, an iterator over the options chosen by the ambiguous
+        # choices when the entry was trial decoded (see Trial.choices).
+        self.choices = choices
+        if select is not None:
+            self.items = decoder._decode_selected(data, context, name)
+        else:
+            self.items = decoder._decode(data, context, name)
+        # The number of bits decoded by the entry (including its children).
+        self.length = 0
+        self.value = None
+        # The time spent decoding the entry and its children when profiling.
+        self.self_time = 0.0
+        self.nested_time = 0.0
+
+    def _child_select(self, name):
+        """Get the selection for a child of the entry."""
+        select = self.select
+        if type(select) is dict:
+            select = select.get(name, False)
+        return select
+
+    def start_child(self, child, trial, choices=None):
+        """Start decoding a child entry with our data.
+
+        trial -- The innermost Trial being decoded, or None.
+        choices -- The options chosen by the child's choices, or None to use
+            those of this entry.
+        Returns the frame of the child, or None if the child was skipped.
+        """
+        context = self.context
+        decoder = child.decoder
+        child_context = list(decoder._empty_context)
+        for our_slot, child_slot in child.input_slots:
+            child_context[child_slot] = context[our_slot]
+        select = self._child_select(child.name)
+        if select is False and decoder._is_skippable and \
+                (trial is None or decoder._is_skippable_in_trial):
+            # The child isn't selected; skip over its data. Only the last bit
+            # of the skipped data is read to check that it is available.
+            try:
+                length = decoder._length(child_context)
+                self.data.pop(length).validate()
+            except dt.DataError, ex:
+                raise EntryDataError(decoder.entry, ex)
+            self.length += length
+            if trial is not None:
+                trial.skip(length)
+            return None
+        if choices is None:
+            choices = self.choices
+        return _Frame(decoder, self.data, child_context, child.name, child,
+                context, None, select, choices)
+
+    def start_trial(self, trial):
+        """Start the trial decode of a child entry.
+
+        Returns the frame of the child, or None if the child failed to start
+        decoding (in which case the error is stored in the trial).
+        """
+        child = trial.child
+        child_context = list(child.decoder._empty_context)
+        for our_slot, child_slot in child.input_slots:
+            child_context[child_slot] = trial.context[our_slot]
+        try:
+            return _Frame(child.decoder, trial.data, child_context,
+                    child.name, child, trial.context, trial,
+                    self._child_select(child.name))
+        except bdec.DecodeError, ex:
+            trial.error = ex
+            return None
+
+    def finish(self):
+        """Update the contexts when the entry has been decoded."""
+        decoder = self.decoder
+        context = self.context
+        slot = decoder._should_end_slot
+        context[slot] = decoder._is_end_sequenceof | (context[slot] is True)
+        if decoder._is_value_referenced:
+            # The last entry to decode will be 'self', so 'value' will be
+            # ours.
+            context[decoder._value_slot] = int(self.value)
+        if decoder._is_length_referenced:
+            context[decoder._length_slot] = self.length
+        if decoder._check_length and len(self.data) != 0:
+            raise DecodeLengthError(self.entry, self.data)
+
+    def return_to(self, parent):
+        """Pass the outputs of the decoded entry to its parent."""
+        parent_context = self.parent_context
+        context = self.context
+        for our_slot, child_slot in self.child.output_slots:
+            parent_context[our_slot] = context[child_slot]
+        if self.trial is None:
+            parent.length += self.length
+
+def _record(profiler, frame, parent):
+    """Record the statistics of a frame that has left the stack."""
+    cumulative_time = frame.self_time + frame.nested_time
+    profiler.record(frame.entry, cumulative_time, frame.self_time, frame.length)
+    if parent is not None:
+        parent.nested_time += cumulative_time
+
+def _record_stack(profiler, frame, stack):
+    """Record the statistics of all frames when the decode fails."""
+    while stack:
+        parent = stack.pop()
+        _record(profiler, frame, parent)
+        frame = parent
+    _record(profiler, frame, None)
+
+def _unwind_trial(profiler, frame, stack, trials, error):
+    """Unwind the stack to the innermost trial decode after an error.
+
+    Returns the frame of the entry that requested the trial, and the trial
+    request to send to it (with the error stored).
+    """
+    trial = trials.pop()
+    while 1:
+        parent = stack.pop()
+        if profiler is not None:
+            _record(profiler, frame, parent)
+        if frame is trial:
+            break
+        frame = parent
+    trial.trial.error = error
+    return parent, trial.trial
+
+
 class EntryDecoder:
+    # If not None, a bdec.decode.profile.Profiler instance that records the
+    # time spent decoding this entry.
+    profiler = None
+
     def __init__(self, entry, params, is_end_sequenceof, is_value_referenced, is_length_referenced):
         self.entry = entry
         # This list of Child instances will be populated after construction.
@@ -65,17 +382,114 @@ class EntryDecoder:
         self._is_end_sequenceof = is_end_sequenceof
         self._is_value_referenced = is_value_referenced
         self._is_length_referenced = is_length_referenced
+        # The indexes of the names in the entry's context (see compile).
+        self._slots = None
+        self._empty_context = None
+        # The entry's length, compiled to a function of the context.
+        self._length = None
+
+        # Entries that have a known length and don't affect other entries can
+        # be skipped without being decoded when they aren't selected.
+        self._is_skippable = entry.length is not None and \
+                not entry.constraints and not self._outputs and \
+                not is_end_sequenceof
+        # Whether the entry can be skipped while trial decoding. Skipping an
+        # entry mustn't hide a decode error, as the error decides which
+        # option of a choice is used.
+        self._is_skippable_in_trial = False
+        # Whether the entry must decode all of the data of its length.
+        self._check_length = entry.length is not None
+
+    def assign_slots(self, locals):
+        """Assign an index in the context list to every name in the context.
+
+        The context of an entry is a list with a value for each of the
+        entry's parameters and local variables, so names aren't looked up
+        while decoding.
+
+        locals -- The names of the local variables of the entry.
+        """
+        names = [param.name for param in self._inputs + self._outputs]
+        names.extend(locals)
+        names.append('should end')
+        if self._is_value_referenced:
+            names.append(self.entry.name)
+        if self._is_length_referenced:
+            names.append(self.entry.name + ' length')
+        for child in self.children:
+            names.extend(our_name for our_name, child_name in child.inputs + child.outputs)
+        self._slots = {}
+        for name in names:
+            self._slots.setdefault(name, len(self._slots))
+        self._empty_context = [UNSET] * len(self._slots)
+        self._should_end_slot = self._slots['should end']
+        self._value_slot = self._slots.get(self.entry.name)
+        self._length_slot = self._slots.get(self.entry.name + ' length')
+
+    def new_context(self, values={}):
+        """Create a context list from a dictionary of names to values."""
+        result = list(self._empty_context)
+        for name, value in values.iteritems():
+            try:
+                result[self._slots[name]] = value
+            except KeyError:
+                pass
+        return result
+
+    def compile(self):
+        """Compile the expressions of the entry for its context slots.
+
+        Must be called after the slots of this entry and its children have
+        been assigned."""
+        for child in self.children:
+            child.input_slots = [(self._slots[our_name], child.decoder._slots[child_name])
+                    for our_name, child_name in child.inputs]
+            child.output_slots = [(self._slots[our_name], child.decoder._slots[child_name])
+                    for our_name, child_name in child.outputs]
+        if self.entry.length is not None:
+            self._length = self.entry.length.compile(self._slots)
+        # Constraints that reference other entries are checked using a view
+        # of the context.
+        self._has_constant_constraints = True
+        for constraint in self.entry.constraints:
+            try:
+                constraint.limit.evaluate({})
+            except Exception:
+                self._has_constant_constraints = False
+
+    def constraint_context(self, context):
+        """Get the context used to check the entry's constraints."""
+        if self._has_constant_constraints:
+            return {}
+        return SlotContext(self._slots, context)
 
     def _decode(self, data, child_context, name):
         """
         Decode the given protocol entry.
 
-        Should return an iterable object for the entry (including all 'child'
-        entries) in the same form as Entry.decode.
+        Should return a generator of the events for this entry, in the same
+        form as Entry.decode. To decode a child entry the generator yields
+        either;
+
+          * A Child instance, to decode the child with this entry's data and
+            context.
+          * A Trial instance, to decode the child without emitting its
+            events. The trial is sent back to the generator when the child
+            has finished.
+          * A Replay instance, to reproduce the decode of a trial.
+          * A Decision instance, to find the option chosen by a choice when
+            it was trial decoded. The decision is sent back to the generator.
         """
         raise NotImplementedError()
 
-    def decode(self, data, context, name=None):
+    def _decode_selected(self, data, context, name):
+        """Decode the entry when not all of its children are selected.
+
+        Returns a generator in the same form as _decode, which it defaults
+        to."""
+        return self._decode(data, context, name)
+
+    def decode(self, data, context, name=None, select=None):
         """Return an iterator of (is_starting, name, Entry, data, value) tuples.
 
         The data returned is_starting==True the data available to be decoded,
@@ -83,63 +497,115 @@ class EntryDecoder:
         this entry (not including child entries).
 
         data -- An instance of bdec.data.Data to decode.
-        context -- The context to decode in. Is a lookup of names to integer
-           values.
+        context -- The context to decode in. Is a list of values for the
+           entry's context slots (see new_context).
         name -- The name to use for this entry. If None, uses self.name.
+        select -- The entries to emit events for. None selects all entries,
+           otherwise it is a dictionary mapping child names to the selection
+           for that child. Children that aren't in the dictionary aren't
+           emitted, and are skipped by their length where possible (except
+           when trial decoding, where all entries must be decoded to detect
+           errors).
         """
-        if name is None:
-            name = self.entry.name
-
-        # Validate our context
-        for param in self._inputs:
-            assert param.name in context, "Context to '%s' must include %s!" % (self.entry, param.name)
-
-        if self.entry.length is not None:
+        profiler = self.profiler
+        frame = _Frame(self, data, context, name, None, None, None, select)
+        # The frames of the entries whose children are being decoded.
+        stack = []
+        # The frames of the trial decodes in progress, innermost last.
+        trials = []
+        sent = None
+        while 1:
             try:
-                data = data.pop(self.entry.length.evaluate(context))
-            except dt.DataError, ex:
-                raise EntryDataError(self.entry, ex)
-
-        # Do the actual decode of this entry (and all child entries).
-        length = 0
-        for is_starting, name, entry, entry_data, value in self._decode(data, context, name):
-            if not is_starting:
-                length += len(entry_data)
-            if not is_starting and entry is self.entry:
-                for constraint in self.entry.constraints:
-                    constraint.check(self.entry, value, context)
-            yield is_starting, name, entry, entry_data, value
-
-        context['should end'] = self._is_end_sequenceof | context.get('should end', False)
-        if self._is_value_referenced:
-            # The last entry to decode will be 'self', so 'value' will be ours.
-            context[self.entry.name] = int(value)
-        if self._is_length_referenced:
-            context[self.entry.name + ' length'] = length
-        if self.entry.length is not None and len(data) != 0:
-            raise DecodeLengthError(self.entry, data)
-
-    def _decode_child(self, child, data, context):
-        """
-        Decode a child entry.
-
-        Creates a new context for the child, and after the decode completes,
-        will update this entry's context.
-        """
-        assert isinstance(child, Child)
-
-        # Create the childs context from our data
-        child_context = {}
-        for our_name, child_name in child.inputs:
-            child_context[child_name] = context[our_name]
+                try:
+                    if profiler is None:
+                        item = frame.items.send(sent)
+                    else:
+                        start = default_timer()
+                        try:
+                            item = frame.items.send(sent)
+                        finally:
+                            frame.self_time += default_timer() - start
+                except StopIteration:
+                    # The entry has been decoded; update the contexts and
+                    # return to the parent entry.
+                    frame.finish()
+                    if not stack:
+                        if profiler is not None:
+                            _record(profiler, frame, None)
+                        return
+                    parent = stack.pop()
+                    if profiler is not None:
+                        _record(profiler, frame, parent)
+                    frame.return_to(parent)
+                    sent = frame.trial
+                    if sent is not None:
+                        trials.pop()
+                    frame = parent
+                    continue
 
-        # Do the decode
-        for result in child.decoder.decode(data, child_context, child.name):
-            yield result
+                sent = None
+                if type(item) is tuple:
+                    if not item[0]:
+                        frame.length += len(item[3])
+                        if item[2] is frame.entry:
+                            frame.value = item[4]
+                            for constraint in frame.entry.constraints:
+                                constraint.check(frame.entry, item[4],
+                                        frame.decoder.constraint_context(frame.context))
+                    if trials:
+                        trials[-1].trial.add(item, frame.select is not False)
+                    elif frame.select is not False:
+                        yield item
+                elif item.__class__ is Child:
+                    # Decode a child entry with our data.
+                    if trials:
+                        child_frame = frame.start_child(item, trials[-1].trial)
+                    else:
+                        child_frame = frame.start_child(item, None)
+                    if child_frame is not None:
+                        stack.append(frame)
+                        frame = child_frame
+                elif item.__class__ is Replay:
+                    trial = item.trial
+                    if trials:
+                        frame.length += trial.length
+                        trials[-1].trial.add_choice(trial)
+                        trials[-1].trial.add_replay(trial)
+                    elif trial.events is not None:
+                        frame.length += trial.length
+                        for event in trial:
+                            yield event
+                    else:
+                        # There were too many events to buffer; decode the
+                        # child again, using the options chosen in the trial.
+                        item.decoded = True
+                        child_frame = frame.start_child(trial.child, None,
+                                trial.choices())
+                        if child_frame is not None:
+                            stack.append(frame)
+                            frame = child_frame
+                elif item.__class__ is Decision:
+                    if frame.choices is not None:
+                        item.child = next(frame.choices, None)
+                    sent = item
+                else:
+                    # Trial decode a child entry.
+                    child_frame = frame.start_trial(item)
+                    if child_frame is None:
+                        sent = item
+                    else:
+                        stack.append(frame)
+                        frame = child_frame
+                        trials.append(frame)
+            except bdec.DecodeError, ex:
+                if not trials:
+                    if profiler is not None:
+                        _record_stack(profiler, frame, stack)
+                    raise
 
-        # Update our context with the output values from the childs context
-        for our_name, child_name in child.outputs:
-            context[our_name] = child_context[child_name]
+                # Send the error to the entry that requested the innermost
+                # trial decode.
+                frame, sent = _unwind_trial(profiler, frame, stack, trials, ex)
 
     def __str__(self):
         return str(self.entry)
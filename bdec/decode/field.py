@@ -16,23 +16,117 @@
 #   License along with this library; if not, see
 #   <http://www.gnu.org/licenses/>.
 
+import struct
+
 import bdec.data as dt
-from bdec.field import FieldDataError
+from bdec.field import Field, FieldDataError, _BinaryData, _HexData
 from bdec.decode.entry import EntryDecoder
 
 class FieldDecoder(EntryDecoder):
     """ An instance to decode field entries to python objects. """
+    def __init__(self, *args, **kwargs):
+        EntryDecoder.__init__(self, *args, **kwargs)
+        # Binary and hex fields decode any data of the right length, so
+        # skipping them doesn't change the result of a trial decode.
+        self._is_skippable_in_trial = self._is_skippable and \
+                self.entry.format in [Field.BINARY, Field.HEX]
+        # The data of the field's length has already been popped when
+        # decoding, and the field decodes all of it.
+        self._check_length = False
+        # The length of the field if it is constant.
+        self._width = None
+
+    def compile(self):
+        EntryDecoder.compile(self)
+        try:
+            self._width = self.entry.length.evaluate({})
+        except Exception:
+            # The length references other entries.
+            pass
+
+    def _convert(self, data):
+        """Convert the field's data to a python object."""
+        return self.entry.decode_value(data)
 
     def _decode(self, data, context, name):
         """ see bdec.entry.Entry._decode """
+        # The data is the data of the field's length (see _Frame).
         yield (True, name, self.entry, data, None)
 
-        field_data = data.pop(self.entry.length.evaluate(context))
         # As this popped data is not guaranteed to be available, we have to
         # wrap all access to it in an exception handler.
         try:
-            value = self.entry.decode_value(field_data)
+            value = self._convert(data)
         except dt.DataError, ex:
             raise FieldDataError(self.entry, ex)
 
-        yield (False, name, self.entry, field_data, value)
+        yield (False, name, self.entry, data, value)
+
+
+class BinaryDecoder(FieldDecoder):
+    def _convert(self, data):
+        return data.copy(klass=_BinaryData)
+
+class HexDecoder(FieldDecoder):
+    def _convert(self, data):
+        return data.copy(klass=_HexData)
+
+class BigEndianIntegerDecoder(FieldDecoder):
+    def _convert(self, data):
+        return int(data)
+
+class LittleEndianIntegerDecoder(FieldDecoder):
+    def _convert(self, data):
+        return data.get_little_endian_integer()
+
+class TextDecoder(FieldDecoder):
+    def __init__(self, *args, **kwargs):
+        FieldDecoder.__init__(self, *args, **kwargs)
+        self._encoding = self.entry.encoding
+
+    def _convert(self, data):
+        return data.text(self._encoding)
+
+class FloatDecoder(FieldDecoder):
+    def __init__(self, *args, **kwargs):
+        FieldDecoder.__init__(self, *args, **kwargs)
+        self._unpack = None
+
+    def compile(self):
+        FieldDecoder.compile(self)
+        # Floats of other lengths are converted by the field (which raises a
+        # FloatLengthError).
+        if self._width in (32, 64):
+            endian = '<' if self.entry.encoding == Field.LITTLE_ENDIAN else '>'
+            format = 'f' if self._width == 32 else 'd'
+            self._unpack = struct.Struct(endian + format).unpack
+
+    def _convert(self, data):
+        if self._unpack is None:
+            return self.entry.decode_value(data)
+        return self._unpack(data.bytes())[0]
+
+
+def create_field_decoder(entry, *args):
+    """Create the decoder for a field, specialised for the field's format.
+
+    The arguments are the same as for EntryDecoder."""
+    if 'decode_value' in entry.__dict__:
+        # The field's conversion has been overridden.
+        return FieldDecoder(entry, *args)
+    if entry.format == Field.BINARY:
+        klass = BinaryDecoder
+    elif entry.format == Field.HEX:
+        klass = HexDecoder
+    elif entry.format == Field.TEXT:
+        klass = TextDecoder
+    elif entry.format == Field.INTEGER:
+        if entry.encoding == Field.LITTLE_ENDIAN:
+            klass = LittleEndianIntegerDecoder
+        else:
+            klass = BigEndianIntegerDecoder
+    elif entry.format == Field.FLOAT:
+        klass = FloatDecoder
+    else:
+        klass = FieldDecoder
+    return klass(entry, *args)
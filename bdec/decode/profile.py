@@ -0,0 +1,127 @@
+#   Copyright (C) 2010 Henry Ludemann
+#   Copyright (C) 2010 PRESENSE Technologies GmbH
+#
+#   This file is part of the bdec decoder library.
+#
+#   The bdec decoder library is free software; you can redistribute it
+#   and/or modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 2.1 of the License, or (at your option) any later version.
+#
+#   The bdec decoder library is distributed in the hope that it will be
+#   useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public
+#   License along with this library; if not, see
+#   <http://www.gnu.org/licenses/>.
+
+"""
+Record the cost of decoding each entry in a specification.
+
+Usage:
+
+    profiler = Profiler()
+    decoder = bdec.decode.Decoder(spec, profiler)
+    for event in decoder.decode(data):
+        pass
+    profiler.write_table(sys.stdout)
+"""
+
+import json
+
+class EntryStats:
+    """The decode statistics for a single entry."""
+    def __init__(self, entry):
+        self.entry = entry
+        self.calls = 0
+        # The time spent decoding the entry, including its children.
+        self.cumulative_time = 0.0
+        # The time spent decoding the entry, excluding its children.
+        self.self_time = 0.0
+        # The number of bits decoded by the entry (including its children).
+        self.bits = 0
+        # The number of choice options that were trial decoded, and how many
+        # of those trials failed.
+        self.trials = 0
+        self.backtracks = 0
+
+
+class Profiler:
+    """Collect decode statistics for entries.
+
+    The profiler is passed to bdec.decode.Decoder, which calls 'record' for
+    every entry that is decoded.
+    """
+    def __init__(self):
+        self._stats = {}
+
+    def _get_stats(self, entry):
+        try:
+            return self._stats[entry]
+        except KeyError:
+            stats = EntryStats(entry)
+            self._stats[entry] = stats
+            return stats
+
+    def record(self, entry, cumulative_time, self_time, bits):
+        """Record the decode of an entry.
+
+        entry -- The entry that was decoded.
+        cumulative_time -- The time spent decoding the entry and its children.
+        self_time -- The time spent decoding the entry, excluding its children.
+        bits -- The number of bits decoded by the entry and its children.
+        """
+        stats = self._get_stats(entry)
+        stats.calls += 1
+        stats.cumulative_time += cumulative_time
+        stats.self_time += self_time
+        stats.bits += bits
+
+    def trial(self, entry, is_successful):
+        """Record the trial decode of a choice option."""
+        stats = self._get_stats(entry)
+        stats.trials += 1
+        if not is_successful:
+            stats.backtracks += 1
+
+    def stats(self):
+        """Return a list of EntryStats, sorted by the time spent in each entry."""
+        result = self._stats.values()
+        result.sort(key=lambda stats: (stats.self_time, stats.cumulative_time), reverse=True)
+        return result
+
+    def write_table(self, output):
+        """Write the statistics to a file as a table."""
+        output.write('%8s %10s %10s %12s %8s %10s  %s\n' % ('calls',
+            'cumtime', 'selftime', 'bits', 'trials', 'backtracks', 'entry'))
+        for stats in self.stats():
+            output.write('%8i %10.4f %10.4f %12i %8i %10i  %s\n' % (stats.calls,
+                stats.cumulative_time, stats.self_time, stats.bits,
+                stats.trials, stats.backtracks, stats.entry))
+
+    def write_json(self, output, lookup={}):
+        """Write the statistics to a file in json.
+
+        output -- The file to write to.
+        lookup -- A dictionary of entries to (filename, line, column) tuples,
+            as returned by bdec.spec.load_specs.
+        """
+        entries = []
+        for stats in self.stats():
+            item = {
+                    'name' : stats.entry.name,
+                    'type' : stats.entry.__class__.__name__.lower(),
+                    'calls' : stats.calls,
+                    'cumulative_time' : stats.cumulative_time,
+                    'self_time' : stats.self_time,
+                    'bits' : stats.bits,
+                    'trials' : stats.trials,
+                    'backtracks' : stats.backtracks,
+                    }
+            if stats.entry in lookup:
+                item['filename'], item['line'], item['column'] = lookup[stats.entry]
+            entries.append(item)
+        json.dump({'entries' : entries}, output, indent=2)
+        output.write('\n')
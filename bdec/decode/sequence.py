@@ -18,15 +18,230 @@
 
 import bdec.data as dt
 from bdec.decode.entry import EntryDecoder
+from bdec.decode.field import FieldDecoder
+from bdec.expression import UndecodedReferenceError
+from bdec.field import Field, FieldDataError
+from bdec.entry import EntryDataError
+
+# The kinds of steps in a static layout.
+_START, _END, _FIELD = range(3)
+
+class _Step:
+    """An entry to decode at a fixed offset of a static layout."""
+    def __init__(self, kind, name, decoder, child, offset, width):
+        self.kind = kind
+        self.name = name
+        self.decoder = decoder
+        self.entry = decoder.entry
+        # The (parent slot, child slot) outputs of the child, or None if it
+        # doesn't have any.
+        self.outputs = None
+        if child is not None and child.outputs:
+            self.outputs = child.output_slots
+        self.offset = offset
+        self.width = width
+        self.constraints = self.entry.constraints
+        # Set for big endian integers that are read from one of the layout's
+        # blocks.
+        self.block = None
+        self.shift = None
+        self.mask = None
+
+def _constant(expression):
+    """Evaluate an expression that doesn't reference other entries.
+
+    Returns None if the expression isn't constant."""
+    try:
+        return expression.evaluate({})
+    except UndecodedReferenceError:
+        return None
+
+def _add_steps(decoder, name, child, offset, steps, parents):
+    """Add the steps to decode an entry with a fixed length and layout.
+
+    parents -- The decoders of the sequences containing the entry.
+    Returns the offset after the entry, or None if it doesn't have a static
+    layout."""
+    entry = decoder.entry
+    if decoder._inputs or decoder in parents:
+        return None
+    if isinstance(decoder, FieldDecoder):
+        length = _constant(entry.length)
+        if length is None:
+            return None
+        for constraint in entry.constraints:
+            if _constant(constraint.limit) is None:
+                return None
+        steps.append(_Step(_FIELD, name, decoder, child, offset, length))
+        return offset + length
+    elif decoder.__class__ is SequenceDecoder:
+        if entry.value is not None or entry.constraints or \
+                decoder._is_value_referenced:
+            return None
+        start = _Step(_START, name, decoder, child, offset, None)
+        steps.append(start)
+        end = offset
+        parents.add(decoder)
+        for item in decoder.children:
+            end = _add_steps(item.decoder, item.name, item, end, steps, parents)
+            if end is None:
+                return None
+        parents.remove(decoder)
+        if entry.length is not None and _constant(entry.length) != end - offset:
+            return None
+        start.width = end - offset
+        steps.append(_Step(_END, name, decoder, child, offset, end - offset))
+        return end
+    return None
+
 
 class SequenceDecoder (EntryDecoder):
+    def __init__(self, *args, **kwargs):
+        EntryDecoder.__init__(self, *args, **kwargs)
+        # The steps to decode the sequence if it has a fixed layout (see
+        # compile_layout).
+        self._layout = None
+        self._value = None
+        # The (start, end) ranges of the layout holding runs of adjacent big
+        # endian integers.
+        self._blocks = []
+
+    def compile(self):
+        EntryDecoder.compile(self)
+        if self.entry.value is not None:
+            self._value = self.entry.value.compile(self._slots)
+
+    def compile_layout(self):
+        """Detect if the sequence has a fixed layout.
+
+        A sequence whose children are fields and sequences with constant
+        lengths (that don't reference other entries) is always decoded in the
+        same way. Such sequences are decoded in one pass over a precomputed
+        list of the offsets and widths of every child, and each run of
+        adjacent big endian integers is extracted from a single read of the
+        sequence's data.
+
+        Must be called after the decoders of all child entries have been
+        constructed."""
+        steps = []
+        if _add_steps(self, None, None, 0, steps, set()) is None:
+            return
+        fields = [step for step in steps if step.kind == _FIELD]
+        if not fields:
+            return
+        # The blocks are split at other fields, so the integers read don't
+        # grow with the size of the data between them.
+        run = []
+        for step in fields:
+            if step.entry.format == Field.INTEGER and \
+                    step.entry.encoding != Field.LITTLE_ENDIAN:
+                run.append(step)
+            else:
+                self._add_block(run)
+                run = []
+        self._add_block(run)
+        # The first and last steps are for this sequence; they are emitted
+        # using the name we are decoded with.
+        self._layout = steps[1:-1]
+
+    def _add_block(self, integers):
+        """Read a run of adjacent big endian integers as a single integer."""
+        if not integers:
+            return
+        start = integers[0].offset
+        end = integers[-1].offset + integers[-1].width
+        for step in integers:
+            step.block = len(self._blocks)
+            step.shift = end - step.offset - step.width
+            step.mask = (1 << step.width) - 1
+        self._blocks.append((start, end))
 
     def _decode(self, data, context, name):
+        if self._layout is not None:
+            return self._decode_layout(data, context, name)
+        return self._decode_children(data, context, name)
+
+    def _decode_selected(self, data, context, name):
+        # Decode the children one at a time, so the unselected children can
+        # be skipped.
+        return self._decode_children(data, context, name)
+
+    def _decode_children(self, data, context, name):
         yield (True, name, self.entry, data, None)
         for child in self.children:
-            for embedded in self._decode_child(child, data, context):
-                yield embedded
+            yield child
         value = None
-        if self.entry.value is not None:
-            value = self.entry.value.evaluate(context)
+        if self._value is not None:
+            value = self._value(context)
         yield (False, name, self.entry, dt.Data(), value)
+
+    def _decode_layout(self, data, context, name):
+        # Read each run of big endian integers in one go. If the data isn't
+        # available, the remaining integers are read one at a time (so the
+        # error is reported for the same entry as when decoding the
+        # children).
+        blocks = []
+        if self._blocks:
+            try:
+                copy = data.copy()
+                offset = 0
+                for start, end in self._blocks:
+                    copy.pop(start - offset)
+                    blocks.append(int(copy.pop(end - start)))
+                    offset = end
+            except dt.DataError:
+                pass
+
+        yield (True, name, self.entry, data, None)
+        # The contexts of the sequences being decoded, so entries that are
+        # referenced outside of the sequence can be stored.
+        contexts = [context]
+        for step in self._layout:
+            kind = step.kind
+            if kind == _FIELD:
+                entry = step.entry
+                try:
+                    field_data = data.pop(step.width)
+                except dt.DataError, ex:
+                    raise EntryDataError(entry, ex)
+                yield (True, step.name, entry, field_data, None)
+                if step.block is not None and step.block < len(blocks):
+                    value = (blocks[step.block] >> step.shift) & step.mask
+                else:
+                    try:
+                        value = step.decoder._convert(field_data)
+                    except dt.DataError, ex:
+                        raise FieldDataError(entry, ex)
+                for constraint in step.constraints:
+                    constraint.check(entry, value, {})
+                if step.outputs is not None:
+                    self._finish_step(step, list(step.decoder._empty_context),
+                            value, contexts[-1])
+                yield (False, step.name, entry, field_data, value)
+            elif kind == _START:
+                start_data = data
+                if step.entry.length is not None:
+                    try:
+                        start_data = data.copy().pop(step.width)
+                    except dt.DataError, ex:
+                        raise EntryDataError(step.entry, ex)
+                yield (True, step.name, step.entry, start_data, None)
+                contexts.append(list(step.decoder._empty_context))
+            else:
+                child_context = contexts.pop()
+                if step.outputs is not None:
+                    self._finish_step(step, child_context, None, contexts[-1])
+                yield (False, step.name, step.entry, dt.Data(), None)
+        yield (False, name, self.entry, dt.Data(), None)
+
+    def _finish_step(self, step, child_context, value, parent_context):
+        """Pass the outputs of a decoded step to its parent."""
+        decoder = step.decoder
+        slot = decoder._should_end_slot
+        child_context[slot] = decoder._is_end_sequenceof | (child_context[slot] is True)
+        if decoder._is_value_referenced:
+            child_context[decoder._value_slot] = int(value)
+        if decoder._is_length_referenced:
+            child_context[decoder._length_slot] = step.width
+        for our_slot, child_slot in step.outputs:
+            parent_context[our_slot] = child_context[child_slot]
@@ -24,30 +24,63 @@ from bdec.sequenceof import SequenceEndedEarlyError, NegativeSequenceofLoop, \
 class SequenceOfDecoder(EntryDecoder):
 
     def _loop(self, context, data):
-        context['should end'] = False
-        if self.entry.count is not None:
+        should_end = self._should_end_slot
+        context[should_end] = False
+        if self._count is not None:
             # We have a count of items; use that to determine how long we
             # should continue looping for.
-            count = int(self.entry.count.evaluate(context))
+            count = int(self._count(context))
             if count < 0:
                 raise NegativeSequenceofLoop(self.entry, count)
 
             for i in xrange(count):
                 yield None
         elif self.entry.end_entries:
-            while not context['should end']:
+            while not context[should_end]:
                 yield None
         else:
             while data:
                 yield None
 
+    def __init__(self, *args, **kwargs):
+        EntryDecoder.__init__(self, *args, **kwargs)
+        self._count = None
+        # If not None, a bdec.decode.arrays.ArrayLayout used to decode the
+        # items to a numpy array.
+        self._array = None
+
+    def compile(self):
+        EntryDecoder.compile(self)
+        if self.entry.count is not None:
+            self._count = self.entry.count.compile(self._slots)
+
     def _decode(self, data, context, name):
+        if self._array is not None:
+            return self._decode_array(data, context, name)
+        return self._decode_children(data, context, name)
+
+    def _decode_selected(self, data, context, name):
+        return self._decode_children(data, context, name)
+
+    def _decode_array(self, data, context, name):
+        result = self._array.decode(data, context)
+        if result is None:
+            # The items cannot be decoded as an array; decode them one at a
+            # time.
+            for item in self._decode_children(data, context, name):
+                yield item
+            return
+        length, values = result
         yield (True, name, self.entry, data, None)
+        yield (False, name, self.entry, data.pop(length), values)
+
+    def _decode_children(self, data, context, name):
+        yield (True, name, self.entry, data, None)
+        should_end = self._should_end_slot
         for i in self._loop(context, data):
-            if self.entry.end_entries and context['should end']:
+            if self.entry.end_entries and context[should_end]:
                 raise SequenceEndedEarlyError(self.entry)
-            for item in self._decode_child(self.children[0], data, context):
-                yield item
-        if self.entry.end_entries and not context['should end']:
+            yield self.children[0]
+        if self.entry.end_entries and not context[should_end]:
             raise SequenceofStoppedBeforeEndEntry(self.entry)
         yield (False, name, self.entry, dt.Data(), None)
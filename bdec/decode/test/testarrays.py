@@ -0,0 +1,112 @@
+#   Copyright (C) 2010 Henry Ludemann
+#
+#   This file is part of the bdec decoder library.
+#
+#   The bdec decoder library is free software; you can redistribute it
+#   and/or modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 2.1 of the License, or (at your option) any later version.
+#
+#   The bdec decoder library is distributed in the hope that it will be
+#   useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public
+#   License along with this library; if not, see
+#   <http://www.gnu.org/licenses/>.
+
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+import bdec
+from bdec.constraints import ConstraintError, Maximum
+import bdec.data as dt
+from bdec.decode import Decoder
+from bdec.decode.profile import Profiler
+from bdec.expression import Constant, ValueResult
+import bdec.field as fld
+import bdec.output.instance as inst
+import bdec.sequence as seq
+import bdec.sequenceof as sof
+
+@unittest.skipIf(numpy is None, 'numpy is not installed')
+class TestArrays(unittest.TestCase):
+    def _decode(self, entry, data):
+        data = dt.Data(data)
+        result = list(Decoder(entry, arrays=True).decode(data))
+        self.assertEqual(0, len(data))
+        return result
+
+    def _error(self, entry, data, arrays):
+        try:
+            list(Decoder(entry, arrays=arrays).decode(dt.Data(data)))
+        except bdec.DecodeError, ex:
+            return ex
+        self.fail('Decoding should have failed!')
+
+    def test_field_items(self):
+        a = sof.SequenceOf('a', fld.Field('b', 16, format=fld.Field.INTEGER), 3)
+        events = self._decode(a, '\x00\x01\x00\x02\x01\x00')
+        self.assertEqual(2, len(events))
+        is_starting, name, entry, data, value = events[1]
+        self.assertEqual(48, len(data))
+        self.assertEqual([1, 2, 256], list(value))
+
+    def test_record_items(self):
+        # Hidden fields are decoded, but not included in the array.
+        item = seq.Sequence('item', [
+            fld.Field('b', 8, format=fld.Field.INTEGER),
+            fld.Field('c:', 8, format=fld.Field.INTEGER),
+            fld.Field('d e', 16, format=fld.Field.INTEGER, encoding=fld.Field.LITTLE_ENDIAN)])
+        a = seq.Sequence('a', [
+            fld.Field('count', 8, format=fld.Field.INTEGER),
+            sof.SequenceOf('items', item, ValueResult('count'))])
+        value = inst.decode(a, dt.Data('\x02\x01x\x02\x00\x03y\x00\x01'), arrays=True)
+        self.assertEqual(('b', 'd_e'), value.items.dtype.names)
+        self.assertEqual([1, 3], list(value.items['b']))
+        self.assertEqual([2, 256], list(value.items['d_e']))
+
+    def test_greedy_items(self):
+        a = sof.SequenceOf('a', fld.Field('b', 8, format=fld.Field.INTEGER),
+                None, length=Constant(24))
+        value = inst.decode(a, dt.Data('\x01\x02\x03'), arrays=True)
+        self.assertEqual([1, 2, 3], list(value))
+
+    def test_constraint_error(self):
+        item = seq.Sequence('item', [
+            fld.Field('b', 8, format=fld.Field.INTEGER, constraints=[Maximum(5)]),
+            fld.Field('c', 8, format=fld.Field.INTEGER, constraints=[Maximum(5)])])
+        a = sof.SequenceOf('a', item, 3)
+        expected = self._error(a, '\x01\x02\x03\x07\x08\x01', False)
+        actual = self._error(a, '\x01\x02\x03\x07\x08\x01', True)
+        self.assertTrue(isinstance(actual, ConstraintError))
+        self.assertEqual(str(expected), str(actual))
+
+    def test_not_enough_data(self):
+        # When there isn't enough data the items are decoded one at a time.
+        a = sof.SequenceOf('a', fld.Field('b', 16, format=fld.Field.INTEGER), 3)
+        expected = self._error(a, '\x00\x01\x00', False)
+        actual = self._error(a, '\x00\x01\x00', True)
+        self.assertEqual(str(expected), str(actual))
+
+    def test_unsupported_items(self):
+        a = sof.SequenceOf('a', fld.Field('b', 4, format=fld.Field.INTEGER), 2)
+        events = self._decode(a, '\x12')
+        self.assertEqual(6, len(events))
+
+    def test_entry_decoders_are_cached(self):
+        a = sof.SequenceOf('a', fld.Field('b', 8, format=fld.Field.INTEGER), 2)
+        events = list(a.decode(dt.Data('\x01\x02'), arrays=True))
+        self.assertEqual([1, 2], list(events[-1][4]))
+        self.assertEqual(6, len(list(a.decode(dt.Data('\x01\x02')))))
+        self.assertEqual([1, 2], list(inst.decode(a, dt.Data('\x01\x02'), arrays=True)))
+        self.assertEqual(2, len(a._decoders))
+
+    def test_profiled_arrays(self):
+        a = sof.SequenceOf('a', fld.Field('b', 8, format=fld.Field.INTEGER), 2)
+        self.assertRaises(ValueError, Decoder, a, Profiler(), arrays=True)
@@ -0,0 +1,210 @@
+#   Copyright (C) 2010 Henry Ludemann
+#
+#   This file is part of the bdec decoder library.
+#
+#   The bdec decoder library is free software; you can redistribute it
+#   and/or modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 2.1 of the License, or (at your option) any later version.
+#
+#   The bdec decoder library is distributed in the hope that it will be
+#   useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public
+#   License along with this library; if not, see
+#   <http://www.gnu.org/licenses/>.
+
+import tempfile
+import unittest
+
+import bdec
+import bdec.choice as chc
+from bdec.constraints import ConstraintError, Equals, Maximum
+import bdec.data as dt
+from bdec.decode import Decoder, UnknownSelectionError
+import bdec.decode.field as fdec
+from bdec.decode.profile import Profiler
+from bdec.entry import EntryDataError
+from bdec.expression import Constant, ValueResult
+import bdec.field as fld
+import bdec.sequence as seq
+import bdec.sequenceof as sof
+
+class TestSelect(unittest.TestCase):
+    def _decode(self, entry, data, select):
+        data = dt.Data(data)
+        result = [(is_starting, entry.name, value) for is_starting, name, entry, entry_data, value
+                in Decoder(entry, select=select).decode(data)]
+        self.assertEqual(0, len(data))
+        return result
+
+    def _unconverted_field(self, name, length):
+        # Create a field that fails if its value is decoded.
+        field = fld.Field(name, length, format=fld.Field.HEX)
+        def decode_value(data):
+            raise Exception('%s should have been skipped!' % name)
+        field.decode_value = decode_value
+        return field
+
+    def test_select_field(self):
+        a = seq.Sequence('a', [
+            fld.Field('length', 8, format=fld.Field.INTEGER),
+            self._unconverted_field('data', ValueResult('length') * Constant(8)),
+            seq.Sequence('b', [fld.Field('c', 8, format=fld.Field.INTEGER),
+                self._unconverted_field('d', 8)])])
+        result = self._decode(a, '\x02xy\x07w', ['a.b.c'])
+        self.assertEqual([(True, 'a', None), (True, 'b', None), (True, 'c', None),
+            (False, 'c', 7), (False, 'b', None), (False, 'a', None)], result)
+
+    def test_select_entry_and_children(self):
+        a = seq.Sequence('a', [
+            self._unconverted_field('b', 8),
+            seq.Sequence('c', [fld.Field('d', 8, format=fld.Field.INTEGER)])])
+        result = self._decode(a, 'x\x07', ['a.c'])
+        self.assertEqual([(True, 'a', None), (True, 'c', None), (True, 'd', None),
+            (False, 'd', 7), (False, 'c', None), (False, 'a', None)], result)
+
+    def test_select_everything(self):
+        a = seq.Sequence('a', [fld.Field('b', 8, format=fld.Field.INTEGER)])
+        result = self._decode(a, '\x07', ['a.b', 'a'])
+        self.assertEqual(4, len(result))
+
+    def test_select_in_choice(self):
+        # The options of the choice must be trial decoded, so only the
+        # selected entries should be replayed.
+        def option(name, tag):
+            return seq.Sequence(name, [
+                self._unconverted_field('%s data' % name, 8),
+                fld.Field('%s tag' % name, 8, format=fld.Field.INTEGER, constraints=[Equals(tag)])])
+        a = sof.SequenceOf('a', chc.Choice('b', [option('c', 1), option('d', 2)]), 2)
+        result = self._decode(a, 'x\x02y\x01', ['a.b.c.c tag'])
+        self.assertEqual([(True, 'a', None), (True, 'b', None), (False, 'b', None), (True, 'b', None),
+            (True, 'c', None), (True, 'c tag', None), (False, 'c tag', 1),
+            (False, 'c', None), (False, 'b', None), (False, 'a', None)], result)
+
+    def test_skipped_entry_truncated(self):
+        # Skipping an entry mustn't hide that the data is truncated.
+        a = seq.Sequence('a', [fld.Field('b', 8, format=fld.Field.INTEGER),
+            fld.Field('c', 32, format=fld.Field.HEX)])
+        decoder = Decoder(a, select=['a.b'])
+        self.assertRaises(EntryDataError, list, decoder.decode(dt.Data('\x05\x01')))
+
+        datafile = tempfile.TemporaryFile()
+        try:
+            datafile.write('\x05\x01')
+            datafile.seek(0)
+            self.assertRaises(EntryDataError, list, decoder.decode(dt.Data(datafile)))
+        finally:
+            datafile.close()
+
+    def test_unknown_selection(self):
+        a = seq.Sequence('a', [fld.Field('b', 8)])
+        self.assertRaises(UnknownSelectionError, Decoder, a, None, ['a.c'])
+        self.assertRaises(UnknownSelectionError, Decoder, a, None, ['b'])
+
+
+class TestContext(unittest.TestCase):
+    def test_referenced_constraint(self):
+        # Constraints that reference other entries are checked with the
+        # values in the context slots.
+        a = seq.Sequence('a', [
+            fld.Field('length', 8, format=fld.Field.INTEGER),
+            fld.Field('b', ValueResult('length'), format=fld.Field.INTEGER),
+            fld.Field('c', 8, format=fld.Field.INTEGER, constraints=[Equals(ValueResult('b'))])])
+        events = list(Decoder(a).decode(dt.Data('\x08\x07\x07')))
+        self.assertEqual([8, 7, 7], [value for is_starting, name, entry, data, value in events
+            if not is_starting and entry is not a])
+        self.assertRaises(ConstraintError, list, Decoder(a).decode(dt.Data('\x08\x07\x08')))
+
+class TestFieldDecoders(unittest.TestCase):
+    def _check(self, klass, length, format, encoding, data):
+        field = fld.Field('a', length, format, encoding)
+        decoder = Decoder(field)
+        self.assertEqual(klass, decoder._decoder.__class__)
+        events = list(decoder.decode(dt.Data(data)))
+        self.assertEqual(field.decode_value(dt.Data(data).pop(length)), events[-1][4])
+
+    def test_formats(self):
+        self._check(fdec.BinaryDecoder, 12, fld.Field.BINARY, '', 'ab')
+        self._check(fdec.HexDecoder, 16, fld.Field.HEX, '', 'ab')
+        self._check(fdec.BigEndianIntegerDecoder, 16, fld.Field.INTEGER, fld.Field.BIG_ENDIAN, 'ab')
+        self._check(fdec.LittleEndianIntegerDecoder, 16, fld.Field.INTEGER, fld.Field.LITTLE_ENDIAN, 'ab')
+        self._check(fdec.TextDecoder, 16, fld.Field.TEXT, 'ascii', 'ab')
+        self._check(fdec.FloatDecoder, 32, fld.Field.FLOAT, fld.Field.BIG_ENDIAN, 'abcd')
+        self._check(fdec.FloatDecoder, 64, fld.Field.FLOAT, fld.Field.LITTLE_ENDIAN, 'abcdefgh')
+
+    def test_errors(self):
+        field = fld.Field('a', 16, fld.Field.FLOAT)
+        self.assertRaises(fld.FieldDataError, list, Decoder(field).decode(dt.Data('ab')))
+        field = fld.Field('a', 16, fld.Field.TEXT, 'ascii')
+        self.assertRaises(fld.FieldDataError, list, Decoder(field).decode(dt.Data('\xff\xff')))
+
+class TestLayout(unittest.TestCase):
+    def _events(self, decoder, data):
+        result = []
+        try:
+            for is_starting, name, entry, entry_data, value in decoder.decode(dt.Data(data)):
+                if isinstance(value, dt.Data):
+                    value = str(value)
+                result.append((is_starting, name, len(entry_data), value))
+        except bdec.DecodeError, ex:
+            result.append((ex.__class__, ex.entry.name))
+        return result
+
+    def _decode(self, entry, data):
+        # Sequences aren't decoded with their layout when profiling, so the
+        # events should match those decoded one entry at a time.
+        decoder = Decoder(entry)
+        result = self._events(decoder, data)
+        self.assertEqual(self._events(Decoder(entry, Profiler()), data), result)
+        return decoder, result
+
+    def test_fixed_sequence(self):
+        a = seq.Sequence('a', [
+            fld.Field('b', 4, format=fld.Field.INTEGER),
+            seq.Sequence('c', [
+                fld.Field('d', 12, format=fld.Field.INTEGER),
+                fld.Field('e', 16, format=fld.Field.INTEGER, encoding=fld.Field.LITTLE_ENDIAN),
+                fld.Field('f', 8, format=fld.Field.TEXT)], length=Constant(36)),
+            fld.Field('g', 4, format=fld.Field.HEX),
+            fld.Field('h', 8, format=fld.Field.INTEGER, constraints=[Maximum(200)])])
+        decoder, result = self._decode(a, '\x12\x34\x01\x02x\xf7\x08')
+        self.assertTrue(decoder._decoder._layout is not None)
+        self.assertEqual([(True, 'a', 56, None), (True, 'b', 4, None), (False, 'b', 4, 1),
+            (True, 'c', 36, None), (True, 'd', 12, None), (False, 'd', 12, 0x234),
+            (True, 'e', 16, None), (False, 'e', 16, 0x201),
+            (True, 'f', 8, None), (False, 'f', 8, u'x'), (False, 'c', 0, None),
+            (True, 'g', 4, None), (False, 'g', 4, 'f'),
+            (True, 'h', 8, None), (False, 'h', 8, 0x70), (False, 'a', 0, None)], result)
+
+    def test_integer_blocks(self):
+        # Integers separated by other fields are read in separate blocks.
+        a = seq.Sequence('a', [
+            fld.Field('b', 8, format=fld.Field.INTEGER),
+            fld.Field('c', 8, format=fld.Field.INTEGER),
+            fld.Field('d', 80, format=fld.Field.TEXT),
+            fld.Field('e', 16, format=fld.Field.INTEGER)])
+        decoder, result = self._decode(a, '\x01\x02abcdefghij\x03\x04')
+        self.assertEqual([(0, 16), (96, 112)], decoder._decoder._blocks)
+        self.assertEqual((False, 'c', 8, 2), result[4])
+        self.assertEqual((False, 'e', 16, 0x304), result[-2])
+
+    def test_layout_errors(self):
+        a = seq.Sequence('a', [
+            fld.Field('b', 8, format=fld.Field.INTEGER),
+            fld.Field('c', 8, format=fld.Field.INTEGER, constraints=[Equals(7)]),
+            fld.Field('d', 16, format=fld.Field.INTEGER)])
+        decoder, result = self._decode(a, '\x01\x08\x00\x00')
+        self.assertEqual((ConstraintError, 'c'), result[-1])
+        decoder, result = self._decode(a, '\x01\x07\x00')
+        self.assertEqual(6, len(result))
+
+    def test_referenced_value(self):
+        header = seq.Sequence('header', [fld.Field('length', 8, format=fld.Field.INTEGER),
+            fld.Field('type', 8, format=fld.Field.TEXT)])
+        a = seq.Sequence('a', [header,
+            fld.Field('data', ValueResult('header.length') * Constant(8), format=fld.Field.TEXT)])
+        decoder, result = self._decode(a, '\x02xab')
+        self.assertEqual((False, 'data', 16, 'ab'), result[-2])
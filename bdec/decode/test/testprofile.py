@@ -0,0 +1,81 @@
+#   Copyright (C) 2010 Henry Ludemann
+#
+#   This file is part of the bdec decoder library.
+#
+#   The bdec decoder library is free software; you can redistribute it
+#   and/or modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 2.1 of the License, or (at your option) any later version.
+#
+#   The bdec decoder library is distributed in the hope that it will be
+#   useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public
+#   License along with this library; if not, see
+#   <http://www.gnu.org/licenses/>.
+
+import json
+import StringIO
+import unittest
+
+import bdec.choice as chc
+from bdec.constraints import Equals
+import bdec.data as dt
+from bdec.decode import Decoder
+from bdec.decode.profile import Profiler
+from bdec.expression import Constant, ValueResult
+import bdec.field as fld
+import bdec.sequence as seq
+import bdec.sequenceof as sof
+
+class TestProfiler(unittest.TestCase):
+    def _decode(self, entry, data):
+        profiler = Profiler()
+        decoder = Decoder(entry, profiler)
+        list(decoder.decode(dt.Data(data)))
+        return profiler, dict((stats.entry.name, stats) for stats in profiler.stats())
+
+    def test_calls_and_bits(self):
+        a = fld.Field('a', 8)
+        b = sof.SequenceOf('b', a, 3)
+        c = seq.Sequence('c', [fld.Field('d', 4), b])
+        profiler, stats = self._decode(c, '\xf0abc')
+        self.assertEqual(1, stats['c'].calls)
+        self.assertEqual(28, stats['c'].bits)
+        self.assertEqual(1, stats['b'].calls)
+        self.assertEqual(24, stats['b'].bits)
+        self.assertEqual(3, stats['a'].calls)
+        self.assertEqual(24, stats['a'].bits)
+        self.assertTrue(stats['c'].cumulative_time >= stats['b'].cumulative_time)
+        self.assertTrue(stats['c'].cumulative_time >= stats['c'].self_time)
+
+    def test_choice_trials(self):
+        length = fld.Field('length:', 8, format=fld.Field.INTEGER)
+        def option(name):
+            return seq.Sequence(name, [
+                fld.Field('%s data' % name, length=ValueResult('length:') * Constant(8)),
+                fld.Field('%s tag' % name, 8, format=fld.Field.TEXT, constraints=[Equals(name)])])
+        a = seq.Sequence('a', [length, chc.Choice('b', [option('c'), option('d')])])
+        profiler, stats = self._decode(a, '\x01xd')
+        self.assertEqual(2, stats['b'].trials)
+        self.assertEqual(1, stats['b'].backtracks)
+        self.assertEqual(0, stats['a'].trials)
+
+    def test_json_output(self):
+        a = seq.Sequence('a', [fld.Field('b', 8)])
+        profiler, stats = self._decode(a, 'x')
+        output = StringIO.StringIO()
+        profiler.write_json(output, {a:('spec.xml', 2, 5)})
+        entries = dict((item['name'], item) for item in json.loads(output.getvalue())['entries'])
+        self.assertEqual(2, len(entries))
+        self.assertEqual('sequence', entries['a']['type'])
+        self.assertEqual(8, entries['a']['bits'])
+        self.assertEqual('spec.xml', entries['a']['filename'])
+        self.assertEqual(2, entries['a']['line'])
+        self.assertFalse('filename' in entries['b'])
+
+        table = StringIO.StringIO()
+        profiler.write_table(table)
+        self.assertEqual(3, len(table.getvalue().splitlines()))
@@ -62,7 +62,8 @@ def convert_value(entry, value, length):
     elif entry.format == Field.HEX:
         value = Data.from_hex(_convert_type(entry, value, str))
     elif entry.format == Field.TEXT:
-        value = _convert_type(entry, value, str)
+        if not isinstance(value, unicode):
+            value = _convert_type(entry, value, str)
     elif entry.format == Field.INTEGER:
         value = _convert_type(entry, value, int)
     elif entry.format == Field.FLOAT:
@@ -18,11 +18,10 @@
 #   <http://www.gnu.org/licenses/>.
 
 from collections import defaultdict
-import operator
 
 from bdec import DecodeError
 from bdec.constraints import Equals
-from bdec.data import Data
+from bdec.data import join
 from bdec.encode.entry import EntryEncoder, MockSequenceValue
 from bdec.expression import UndecodedReferenceError
 from bdec.inspect.solver import solve
@@ -162,10 +161,20 @@ class SequenceEncoder(EntryEncoder):
                 raise MissingValueError(self.entry)
             self._solve(self.entry.value, int(value), context)
 
+        # Children are output as soon as the children before them have been
+        # encoded; only those encoded out of order have to be held in memory.
         sequence_data = {}
+        next_child = 0
         for child in self.order():
-            data = reduce(operator.add, self._encode_child(child, query, value, 0, context), Data())
-            sequence_data[child] = data
-        for child in self.children:
-            yield sequence_data[child]
+            if child is not self.children[next_child]:
+                sequence_data[child] = join(self._encode_child(child, query, value, 0, context))
+                continue
+
+            for data in self._encode_child(child, query, value, 0, context):
+                yield data
+            next_child += 1
+            while next_child < len(self.children) and \
+                    self.children[next_child] in sequence_data:
+                yield sequence_data.pop(self.children[next_child])
+                next_child += 1
 
@@ -113,7 +113,8 @@ class Entry(object):
         self.length = length
         self._children = ()
         self.children = children
-        self._decoder = None
+        # The decoders for each set of decode options (see decode).
+        self._decoders = {}
         self._encoder = None
 
         self.constraints = list(constraints)
@@ -138,15 +139,19 @@ class Entry(object):
         self._children = list(items)
     children = property(_get_children, _set_children)
 
-    def _validate(self):
-        if self._decoder is None:
+    def _validate(self, arrays=False):
+        if arrays not in self._decoders:
             from bdec.decode import Decoder
-            self._decoder = Decoder(self)
+            self._decoders[arrays] = Decoder(self, arrays=arrays)
 
-    def decode(self, data, context={}, name=None):
-        """ Shortcut to bdec.decode.Decoder(self) """
-        self._validate()
-        return self._decoder.decode(data, context, name)
+    def decode(self, data, context={}, name=None, arrays=False):
+        """ Shortcut to bdec.decode.Decoder(self, arrays=arrays)
+
+        The decoder for each set of options is created when it is first used,
+        and reused by later decodes.
+        """
+        self._validate(arrays)
+        return self._decoders[arrays].decode(data, context, name)
 
     def encode(self, query, value):
         if self._encoder is None:
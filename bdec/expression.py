@@ -56,6 +56,33 @@ class NullReferenceError(UndecodedReferenceError):
     def __str__(self):
         return "Context '%s' present, but is None!" % self.name
 
+class _Unset:
+    def __repr__(self):
+        return 'UNSET'
+
+# The value of a slot in a context list that hasn't been set (see
+# Expression.compile).
+UNSET = _Unset()
+
+class SlotContext:
+    """A view of a context list that looks up the values by name.
+
+    Used to evaluate expressions that haven't been compiled for the context's
+    slots."""
+    def __init__(self, slots, values):
+        self._slots = slots
+        self._values = values
+
+    def __getitem__(self, name):
+        value = self._values[self._slots[name]]
+        if value is UNSET:
+            raise KeyError(name)
+        return value
+
+    def keys(self):
+        return [name for name, index in self._slots.iteritems()
+                if self._values[index] is not UNSET]
+
 class ExpressionError(Exception):
     def __init__(self, ex):
         self.error = ex
@@ -71,6 +98,28 @@ class Expression(object):
     def evaluate(self, context):
         raise NotImplementedError
 
+    def compile(self, slots=None):
+        """Compile the expression to a function.
+
+        The function takes the context, and returns the same value as
+        'evaluate' (raising the same errors) without walking the expression
+        tree. Parts of the expression that don't reference other entries are
+        evaluated once, when compiling.
+
+        slots -- If not None, a dictionary mapping the names in the context
+            to indexes. The compiled function then takes a list of values
+            instead of a dictionary, where names that haven't been set have
+            the value UNSET.
+        """
+        return _compile(self, slots)
+
+    def _source(self, compiler):
+        """Return python source code that evaluates the expression.
+
+        The code can use the 'context' variable, and the names bound with
+        compiler.bind. Defaults to calling the expression's evaluate."""
+        return '%s.evaluate(context)' % compiler.bind(self)
+
     def __mul__(self, other):
         return ArithmeticExpression(operator.mul, self, other)
 
@@ -111,6 +160,14 @@ class ArithmeticExpression(Expression):
     def evaluate(self, context):
         return self.op(self.left.evaluate(context), self.right.evaluate(context))
 
+    def _source(self, compiler):
+        left = compiler.source(self.left)
+        right = compiler.source(self.right)
+        try:
+            return '(%s %s %s)' % (left, _symbols[self.op], right)
+        except KeyError:
+            return '%s(%s, %s)' % (compiler.bind(self.op), left, right)
+
     def __repr__(self):
         lookup = {}
         for ops in _operators:
@@ -139,6 +196,14 @@ class RoundUpDivisionExpression(Expression):
             result += 1
         return result
 
+    def _source(self, compiler):
+        if not self.should_round_up:
+            return '(%s / %s)' % (compiler.source(self.numerator),
+                    compiler.source(self.denominator))
+        return '%s(%s, %s)' % (compiler.bind(_round_up),
+                compiler.source(self.numerator),
+                compiler.source(self.denominator))
+
 
 class Constant(Expression):
     def __init__(self, value):
@@ -147,6 +212,9 @@ class Constant(Expression):
     def evaluate(self, context):
         return self.value
 
+    def _source(self, compiler):
+        return compiler.constant(self.value)
+
     def __repr__(self):
         if isinstance(self.value, dt.Data):
             value = self.value
@@ -181,6 +249,17 @@ class ReferenceExpression(Expression):
             raise NullReferenceError(self.param_name(), context)
         return result
 
+    def _source(self, compiler):
+        # A missing (or None) value raises a KeyError (or TypeError) in the
+        # compiled function, which re-evaluates the expression to raise the
+        # reference error.
+        if compiler.slots is None:
+            return 'context[%r]' % self.param_name()
+        try:
+            return 'context[%i]' % compiler.slots[self.param_name()]
+        except KeyError:
+            return compiler.bind(UNSET)
+
     def __eq__(self, other):
         if type(self) != type(other):
             return NotImplemented
@@ -212,6 +291,93 @@ class LengthResult(ReferenceExpression):
         return "len{%s}" % self.name
 
 
+# The python operators of the operator functions.
+_symbols = dict((function, symbol) for ops in _operators for symbol, function in ops)
+
+def _round_up(numerator, denominator):
+    """Divide, rounding up (see RoundUpDivisionExpression)."""
+    result = numerator / denominator
+    if numerator % denominator:
+        result += 1
+    return result
+
+class _Compiler:
+    """Generate the source code of a compiled expression."""
+    def __init__(self, slots):
+        self.slots = slots
+        self.namespace = {}
+
+    def bind(self, value):
+        """Bind an object to a name used by the source code."""
+        name = '_%i' % len(self.namespace)
+        self.namespace[name] = value
+        return name
+
+    def constant(self, value):
+        if type(value) in (int, long):
+            return repr(value)
+        return self.bind(value)
+
+    def source(self, expression):
+        """Get the source code of an expression, folding constants."""
+        try:
+            value = expression.evaluate({})
+        except Exception:
+            # The expression references other entries (or cannot be
+            # evaluated, in which case the error is raised when the compiled
+            # expression is used).
+            return expression._source(self)
+        return self.constant(value)
+
+def _compile(expression, slots):
+    try:
+        value = expression.evaluate({})
+    except Exception:
+        pass
+    else:
+        # The expression doesn't reference other entries.
+        return lambda context: value
+
+    if isinstance(expression, ReferenceExpression):
+        name = expression.param_name()
+        if slots is None:
+            def evaluate(context):
+                try:
+                    result = context[name]
+                except KeyError:
+                    raise UndecodedReferenceError(name, context)
+                if result is None:
+                    raise NullReferenceError(name, context)
+                return result
+        else:
+            index = slots.get(name)
+            def evaluate(context):
+                if index is None or context[index] is UNSET:
+                    raise UndecodedReferenceError(name, SlotContext(slots, context))
+                result = context[index]
+                if result is None:
+                    raise NullReferenceError(name, SlotContext(slots, context))
+                return result
+        return evaluate
+
+    compiler = _Compiler(slots)
+    source = expression._source(compiler)
+    # Missing and None references cause a KeyError or TypeError; in that
+    # case the expression is evaluated again to raise the correct error.
+    compiler.namespace['_expression'] = expression
+    if slots is None:
+        fallback = '_expression.evaluate(context)'
+    else:
+        compiler.namespace['_slots'] = slots
+        compiler.namespace['_SlotContext'] = SlotContext
+        fallback = '_expression.evaluate(_SlotContext(_slots, context))'
+    exec ('def evaluate(context):\n'
+          '    try:\n'
+          '        return %s\n'
+          '    except (KeyError, TypeError):\n'
+          '        return %s\n' % (source, fallback)) in compiler.namespace
+    return compiler.namespace['evaluate']
+
 def _half(op):
     """
     Create a handler to handle half of a binary expression.
@@ -253,6 +419,22 @@ def _int_expression():
     expression << entry
     return expression
 
+def _expression_grammar():
+    from pyparsing import StringEnd
+    return _int_expression() + StringEnd()
+
+# The pyparsing grammars, created when they are first used. Creating (and
+# streamlining) a grammar is much slower than parsing a short expression.
+_grammars = {}
+
+def _grammar(create):
+    """Get the grammar returned by the 'create' function."""
+    try:
+        return _grammars[create]
+    except KeyError:
+        result = _grammars[create] = create()
+        return result
+
 def parse(text):
     """
     Compile a length expression into an integer convertible object.
@@ -261,10 +443,9 @@ def parse(text):
         convertible object.
     return -- An Expression instance
     """
-    from pyparsing import StringEnd, ParseException
-    complete = _int_expression() + StringEnd()
+    from pyparsing import ParseException
     try:
-        return complete.parseString(text)[0]
+        return _grammar(_expression_grammar).parseString(text)[0]
     except ParseException, ex:
         raise ExpressionError(ex)
 # Legacy name for parse function
@@ -279,8 +460,14 @@ def parse_conditional_inverse(text):
         is _false_ (eg: the returned entry can be used as a 'not present' 
         option in a choice).
     """
-    from pyparsing import StringEnd, ParseException
-    from pyparsing import Forward, OneOrMore, Literal, ZeroOrMore
+    from pyparsing import ParseException
+    try:
+        return _grammar(_conditional_inverse_grammar).parseString(text)[0]
+    except ParseException, ex:
+        raise ExpressionError(ex)
+
+def _conditional_inverse_grammar():
+    from pyparsing import StringEnd, Forward, OneOrMore, Literal, ZeroOrMore
     from bdec.constraints import Equals, Minimum, Maximum, NotEquals
     import bdec.choice as chc
     import bdec.sequence as seq
@@ -327,10 +514,5 @@ def parse_conditional_inverse(text):
         return result
     bool_expr << (factor + ZeroOrMore(and_expression | or_expression)).addParseAction(_collapse_bool)
 
-    # Parse the string
-    complete = bool_expr + StringEnd()
-    try:
-        return complete.parseString(text)[0]
-    except ParseException, ex:
-        raise ExpressionError(ex)
+    return bool_expr + StringEnd()
 
@@ -17,8 +17,6 @@
 #   License along with this library; if not, see
 #   <http://www.gnu.org/licenses/>.
 
-import operator
-
 import bdec.choice as chc
 from bdec.constraints import Equals, Maximum, Minimum
 import bdec.data as dt
@@ -128,7 +126,7 @@ class _ProtocolStream:
                 if value is not None:
                     def query(context, entry, i, name):
                         return value
-                    data = reduce(operator.add, self.entry.encode(query, None))
+                    data = dt.join(self.entry.encode(query, None))
                     return data
             except UnknownReferenceError:
                 # We can't encode this entry; see if we know how long it is.
@@ -247,73 +245,141 @@ def _differentiate(entries):
     yield offset, 0, {}, [entry for entry, option in options], successful, possible
 
 class _Cache:
-    """ Class to cache differentiated entries. """
+    """Class to cache differentiated entries.
+
+    The differentiation steps are only calculated when a decision needs them,
+    so choices whose options are distinguished early don't differentiate the
+    remaining data.
+    """
     def __init__(self, entries):
-        self._cache = []
+        self._steps = []
+        self._position = 0
         self._items = _differentiate(entries)
 
-    def __iter__(self):
-        for item in self._cache:
-            yield item
+    def get(self, step):
+        """Get the differentiation at a step, or None if there are no more.
 
-        for offset, length, lookup, undistinguished, successful, possible in self._items:
-            item = (offset, length, lookup.copy(), undistinguished[:], successful[:], possible[:])
-            self._cache.append(item)
-            yield item
+        Returns a (skip, length, lookup, undistinguished, successful,
+        possible) tuple, where skip is the number of bits since the end of
+        the previous step.
+        """
+        while len(self._steps) <= step:
+            if self._items is None:
+                return None
+            try:
+                offset, length, lookup, undistinguished, successful, possible = self._items.next()
+            except StopIteration:
+                self._items = None
+                return None
+            assert offset >= self._position
+            self._steps.append((offset - self._position, length, lookup.copy(),
+                undistinguished[:], successful[:], possible[:]))
+            self._position = offset + length
+        return self._steps[step]
+
+
+class _Decision:
+    """A compiled step of a chooser's decision table.
+
+    A decision holds the options that are still possible at a step of the
+    differentiation. Choosing the next decision from the data at that step
+    is an integer read and a dictionary lookup.
+    """
+    def __init__(self, steps, step, options, get_decision):
+        self.options = options
+        self.length = None
+        if len(options) <= 1:
+            # No more differentiation is needed.
+            return
+        differentiation = steps.get(step)
+        if differentiation is None:
+            # No more differentiation is possible.
+            return
+
+        skip, length, lookup, undistinguished, successful, possible = differentiation
+        self.skip = skip
+        self.length = length
+        self._step = step
+        self._lookup = lookup
+        self._get_decision = get_decision
+        self._table = {}
+
+        # If we run out of data, the remaining options are those that have
+        # finished decoding.
+        finished = set(id(entry) for entry in successful + possible)
+        self.finished = [option for option in options if id(option) in finished]
+
+        # If we have a successful item, options after it cannot succeed (as
+        # they are a lower priority).
+        successful_ids = set(id(entry) for entry in successful)
+        self._truncated = list(options)
+        for i, option in enumerate(self._truncated):
+            if id(option) in successful_ids:
+                del self._truncated[i+1:]
+                break
+        self.finished_read = [option for option in self._truncated if id(option) in finished]
+        self._allowed = finished | set(id(entry) for entry in undistinguished)
+
+    def next(self, value):
+        """Get the decision after reading a value at this step."""
+        if value not in self._lookup:
+            value = None
+        try:
+            return self._table[value]
+        except KeyError:
+            pass
+
+        options = self._truncated
+        if self._lookup:
+            allowed = self._allowed | set(id(entry) for entry in self._lookup.get(value, []))
+            options = [option for option in options if id(option) in allowed]
+        result = self._get_decision(self._step + 1, options)
+        self._table[value] = result
+        return result
 
 
 class Chooser:
+    """Choose the entries that may successfully decode some data.
+
+    The differentiation between the entries is compiled into a table of
+    decisions as it is used; later calls only read integers at fixed offsets
+    and look up the next decision. Each step of the differentiation is only
+    calculated when a decision with more than one option reaches it.
+    """
     def __init__(self, entries):
         self._entries = entries
-        self._cache = _Cache(entries)
+        self._steps = _Cache(entries)
+        self._decisions = {}
+        self._start = None
+
+    def _get_decision(self, step, options):
+        key = (step, tuple(id(option) for option in options))
+        try:
+            return self._decisions[key]
+        except KeyError:
+            decision = _Decision(self._steps, step, options, self._get_decision)
+            self._decisions[key] = decision
+            return decision
 
     def choose(self, data):
-        options = list(self._entries)
-        current_offset = 0
-        copy = data.copy()
-        for offset, length, lookup, undistinguished, successful, possible in self._cache:
-            if len(options) <= 1:
-                break
+        if self._start is None:
+            self._start = self._get_decision(0, list(self._entries))
 
+        decision = self._start
+        copy = data.copy()
+        while decision.length is not None:
             # Remove data from before the current offset, as we cannot use it
             # to differentiate.
-            assert offset >= current_offset
             try:
-                copy.pop(offset - current_offset)
+                copy.pop(decision.skip)
             except dt.NotEnoughDataError:
-                # We don't have enough data left for this option; reduce
-                # the possibles to those that have finished decoding.
-                options = [option for option in options if option in set(successful + possible)]
-                break
-            current_offset = offset
-
-            # Check to see if we have a successful item, and remove any items
-            # after that item (as they cannot succeed).
-            for i, option in enumerate(options):
-                if option in successful:
-                    # We found a successful item; no options after this can 
-                    # succeed (as they are a lower priority).
-                    del options[i+1:]
-                    break
-
-            if length:
+                return list(decision.finished)
+
+            value = None
+            if decision.length:
                 try:
-                    value = int(copy.pop(length))
-                    current_offset += length
+                    value = int(copy.pop(decision.length))
                 except dt.NotEnoughDataError:
-                    # We don't have enough data left for this option; reduce
-                    # the possibles to those that have finished decoding.
-                    options = [option for option in options if option in set(successful + possible)]
-                    break
-
-                if lookup:
-                    # We found a range of bits that can be used to distinguish
-                    # between the diffent options.
-                    filter = successful + possible + undistinguished
-                    try:
-                        filter += lookup[value]
-                    except KeyError:
-                        pass
-                    options = [option for option in options if option in filter]
-
-        return options
+                    return list(decision.finished_read)
+            decision = decision.next(value)
+        return list(decision.options)
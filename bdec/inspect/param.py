@@ -78,6 +78,65 @@ class _FailedToResolveError(Exception):
     def __init__(self, name):
         self.name = name
 
+def components(entries):
+    """Find the strongly connected components of the entries.
+
+    Each component is a list of entries that (directly or indirectly) contain
+    each other; entries that aren't recursive are in a component by
+    themselves. The components are returned in the order a depth first walk
+    of the entries finishes them, so the children of an entry are in the
+    same or an earlier component.
+
+    The entries are walked with an explicit stack (using Tarjan's algorithm),
+    so the depth of the specification isn't limited by the recursion limit.
+    """
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    result = []
+    for root in entries:
+        if root in index:
+            continue
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        walk = [(root, iter(root.children))]
+        while walk:
+            entry, children = walk[-1]
+            for child in children:
+                child = child.entry
+                if child not in index:
+                    index[child] = lowlink[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    walk.append((child, iter(child.children)))
+                    break
+                elif child in on_stack:
+                    lowlink[entry] = min(lowlink[entry], index[child])
+            else:
+                # All of the entry's children have been walked.
+                walk.pop()
+                if walk:
+                    parent = walk[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[entry])
+                if lowlink[entry] == index[entry]:
+                    component = []
+                    while 1:
+                        member = stack.pop()
+                        on_stack.remove(member)
+                        component.append(member)
+                        if member is entry:
+                            break
+                    component.reverse()
+                    result.append(component)
+    return result
+
+def _is_recursive(component):
+    """Test if the entries in a component contain themselves."""
+    entry = component[0]
+    return len(component) > 1 or entry in [child.entry for child in entry.children]
+
 class Param(object):
     """Class to represent parameters passed into and out of decodes. """
     IN = "in"
@@ -150,30 +209,37 @@ class EndEntryParameters(_Parameters):
         self._has_context_lookup = {}
 
         self._end_sequenceof_entries = set()
-        for entry in entries:
-            self._populate_lookup(entry, [])
-
-    def _populate_lookup(self, entry, intermediaries):
-        if entry in self._has_context_lookup:
-            return
-        self._has_context_lookup.setdefault(entry, False)
-
+        entry_components = components(entries)
+        for component in entry_components:
+            for entry in component:
+                if isinstance(entry, sof.SequenceOf):
+                    self._end_sequenceof_entries.update(entry.end_entries)
+
+        # All the items between an 'end-sequenceof' entry and the sequenceof
+        # must be able to pass the 'end' context back up to the sequenceof.
+        # The children of an entry are in earlier components, so their
+        # context is known unless they are recursive.
+        for component in entry_components:
+            for entry in component:
+                self._has_context_lookup[entry] = False
+            changed = True
+            while changed:
+                changed = False
+                for entry in component:
+                    if not self._has_context_lookup[entry] and self._has_context(entry):
+                        self._has_context_lookup[entry] = True
+                        changed = True
+
+    def _has_context(self, entry):
         if isinstance(entry, sof.SequenceOf):
-            self._end_sequenceof_entries.update(entry.end_entries)
-            intermediaries = []
-        else:
-            intermediaries.append(entry)
-
+            # A sequenceof doesn't pass the 'end' context of its children.
+            return False
         if entry in self._end_sequenceof_entries:
-            # We found a 'end-sequenceof' entry. All the items between the end
-            # entry and the sequenceof must be able to pass the 'end' context
-            # back up to the sequenceof.
-            for intermediary in intermediaries:
-                self._has_context_lookup[intermediary] = True
-
-        # Keep walking down the chain look for 'end-sequenceof' entries.
+            return True
         for child in entry.children:
-            self._populate_lookup(child.entry, intermediaries[:])
+            if self._has_context_lookup.get(child.entry):
+                return True
+        return False
 
     def get_locals(self, entry):
         result = []
@@ -252,8 +318,8 @@ class ExpressionParameters(_Parameters):
         self._referenced_lengths = set()
         unreferenced_entries = {}
         entries_used = set()
-        for entry in entries:
-            self._populate_references(entry, unreferenced_entries, entries_used)
+        for component in components(entries):
+            self._populate_references(component, unreferenced_entries, entries_used)
 
         should_have_failed = False
         for entry, references in unreferenced_entries.iteritems():
@@ -274,13 +340,20 @@ class ExpressionParameters(_Parameters):
     def _find_child_using_param(self, entry, name):
         """Find the child entry using the given parameter name.
 
-        Returns a list of entries from entry down to the child."""
-        for child in entry.children:
-            for param in self._params[child.entry]:
-                if param.reference.name == name:
-                    return self._find_child_using_param(child.entry, name) + [entry]
-        # None of the child entries use the parameter; it must be us.
-        return [entry]
+        Returns a list of entries from the child up to entry."""
+        result = [entry]
+        while 1:
+            for child in result[-1].children:
+                if child.entry not in result and [param for param in
+                        self._params[child.entry] if param.reference.name == name]:
+                    result.append(child.entry)
+                    break
+            else:
+                # None of the child entries use the parameter; it must be the
+                # last entry.
+                break
+        result.reverse()
+        return result
 
     def _collect_references(self, expression):
         """
@@ -302,37 +375,26 @@ class ExpressionParameters(_Parameters):
             raise Exception("Unable to collect references from unhandled expression type '%s'!" % expression)
         return result
 
-    def _populate_references(self, entry, unreferenced_entries, entries_used):
-        """
-        Walk down the tree, populating the '_params', '_referenced_XXX' sets.
+    def _find_unknowns(self, entry, unreferenced_entries):
+        """Find the references an entry (and its children) doesn't know about.
 
-        Handles recursive elements.
+        Returns a tuple containing the set of references that must be passed
+        into the entry, and the list of references that are resolved by its
+        children.
         """
-        if entry in self._params:
-            return
-        self._params[entry] = set()
-        unreferenced_entries[entry] = set()
-
-        for child in entry.children:
-            entries_used.add(child.entry)
-            self._populate_references(child.entry, unreferenced_entries, entries_used)
-
-        # An entries unknown references are those referenced in any 
+        # An entries unknown references are those referenced in any
         # expressions, and those that are unknown in all of its children.
+        unknowns = set()
         if entry.length is not None:
-            unreferenced_entries[entry].update(self._collect_references(entry.length))
+            unknowns.update(self._collect_references(entry.length))
         if isinstance(entry, sof.SequenceOf) and entry.count is not None:
-            unreferenced_entries[entry].update(self._collect_references(entry.count))
+            unknowns.update(self._collect_references(entry.count))
 
         # Store the names the child doesn't know about (ie: names that must be
         # resolved for this entry to decode)
         child_unknowns = set()
         for child in entry.children:
-            unknowns = unreferenced_entries[child.entry]
-            self._local_child_param_name.setdefault(entry, {}).setdefault(child, {}).update(
-                    (ref.name, ref.name) for ref in unknowns)
-            child_unknowns.update(unknowns)
-
+            child_unknowns.update(unreferenced_entries.get(child.entry, ()))
         if isinstance(entry, seq.Sequence) and entry.value is not None:
             child_unknowns.update(self._collect_references(entry.value))
         for constraint in entry.constraints:
@@ -340,29 +402,70 @@ class ExpressionParameters(_Parameters):
 
         # Our unknown list is all the unknowns in our children that aren't
         # present in our known references.
-        child_names = [child.name for child in entry.children]
+        child_names = set(child.name for child in entry.children)
+        resolved = []
         for unknown in child_unknowns:
             name = unknown.name.split('.')[0]
             if name not in child_names:
                 # This value is 'unknown' to the entry, and must be passed in.
-                unreferenced_entries[entry].add(unknown)
+                unknowns.add(unknown)
             else:
+                resolved.append(unknown)
+        return unknowns, resolved
+
+    def _populate_references(self, component, unreferenced_entries, entries_used):
+        """
+        Populate the '_params', '_referenced_XXX' sets for a component.
+
+        The children of the entries in the component must already have been
+        populated (unless they are in the component).
+        """
+        for entry in component:
+            self._params[entry] = set()
+            unreferenced_entries[entry] = set()
+            for child in entry.children:
+                entries_used.add(child.entry)
+
+        # The unknowns of a recursive entry depend on themselves, so they are
+        # found again until they stop changing (they only ever grow).
+        resolved = {}
+        is_recursive = _is_recursive(component)
+        changed = True
+        while changed:
+            changed = False
+            for entry in component:
+                unknowns, resolved[entry] = self._find_unknowns(entry, unreferenced_entries)
+                if len(unknowns) != len(unreferenced_entries[entry]):
+                    unreferenced_entries[entry] = unknowns
+                    changed = is_recursive
+
+        for entry in component:
+            for reference in unreferenced_entries[entry]:
+                self._params[entry].add(_VariableParam(reference, Param.IN, None))
+
+        for entry in component:
+            for child in entry.children:
+                self._local_child_param_name.setdefault(entry, {}).setdefault(child, {}).update(
+                        (ref.name, ref.name) for ref in unreferenced_entries[child.entry])
+
+            for unknown in resolved[entry]:
                 # This value comes from one of our child entries, so drill down
                 # into it.
                 param_type = self._add_out_params(entry, unknown)
                 self._populate_child_input_parameter_type(entry, unknown.name, param_type)
 
-        for reference in unreferenced_entries[entry]:
-            self._params[entry].add(_VariableParam(reference, Param.IN, None))
-
     def _populate_child_input_parameter_type(self, entry, name, param_type):
         """ Set the input parameter type of any of children that use the named
         parameter."""
-        for child in entry.children:
-            for param in self._params[child.entry]:
-                if param.reference.name == name and param.direction == Param.IN:
-                    param.types.add(param_type)
-                    self._populate_child_input_parameter_type(child.entry, name, param_type)
+        entries = [entry]
+        while entries:
+            entry = entries.pop()
+            for child in entry.children:
+                for param in self._params[child.entry]:
+                    if param.reference.name == name and param.direction == Param.IN \
+                            and param_type not in param.types:
+                        param.types.add(param_type)
+                        entries.append(child.entry)
 
     def is_output_param_used(self, entry, child, param):
         """Check to see if an parameter is used."""
@@ -566,74 +669,61 @@ class DataChecker:
         """A list of entries to check for visibility.
 
         All other entries reachable by these entries can also be checked."""
-        self._common = entries[:]
+        self._common = set(entries)
         self._has_data = {}
         self._parents = {}
-        entries = set(entries)
-        while entries:
-            entry = entries.pop()
-            intermediates = set()
-            stack = []
-            self._populate(entry, stack, intermediates)
-            assert not stack
-            for entry in intermediates:
-                del self._has_data[entry]
-            entries.update(intermediates)
-
-    def _populate(self, entry, stack, intermediates):
-        """Walk down all entries contained within this entry, checking for visibility."""
-        if entry in stack:
-            # An entry is within itself. This entry will be 'visible' either if
-            # it itself is visible, or it contains a visible child, but at this
-            # stage we don't know for sure (as all of its children haven't been
-            # processed). If so, we'll mark all of its children to a list that 
-            # requires them to be re-processed.
-            if not self._has_data[entry]:
-                for inter in stack[stack.index(entry)+1:]:
-                    intermediates.add(inter)
-            return
-
-        if entry in self._has_data:
-            return
-
-        # This entry isn't yet calculated; do so now.
-        self._has_data[entry] = not entry.is_hidden()
-        stack.append(entry)
+        for component in components(entries):
+            for entry in component:
+                self._has_data[entry] = not entry.is_hidden()
+                for child in entry.children:
+                    assert child not in self._parents, \
+                            "Found child '%s' in parents '%s' and '%s'!" % (child,
+                                    entry, self._parents[child])
+                    self._parents[child] = entry
+
+            # A recursive entry will be 'visible' either if it itself is
+            # visible, or it contains a visible child. We assume the entries
+            # contain data until we find out otherwise.
+            is_recursive = _is_recursive(component)
+            changed = True
+            while changed:
+                changed = False
+                for entry in component:
+                    has_data = self._check(entry)
+                    if has_data != self._has_data[entry]:
+                        self._has_data[entry] = has_data
+                        changed = is_recursive
+
+            for entry in component:
+                if not self._has_data[entry]:
+                    self._hide_children(entry)
+
+    def _check(self, entry):
+        """Check if an entry contains data, given the data of its children."""
+        if isinstance(entry, chc.Choice) or entry.is_hidden():
+            return not entry.is_hidden()
+
+        # We are visible; check to see if either we (or any of our
+        # children) contain data.
         for child in entry.children:
-             assert child not in self._parents, \
-                     "Found child '%s' in parents '%s' and '%s'!" % (child,
-                             entry, self._parents[child])
-             self._parents[child] = entry
-             self._populate(child.entry, stack, intermediates)
-        stack.remove(entry)
-
-        if not isinstance(entry, chc.Choice) and not entry.is_hidden():
-            # We are visible; check to see if either we (or any of our
-            # children) contain data.
-            for child in entry.children:
-                if not ent.is_hidden(child.name) and self._has_data[child.entry]:
-                    break
-            else:
-                # None of the children contain data; this entry will only contain
-                # data if implicitly has data itself.
-                if isinstance(entry, fld.Field) or \
-                        (isinstance(entry, seq.Sequence) and entry.value is not None):
-                    # This entry's children don't contain data, but it appears to
-                    # have some implicit data.
-                    for constraint in entry.constraints:
-                        if isinstance(constraint, Equals):
-                            # The 'implicit' data has an expected value, so it
-                            # isn't considered as new data.
-                            self._has_data[entry] = False
-                            break
-                elif isinstance(entry, sof.SequenceOf) and \
-                        not ent.is_hidden(entry.children[0].name):
-                    self._has_data[entry] = True
-                else:
-                    self._has_data[entry] = False
+            if not ent.is_hidden(child.name) and self._has_data[child.entry]:
+                return True
 
-        if not self._has_data[entry]:
-            self._hide_children(entry)
+        # None of the children contain data; this entry will only contain
+        # data if implicitly has data itself.
+        if isinstance(entry, fld.Field) or \
+                (isinstance(entry, seq.Sequence) and entry.value is not None):
+            # This entry's children don't contain data, but it appears to
+            # have some implicit data. If the 'implicit' data has an expected
+            # value, it isn't considered as new data.
+            for constraint in entry.constraints:
+                if isinstance(constraint, Equals):
+                    return False
+            return True
+        elif isinstance(entry, sof.SequenceOf) and \
+                not ent.is_hidden(entry.children[0].name):
+            return True
+        return False
 
     def _hide_children(self, entry):
         """Hide all of the non-common children of an entry.
@@ -643,9 +733,14 @@ class DataChecker:
         child entries are visible.
         """
         self._has_data[entry] = False
-        for child in entry.children:
-            if child.entry not in self._common:
-                self._hide_children(child.entry)
+        entries = [entry]
+        hidden = set(entries)
+        while entries:
+            for child in entries.pop().children:
+                if child.entry not in self._common and child.entry not in hidden:
+                    self._has_data[child.entry] = False
+                    hidden.add(child.entry)
+                    entries.append(child.entry)
 
     def contains_data(self, entry):
         """Does an entry contain data."""
@@ -666,8 +761,16 @@ class ResultParameters(_Parameters):
     A class that generates the parameters used when passing the decode result
     out of the decode function as a parameter.
     """
-    def __init__(self, entries):
-        self._checker = DataChecker(entries)
+    def __init__(self, entries, checker=None):
+        """Construct a result parameters instance.
+
+        entries -- The entries to be queried.
+        checker -- The DataChecker for the entries. If None, one will be
+            created.
+        """
+        if checker is None:
+            checker = DataChecker(entries)
+        self._checker = checker
 
     def get_locals(self, entry):
         locals = []
@@ -734,12 +837,70 @@ class CompoundParameters(_Parameters):
         return False
 
 
+class CachedParameters(_Parameters):
+    """
+    Class that remembers the results of another parameter query class.
+
+    Each query is calculated at most once. Other inspections of the entries
+    (such as the ranges in bdec.inspect.type) can be cached with the
+    parameters they use through 'memoise'. The cache belongs to this
+    instance; if the entries are modified after being queried, 'clear' must
+    be called to discard the cached results.
+
+    The results are shared between callers, so mustn't be modified.
+    """
+    def __init__(self, parameters):
+        self._parameters = parameters
+        self._cache = {}
+
+    def clear(self):
+        """Discard the cached results."""
+        self._cache.clear()
+
+    def memoise(self, query, key, function, *args):
+        """Return the result of function(*args), calculating it at most once.
+
+        query -- The name of the query being made.
+        key -- Identifies the result within the query (eg: the entry).
+        """
+        try:
+            return self._cache[query, key]
+        except KeyError:
+            result = function(*args)
+            self._cache[query, key] = result
+            return result
+
+    def _list(self, query, *args):
+        return list(getattr(self._parameters, query)(*args))
+
+    def get_locals(self, entry):
+        return self.memoise('locals', entry, self._list, 'get_locals', entry)
+
+    def get_params(self, entry):
+        return self.memoise('params', entry, self._list, 'get_params', entry)
+
+    def get_passed_variables(self, entry, child):
+        return self.memoise('passed', (entry, child), self._list,
+                'get_passed_variables', entry, child)
+
+    def is_end_sequenceof(self, entry):
+        return self.memoise('end', entry, self._parameters.is_end_sequenceof, entry)
+
+    def is_value_referenced(self, entry):
+        return self.memoise('value', entry, self._parameters.is_value_referenced, entry)
+
+    def is_length_referenced(self, entry):
+        return self.memoise('length', entry, self._parameters.is_length_referenced, entry)
+
+
 class EncodeResultParameters(_Parameters):
     """Parameters passed around to represent the values being encoded.
 
     Only visible entries will be passed in this fashion."""
-    def __init__(self, entries):
-        self._result_params = ResultParameters(entries)
+    def __init__(self, entries, result_params=None):
+        if result_params is None:
+            result_params = ResultParameters(entries)
+        self._result_params = result_params
 
     def get_locals(self, entry):
         """Return an iterable of Local instances. """
@@ -763,11 +924,13 @@ class EncodeResultParameters(_Parameters):
 
 class EncodeExpressionParameters(_Parameters):
     """The parameters passed around to handle encoding due to expression references."""
-    def __init__(self, entries):
+    def __init__(self, entries, expression_params=None):
         self._hidden_map = {}
         for entry in entries:
             self._populate_visible(entry, entries, self._hidden_map)
-        self.expression_params = ExpressionParameters(entries)
+        if expression_params is None:
+            expression_params = ExpressionParameters(entries)
+        self.expression_params = expression_params
 
     def is_output_param_used(self, entry, child, param):
         return self.expression_params.is_output_param_used(entry, child, param)
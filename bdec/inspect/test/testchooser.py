@@ -251,3 +251,30 @@ class TestChooser(unittest.TestCase):
         c = seq.Sequence('c', [])
         chooser = chsr.Chooser([a, b, c])
         self.assertEqual([c], chooser.choose(dt.Data('', 0, 0)))
+
+    def test_decisions_are_reused(self):
+        a = fld.Field('a', 8, constraints=[Equals(dt.Data('a'))])
+        b = fld.Field('b', 8, constraints=[Equals(dt.Data('b'))])
+        c = fld.Field('c', 8)
+        chooser = chsr.Chooser([a, b, c])
+        self.assertEqual([a], chooser.choose(dt.Data('a')))
+        self.assertEqual([b], chooser.choose(dt.Data('b')))
+        self.assertEqual([c], chooser.choose(dt.Data('x')))
+        num_decisions = len(chooser._decisions)
+
+        # Unknown values should share the same decision
+        for value in 'cdefgh':
+            self.assertEqual([c], chooser.choose(dt.Data(value)))
+        self.assertEqual(num_decisions, len(chooser._decisions))
+
+    def test_differentiates_on_demand(self):
+        # Once the first byte distinguishes the options, the rest of the
+        # options shouldn't be differentiated.
+        a = seq.Sequence('a', [fld.Field('a%i' % i, 8,
+            constraints=[Equals(dt.Data(chr(i)))]) for i in range(10)])
+        b = seq.Sequence('b', [fld.Field('b%i' % i, 8,
+            constraints=[Equals(dt.Data(chr(i + 1)))]) for i in range(10)])
+        chooser = chsr.Chooser([a, b])
+        self.assertEqual([a], chooser.choose(dt.Data('\x00')))
+        self.assertEqual([b], chooser.choose(dt.Data('\x01')))
+        self.assertEqual(1, len(chooser._steps._steps))
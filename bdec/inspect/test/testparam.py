@@ -37,6 +37,13 @@ class _Integer(IntegerType):
     def __eq__(self, other):
         return isinstance(other, IntegerType)
 
+def _nested(entry, depth):
+    """Nest an entry within sequences deeper than the recursion limit."""
+    entries = [entry]
+    for i in range(depth):
+        entries.append(seq.Sequence('nested %i' % i, [entries[-1]]))
+    return entries
+
 
 class TestExpressionParameters(unittest.TestCase):
     def test_direct_children(self):
@@ -416,6 +423,31 @@ class TestExpressionParameters(unittest.TestCase):
             fld.Field('c', length=expr.compile('${b}'))])
         self.assertRaises(prm.BadReferenceTypeError, prm.ExpressionParameters, [a])
 
+    def test_recursive_entry_with_input_parameter(self):
+        # Test that a parameter used within a recursive entry is passed
+        # through each level of the recursion.
+        embedded = seq.Sequence('embedded', [])
+        digit = fld.Field('digit', 8, constraints=[Maximum(expr.compile('${max}'))])
+        item = chc.Choice('item', [embedded, digit])
+        embedded.children = [
+                fld.Field('', length=8, format=fld.Field.TEXT, constraints=[Equals('<')]),
+                item,
+                fld.Field('', length=8, format=fld.Field.TEXT, constraints=[Equals('>')])]
+        a = seq.Sequence('a', [fld.Field('max', 8), item])
+        lookup = prm.ExpressionParameters([a])
+        self.assertEqual([prm.Param('max', prm.Param.IN, _Integer())], lookup.get_params(item))
+        self.assertEqual([prm.Param('max', prm.Param.IN, _Integer())], lookup.get_params(embedded))
+        self.assertEqual([prm.Param('max', prm.Param.IN, _Integer())],
+                list(lookup.get_passed_variables(embedded, embedded.children[1])))
+
+    def test_deeply_nested_entries(self):
+        entries = _nested(fld.Field('b', length=expr.compile('${a}')), 3000)
+        c = seq.Sequence('c', [fld.Field('a', 8), entries[-1]])
+        lookup = prm.ExpressionParameters([c])
+        self.assertEqual([prm.Param('a', prm.Param.IN, _Integer())], lookup.get_params(entries[0]))
+        self.assertEqual([prm.Param('a', prm.Param.IN, _Integer())], lookup.get_params(entries[-1]))
+        self.assertEqual([prm.Param('a', prm.Param.OUT, _Integer())], lookup.get_params(c.children[0].entry))
+
 class TestEndEntryParameters(unittest.TestCase):
     def test_end_entry_lookup(self):
         null = fld.Field("null", 8, constraints=[Equals(dt.Data('\x00'))])
@@ -429,6 +461,30 @@ class TestEndEntryParameters(unittest.TestCase):
         self.assertEqual([prm.Local('should end', _Integer())], lookup.get_locals(string))
         self.assertTrue(lookup.is_end_sequenceof(null))
 
+    def test_end_entry_used_outside_sequenceof(self):
+        # Test that all entries that contain the end entry pass the 'end'
+        # context, regardless of the order they are found.
+        null = fld.Field("null", 8, constraints=[Equals(dt.Data('\x00'))])
+        entry = chc.Choice('entry', [null, fld.Field("char", 8)])
+        other = seq.Sequence('other', [entry])
+        string = sof.SequenceOf("null terminated string", entry, None, end_entries=[null])
+        a = seq.Sequence('a', [other, string])
+
+        lookup = prm.EndEntryParameters([a])
+        should_end = set([prm.Param('should end', prm.Param.OUT, prm.ShouldEndType())])
+        self.assertEqual(should_end, lookup.get_params(entry))
+        self.assertEqual(should_end, lookup.get_params(other))
+        self.assertEqual(set(), lookup.get_params(string))
+
+    def test_deeply_nested_entries(self):
+        null = fld.Field("null", 8, constraints=[Equals(dt.Data('\x00'))])
+        entries = _nested(null, 3000)
+        string = sof.SequenceOf("string", entries[-1], None, end_entries=[null])
+        lookup = prm.EndEntryParameters([string])
+        should_end = set([prm.Param('should end', prm.Param.OUT, prm.ShouldEndType())])
+        self.assertEqual(should_end, lookup.get_params(entries[0]))
+        self.assertEqual(should_end, lookup.get_params(entries[-1]))
+
 class TestResultParameters(unittest.TestCase):
     def test_field_output(self):
         a = fld.Field('a', 8)
@@ -531,6 +587,66 @@ class TestDataChecker(unittest.TestCase):
         self.assertTrue(checker.contains_data(a))
         self.assertFalse(checker.contains_data(b))
 
+    def test_deeply_nested_entries(self):
+        entries = _nested(fld.Field('a', 8), 3000)
+        hidden = seq.Sequence('hidden:', [entries[-1]])
+        checker = prm.DataChecker([hidden])
+        self.assertFalse(checker.contains_data(entries[0]))
+        self.assertFalse(checker.contains_data(hidden))
+
+        checker = prm.DataChecker([entries[-1]])
+        self.assertTrue(checker.contains_data(entries[0]))
+        self.assertTrue(checker.contains_data(entries[-1]))
+
+
+class _CountingParameters(prm.ExpressionParameters):
+    """Test class that counts the parameter queries made."""
+    def __init__(self, entries):
+        prm.ExpressionParameters.__init__(self, entries)
+        self.queries = 0
+
+    def get_params(self, entry):
+        self.queries += 1
+        return prm.ExpressionParameters.get_params(self, entry)
+
+
+class TestCachedParameters(unittest.TestCase):
+    def test_queries_are_cached(self):
+        a = fld.Field('a', 8)
+        b = fld.Field('b', expr.parse('${a} * 8'))
+        c = seq.Sequence('c', [a, b])
+        counter = _CountingParameters([c])
+        params = prm.CachedParameters(counter)
+        expected = [prm.Param('a', prm.Param.IN, _Integer())]
+        self.assertEqual(expected, params.get_params(b))
+        self.assertEqual(expected, params.get_params(b))
+        self.assertEqual(1, counter.queries)
+        self.assertEqual([prm.Param('a', prm.Param.OUT, _Integer())],
+                params.get_passed_variables(c, c.children[0]))
+        self.assertTrue(params.is_value_referenced(a))
+        self.assertFalse(params.is_length_referenced(a))
+
+    def test_clear(self):
+        a = fld.Field('a', 8)
+        counter = _CountingParameters([a])
+        params = prm.CachedParameters(counter)
+        params.get_params(a)
+        a.name = 'b'
+        params.get_params(a)
+        self.assertEqual(1, counter.queries)
+        params.clear()
+        params.get_params(a)
+        self.assertEqual(2, counter.queries)
+
+    def test_memoise(self):
+        params = prm.CachedParameters(prm.ExpressionParameters([]))
+        results = []
+        calculate = lambda value: results.append(value) or len(results)
+        self.assertEqual(1, params.memoise('query', 'a', calculate, 'a'))
+        self.assertEqual(1, params.memoise('query', 'a', calculate, 'a'))
+        self.assertEqual(2, params.memoise('other', 'a', calculate, 'a'))
+        self.assertEqual(['a', 'a'], results)
+
 
 class TestEncodeParameters(unittest.TestCase):
     def test_referenced_renamed_child(self):
@@ -21,7 +21,7 @@ from bdec.choice import Choice
 from bdec.constraints import Minimum, Maximum, Equals
 from bdec.expression import compile
 from bdec.field import Field
-from bdec.inspect.param import ExpressionParameters
+from bdec.inspect.param import CachedParameters, ExpressionParameters
 from bdec.inspect.type import expression_range, Range, EntryValueType, EntryLengthType, \
         MultiSourceType
 from bdec.sequence import Sequence
@@ -115,3 +115,18 @@ class TestTypeRange(unittest.TestCase):
         range = EntryValueType(c).range(None)
         self.assertEqual(5, range.min)
         self.assertEqual(30, range.max)
+
+    def test_cached_range(self):
+        a = Field('a', length=4)
+        b = Sequence('b', [], value=compile('${a} * 8'))
+        c = Sequence('c', [a, b])
+        params = CachedParameters(ExpressionParameters([c]))
+        range = EntryValueType(b).range(params)
+        self.assertEqual(15 * 8, range.max)
+        self.assertTrue(range is EntryValueType(b).range(params))
+
+        # The cached range is kept until the cache is cleared
+        a.length = compile('8')
+        self.assertEqual(15 * 8, EntryValueType(b).range(params).max)
+        params.clear()
+        self.assertEqual(255 * 8, EntryValueType(b).range(params).max)
@@ -32,6 +32,14 @@ from bdec.inspect.range import Range
 import bdec.sequence as seq
 
 
+def _memoise(parameters, query, key, function, *args):
+    """Call function(*args), caching the result if the parameters allow it."""
+    try:
+        memoise = parameters.memoise
+    except AttributeError:
+        return function(*args)
+    return memoise(query, key, function, *args)
+
 def _delayed_range(delayed, entry, parameters):
     left = expression_range(delayed.left, entry, parameters)
     right = expression_range(delayed.right, entry, parameters)
@@ -86,9 +94,11 @@ def expression_range(expression, entry=None, parameters=None):
     entry -- The entry where this expression is used. All ValueResult and
         LengthResult names are relative to this entry.
     parameters -- A bdec.inspect.param.ExpressionParameters instance, used to
-        calculate the ranges of referenced entries."""
-    result = _handlers[expression.__class__](expression, entry, parameters)
-    return result
+        calculate the ranges of referenced entries. If it is a
+        bdec.inspect.param.CachedParameters instance, the range is only
+        calculated once."""
+    return _memoise(parameters, 'expression range', (expression, entry),
+            _handlers[expression.__class__], expression, entry, parameters)
 
 
 class VariableType:
@@ -150,7 +160,11 @@ class EntryLengthType(IntegerType):
     def __repr__(self):
         return 'len{%s}' % self.entry
 
-    def range(self, parameter):
+    def range(self, parameters):
+        return _memoise(parameters, 'length range', self.entry, self._range,
+                parameters)
+
+    def _range(self, parameter):
         if self.entry.length is None:
             # We don't know how long this entry is.
             # TODO: We could try examining its children...
@@ -173,6 +187,10 @@ class EntryValueType(IntegerType):
         return isinstance(other, EntryValueType) and self.entry is other.entry
 
     def range(self, parameters):
+        return _memoise(parameters, 'value range', self.entry, self._range,
+                parameters)
+
+    def _range(self, parameters):
         if isinstance(self.entry, fld.Field):
             length_range = expression_range(self.entry.length, self.entry, parameters)
             # If our length is of a variable range, it can be very large.
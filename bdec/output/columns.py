@@ -0,0 +1,389 @@
+#   Copyright (C) 2010 Henry Ludemann
+#
+#   This file is part of the bdec decoder library.
+#
+#   The bdec decoder library is free software; you can redistribute it
+#   and/or modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 2.1 of the License, or (at your option) any later version.
+#
+#   The bdec decoder library is distributed in the hope that it will be
+#   useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public
+#   License along with this library; if not, see
+#   <http://www.gnu.org/licenses/>.
+
+"""Decode the items of a sequenceof to columns of values.
+
+Each item of the 'records' sequenceof is a row, and each visible field (or
+sequence with a value) in the item is a column named by its path within the
+item (eg: 'header.width'). The options of a hidden choice share the item's
+columns, so fields with the same name in different options are in the same
+column. Entries within nested sequenceofs aren't included. Unlike the xml
+output, fields with an expected value are included, as they often identify
+the type of a record.
+
+The columns are typed by the field format; integer, float, or text (hex and
+binary fields are text). The rows are decoded in batches of a bounded size,
+which can be written as csv, or to a compact columnar file that can be
+loaded quickly (see load).
+"""
+
+import array
+import csv
+import json
+import struct
+import sys
+
+import bdec.choice as chc
+import bdec.entry as ent
+import bdec.field as fld
+import bdec.sequence as seq
+import bdec.sequenceof as sof
+
+INTEGER = 'integer'
+FLOAT = 'float'
+TEXT = 'text'
+
+_KINDS = {
+        fld.Field.INTEGER : INTEGER,
+        fld.Field.FLOAT : FLOAT,
+        }
+
+# The default number of rows to decode before they are written.
+_BATCH_SIZE = 10000
+
+# The identifier at the start of a columnar file.
+_MAGIC = 'BDECCOL1'
+
+class ColumnError(Exception):
+    """Error raised when a columnar file cannot be loaded."""
+    pass
+
+class Column:
+    """The values of a column, where missing values are None."""
+    def __init__(self, name, kind):
+        self.name = name
+        self.present = array.array('B')
+        self._set_kind(kind)
+
+    def _set_kind(self, kind):
+        self.kind = kind
+        if kind == INTEGER:
+            self.values = array.array('l')
+        elif kind == FLOAT:
+            self.values = array.array('d')
+        else:
+            self.values = []
+
+    def append(self, value):
+        if self.kind == INTEGER:
+            try:
+                self.values.append(value)
+            except (OverflowError, TypeError):
+                # The value doesn't fit in an integer column; the column
+                # holds text from now on.
+                self._to_text()
+                self.append(value)
+                return
+        elif self.kind == FLOAT:
+            self.values.append(value)
+        elif isinstance(value, unicode):
+            self.values.append(value.encode('utf-8'))
+        else:
+            self.values.append(str(value))
+        self.present.append(1)
+
+    def append_null(self):
+        if self.kind == TEXT:
+            self.values.append('')
+        else:
+            self.values.append(0)
+        self.present.append(0)
+
+    def _to_text(self):
+        values = [repr(value).rstrip('L') for value in self.values]
+        self._set_kind(TEXT)
+        self.values = values
+
+    def clear(self):
+        self._set_kind(self.kind)
+        self.present = array.array('B')
+
+    def __len__(self):
+        return len(self.present)
+
+    def __getitem__(self, i):
+        if not self.present[i]:
+            return None
+        value = self.values[i]
+        if self.kind == TEXT:
+            value = value.decode('utf-8')
+        return value
+
+    def __repr__(self):
+        return "%s column '%s'" % (self.kind, self.name)
+
+
+class _Schema:
+    """Find the columns of the items of a sequenceof."""
+    def __init__(self, sequenceof):
+        self.entry = sequenceof
+        self.columns = []
+        self.lookup = {}
+        self._visiting = set()
+        child = sequenceof.children[0]
+        if not ent.is_hidden(child.name):
+            self._add_item(child.entry, child.name)
+
+    def _add(self, path, kind):
+        try:
+            column = self.lookup[path]
+        except KeyError:
+            column = self.lookup[path] = Column(path, kind)
+            self.columns.append(column)
+            return
+        if column.kind != kind:
+            column._set_kind(TEXT)
+
+    def _add_value(self, entry, path):
+        """Add the column for the value of an entry."""
+        if isinstance(entry, fld.Field):
+            self._add(path, _KINDS.get(entry.format, TEXT))
+        elif isinstance(entry, seq.Sequence) and entry.value is not None:
+            self._add(path, INTEGER)
+
+    def _add_item(self, entry, name):
+        """Add the columns for an item (or an option of an item choice)."""
+        if isinstance(entry, chc.Choice):
+            for child in entry.children:
+                if not ent.is_hidden(child.name):
+                    self._add_item(child.entry, child.name)
+        else:
+            self._add_value(entry, name)
+            self._add_children(entry, '')
+
+    def _add_children(self, entry, prefix):
+        if entry in self._visiting or isinstance(entry, sof.SequenceOf):
+            return
+        self._visiting.add(entry)
+        for child in entry.children:
+            if ent.is_hidden(child.name):
+                continue
+            if isinstance(child.entry, chc.Choice):
+                # Choices aren't in the output, so the options are named as
+                # if they were children of the choice's parent.
+                self._add_children(child.entry, prefix)
+            else:
+                path = prefix + child.name
+                self._add_value(child.entry, path)
+                self._add_children(child.entry, path + '.')
+        self._visiting.remove(entry)
+
+
+class _HiddenNames(dict):
+    """Map entry names to whether they are hidden."""
+    def __missing__(self, name):
+        result = self[name] = ent.is_hidden(name)
+        return result
+
+# The state of the open entries while decoding.
+_OUTSIDE, _RECORDS, _IGNORED = range(3)
+
+def batches(decoder, binary, records=None, batch_size=_BATCH_SIZE):
+    """Decode binary data, returning an iterator of batches of columns.
+
+    Each batch is a list of Column instances with at most batch_size rows.
+    The same columns are reused for each batch, so the values must be used
+    before the next batch is requested.
+
+    records -- The name of the sequenceof whose items are the rows. If None,
+      the first visible sequenceof is used.
+    """
+    schema = None
+    rows = 0
+    has_yielded = False
+    hidden_names = _HiddenNames()
+    hidden_count = 0
+    stack = [_OUTSIDE]
+    for is_starting, name, entry, data, value in decoder.decode(binary):
+        # If we have an entry that is hidden, all entries under that should
+        # also be hidden.
+        is_hidden = hidden_names[name]
+        if is_starting:
+            if hidden_count or is_hidden:
+                hidden_count += 1
+        is_hidden = hidden_count != 0
+        if not is_starting and hidden_count:
+            hidden_count -= 1
+
+        if is_hidden or isinstance(entry, chc.Choice):
+            continue
+
+        if is_starting:
+            parent = stack[-1]
+            if parent == _OUTSIDE:
+                if isinstance(entry, sof.SequenceOf) and (
+                        (schema is None and records in (None, name)) or
+                        (schema is not None and entry is schema.entry)):
+                    if schema is None:
+                        schema = _Schema(entry)
+                    stack.append(_RECORDS)
+                else:
+                    stack.append(_OUTSIDE)
+            elif parent == _IGNORED or isinstance(entry, sof.SequenceOf):
+                stack.append(_IGNORED)
+            elif parent == _RECORDS:
+                # A new row; the item's children are named relative to it.
+                stack.append((name, ''))
+            else:
+                path = parent[1] + name
+                stack.append((path, path + '.'))
+        else:
+            frame = stack.pop()
+            if frame in (_OUTSIDE, _RECORDS, _IGNORED):
+                continue
+
+            if value is not None:
+                column = schema.lookup.get(frame[0])
+                if column is not None and len(column) == rows:
+                    column.append(value)
+
+            if stack[-1] == _RECORDS:
+                rows += 1
+                for column in schema.columns:
+                    if len(column) < rows:
+                        column.append_null()
+                if rows >= batch_size:
+                    has_yielded = True
+                    yield schema.columns
+                    for column in schema.columns:
+                        column.clear()
+                    rows = 0
+    if schema is not None and (rows or not has_yielded):
+        yield schema.columns
+
+def _csv_value(column, i):
+    if not column.present[i]:
+        return ''
+    value = column.values[i]
+    if column.kind == FLOAT:
+        return repr(value)
+    return value
+
+def to_csv(decoder, binary, output, records=None, batch_size=_BATCH_SIZE):
+    """Decode binary data, writing the rows as csv.
+
+    The first line contains the column names. Missing values are empty, and
+    text is utf-8 encoded.
+    """
+    writer = csv.writer(output)
+    is_first = True
+    for columns in batches(decoder, binary, records, batch_size):
+        if is_first:
+            writer.writerow([column.name.encode('utf-8') for column in columns])
+            is_first = False
+        if columns:
+            writer.writerows([_csv_value(column, i) for column in columns]
+                    for i in xrange(len(columns[0])))
+
+def _pack(typecode, format, values):
+    """Convert an array of numbers to little endian bytes."""
+    if array.array(typecode).itemsize != struct.calcsize(format) or sys.byteorder != 'little':
+        return struct.pack('<%i%s' % (len(values), format), *values)
+    return array.array(typecode, values).tostring()
+
+def _unpack(typecode, format, text):
+    """Convert little endian bytes to an array of numbers."""
+    if array.array(typecode).itemsize != struct.calcsize(format) or sys.byteorder != 'little':
+        return array.array(typecode, struct.unpack('<%i%s' % (len(text) / struct.calcsize(format), format), text))
+    result = array.array(typecode)
+    result.fromstring(text)
+    return result
+
+def _write_column(column, write):
+    write(column.kind[0])
+    write(column.present.tostring())
+    if column.kind == INTEGER:
+        write(_pack('l', 'q', column.values))
+    elif column.kind == FLOAT:
+        write(_pack('d', 'd', column.values))
+    else:
+        offsets = [0]
+        for value in column.values:
+            offsets.append(offsets[-1] + len(value))
+        write(_pack('l', 'q', offsets))
+        write(''.join(column.values))
+
+def to_file(decoder, binary, output, records=None, batch_size=_BATCH_SIZE):
+    """Decode binary data, writing the rows to a columnar file.
+
+    The file starts with a header naming the columns, followed by the
+    batches of rows. Each batch contains the number of rows, then the kind,
+    presence flags, and values of each column (text columns have a table of
+    offsets into the column's utf-8 text). Numbers are little endian.
+    """
+    write = output.write
+    write(_MAGIC)
+    is_first = True
+    for columns in batches(decoder, binary, records, batch_size):
+        if is_first:
+            header = json.dumps({'columns' : [[c.name, c.kind] for c in columns]})
+            write(struct.pack('<I', len(header)))
+            write(header)
+            is_first = False
+        if columns and len(columns[0]):
+            write(struct.pack('<I', len(columns[0])))
+            for column in columns:
+                _write_column(column, write)
+    if is_first:
+        header = json.dumps({'columns' : []})
+        write(struct.pack('<I', len(header)))
+        write(header)
+
+class _Reader:
+    def __init__(self, input):
+        self._input = input
+
+    def read(self, length):
+        text = self._input.read(length)
+        if len(text) != length:
+            raise ColumnError('Columnar file is truncated')
+        return text
+
+def load(input):
+    """Load the columns written to a columnar file.
+
+    Returns a list of Column instances.
+    """
+    reader = _Reader(input)
+    if reader.read(len(_MAGIC)) != _MAGIC:
+        raise ColumnError('Not a columnar file')
+    length, = struct.unpack('<I', reader.read(4))
+    header = json.loads(reader.read(length))
+    columns = [Column(name, kind) for name, kind in header['columns']]
+    while 1:
+        text = input.read(4)
+        if not text:
+            break
+        if len(text) != 4:
+            raise ColumnError('Columnar file is truncated')
+        rows, = struct.unpack('<I', text)
+        for column in columns:
+            code = reader.read(1)
+            if code != column.kind[0]:
+                # The column was changed to text part way through decoding.
+                column._to_text()
+            column.present.fromstring(reader.read(rows))
+            if column.kind == INTEGER:
+                column.values.extend(_unpack('l', 'q', reader.read(rows * 8)))
+            elif column.kind == FLOAT:
+                column.values.extend(_unpack('d', 'd', reader.read(rows * 8)))
+            else:
+                offsets = _unpack('l', 'q', reader.read((rows + 1) * 8))
+                text = reader.read(offsets[-1])
+                column.values.extend(text[offsets[i]:offsets[i + 1]] for i in xrange(rows))
+    return columns
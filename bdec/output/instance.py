@@ -17,8 +17,7 @@
 #   License along with this library; if not, see
 #   <http://www.gnu.org/licenses/>.
 
-import operator
-
+from bdec.data import join
 from bdec.encode.entry import MissingInstanceError
 import bdec.entry as ent
 import bdec.field as fld
@@ -70,7 +69,11 @@ class _DecodedItem:
             else:
                 result = self._children[0][1]
         elif isinstance(self._entry, sof.SequenceOf):
-            result = list(value for name, value in self._children)
+            if value is not None:
+                # The items were decoded to an array.
+                result = value
+            else:
+                result = list(value for name, value in self._children)
         else:
             if value is not None and not self._children:
                 # This item has no visible children, but has a value; treat it
@@ -86,12 +89,20 @@ class _DecodedItem:
                     result.children[escape(name)] = value
         return result
 
-def decode(decoder, binary):
+def decode(decoder, binary, arrays=False):
     """
     Create a python instance representing the decoded data.
+
+    arrays -- If true, sequenceofs of fixed size integer records are decoded
+        to numpy arrays (see bdec.decode.arrays). 'decoder' must be an
+        entry. Requires numpy.
     """
+    if arrays:
+        events = decoder.decode(binary, arrays=True)
+    else:
+        events = decoder.decode(binary)
     stack = [_DecodedItem(None)]
-    for is_starting, name, entry, data, value in decoder.decode(binary):
+    for is_starting, name, entry, data, value in events:
         if is_starting:
             stack.append(_DecodedItem(entry))
         else:
@@ -128,4 +139,4 @@ def encode(protocol, value):
 
     Returns a bdec.data.Data instance.
     """
-    return reduce(operator.add, protocol.encode(_get_value, {protocol.name: value}))
+    return join(protocol.encode(_get_value, {protocol.name: value}))
@@ -0,0 +1,323 @@
+#   Copyright (C) 2010 Henry Ludemann
+#
+#   This file is part of the bdec decoder library.
+#
+#   The bdec decoder library is free software; you can redistribute it
+#   and/or modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 2.1 of the License, or (at your option) any later version.
+#
+#   The bdec decoder library is distributed in the hope that it will be
+#   useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public
+#   License along with this library; if not, see
+#   <http://www.gnu.org/licenses/>.
+
+"""Convert between binary data and json.
+
+The json has the same structure as the xml output (see bdec.output.xmlout).
+Sequences are json objects keyed by the names of their visible children,
+sequenceofs are arrays of their items, and fields are numbers or strings. An
+item of a sequenceof whose name isn't that of the sequenceof's child (eg: an
+option of a hidden choice) is wrapped in an object keyed by its name. The
+value of a sequence with visible children is included in its object with the
+key '#value'. When children of an object have the same name, the second is
+keyed 'name#2', the third 'name#3', and so on.
+"""
+
+import json
+import math
+from json.encoder import encode_basestring_ascii
+import StringIO
+
+import bdec.choice as chc
+from bdec.constraints import Equals
+from bdec.data import join, write
+import bdec.entry as ent
+import bdec.field as fld
+import bdec.sequence as seq
+import bdec.sequenceof as sof
+
+# The number of pieces of json text to collect before writing to the output.
+_BATCH_SIZE = 10000
+
+# The object key for the values of sequences with visible children.
+_VALUE_KEY = '#value'
+
+# The kinds of json values being written for the open entries.
+_OBJECT, _ARRAY, _VALUE, _RECORDS, _IGNORED = range(5)
+
+class _Keys(dict):
+    """Map entry names to their json object keys, and if they are hidden."""
+    def __missing__(self, name):
+        result = self[name] = (encode_basestring_ascii(name) + ': ', ent.is_hidden(name))
+        return result
+
+class _ExpectedValues(dict):
+    """Map entries to whether they have an expected value."""
+    def __missing__(self, entry):
+        for constraint in entry.constraints:
+            if isinstance(constraint, Equals):
+                result = True
+                break
+        else:
+            result = False
+        self[entry] = result
+        return result
+
+def _duplicate_key(name, count):
+    """Get the object key for a repeated child name."""
+    return '%s#%i' % (name, count)
+
+class _Frame:
+    """The state of an entry whose json value is being written."""
+    def __init__(self, kind, is_wrapped=False, item_name=None):
+        self.kind = kind
+        self.is_wrapped = is_wrapped
+        self.item_name = item_name
+        self.has_children = False
+        self.names = None
+
+def _json_value(value):
+    if isinstance(value, (int, long)):
+        return str(value)
+    elif isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            # Json has no representation for non-finite numbers.
+            return 'null'
+        return repr(value)
+    return encode_basestring_ascii(unicode(value))
+
+def _write_json(decoder, binary, output, verbose, is_ndjson, records):
+    """Decode binary data, writing the json for the decoded entries.
+
+    is_ndjson -- If false, the whole document is written as a single json
+      object. Otherwise the items of the records sequenceof are written one
+      per line.
+    records -- The name of the sequenceof whose items are written as lines.
+      If None, the first visible sequenceof is used.
+    """
+    keys = _Keys()
+    expected_values = _ExpectedValues()
+    pieces = []
+    write = pieces.append
+    if not is_ndjson:
+        stack = [_Frame(_OBJECT)]
+    else:
+        stack = [_Frame(_IGNORED)]
+    records_entry = None
+
+    hidden_count = 0
+    try:
+        for is_starting, name, entry, data, value in decoder.decode(binary):
+            key, is_hidden = keys[name]
+
+            # If we have an entry that is hidden, all entries under that should
+            # also be hidden.
+            if is_starting:
+                if hidden_count or is_hidden:
+                    hidden_count += 1
+            is_hidden = hidden_count != 0
+            if not is_starting and hidden_count:
+                hidden_count -= 1
+
+            if not verbose and (is_hidden or isinstance(entry, chc.Choice)):
+                # By default, we don't output hidden or choice entries.
+                continue
+
+            if is_starting:
+                parent = stack[-1]
+                if parent.kind == _IGNORED:
+                    if entry is records_entry or (records_entry is None and
+                            isinstance(entry, sof.SequenceOf) and
+                            records in (None, name)):
+                        records_entry = entry
+                        stack.append(_Frame(_RECORDS, False, entry.children[0].name))
+                    else:
+                        stack.append(_Frame(_IGNORED))
+                    continue
+
+                is_wrapped = False
+                if parent.kind == _OBJECT:
+                    if parent.has_children:
+                        write(', ')
+                        count = parent.names.get(name, 0) + 1
+                        parent.names[name] = count
+                        if count > 1:
+                            key = encode_basestring_ascii(_duplicate_key(name, count)) + ': '
+                    else:
+                        write('{')
+                        parent.names = {name: 1}
+                    write(key)
+                elif parent.has_children and parent.kind == _ARRAY:
+                    write(', ')
+                if parent.kind in (_ARRAY, _RECORDS) and name != parent.item_name:
+                    is_wrapped = True
+                    write('{')
+                    write(key)
+                parent.has_children = True
+
+                if isinstance(entry, sof.SequenceOf):
+                    write('[')
+                    stack.append(_Frame(_ARRAY, is_wrapped, entry.children[0].name))
+                elif isinstance(entry, fld.Field):
+                    stack.append(_Frame(_VALUE, is_wrapped))
+                else:
+                    stack.append(_Frame(_OBJECT, is_wrapped))
+            else:
+                frame = stack.pop()
+                if frame.kind in (_IGNORED, _RECORDS):
+                    continue
+
+                if frame.kind == _ARRAY:
+                    write(']')
+                elif frame.has_children:
+                    if value is not None and not expected_values[entry]:
+                        write(', %s: %s' % (encode_basestring_ascii(_VALUE_KEY), _json_value(value)))
+                    write('}')
+                elif value is None and frame.kind == _OBJECT:
+                    write('{}')
+                elif value is None or expected_values[entry]:
+                    write('null')
+                else:
+                    write(_json_value(value))
+                if frame.is_wrapped:
+                    write('}')
+
+                if stack[-1].kind == _RECORDS:
+                    write('\n')
+                if len(pieces) > _BATCH_SIZE:
+                    output.write(''.join(pieces))
+                    del pieces[:]
+        if not is_ndjson:
+            if stack[0].has_children:
+                write('}\n')
+            else:
+                write('{}\n')
+    finally:
+        output.write(''.join(pieces))
+
+def to_file(decoder, binary, output, verbose=False):
+    """Decode binary data, writing the json representation to a file.
+
+    The json is written as the data is decoded, so large files can be
+    converted in constant memory. Hidden and choice entries are only included
+    when verbose is true.
+    """
+    _write_json(decoder, binary, output, verbose, False, None)
+
+def to_ndjson(decoder, binary, output, verbose=False, records=None):
+    """Decode binary data, writing each item of a sequenceof as a json line.
+
+    Entries outside of the sequenceof aren't written.
+
+    records -- The name of the sequenceof whose items should be written. If
+      None, the first visible sequenceof is used.
+    """
+    _write_json(decoder, binary, output, verbose, True, records)
+
+def to_string(decoder, binary, verbose=False):
+    buffer = StringIO.StringIO()
+    to_file(decoder, binary, buffer, verbose=verbose)
+    return buffer.getvalue()
+
+
+class _Object(dict):
+    """A json object representing a sequence with a value."""
+    def __int__(self):
+        try:
+            return int(self[_VALUE_KEY])
+        except KeyError:
+            raise TypeError('Sequence has unknown integer value')
+
+class _Item:
+    """An item of a sequenceof to be encoded."""
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+    def __repr__(self):
+        return 'Sequenceof item %s' % self.value
+
+def _duplicate_keys(protocol):
+    """Find the object keys of sequence children with repeated names.
+
+    Returns a dict mapping entries to their key."""
+    result = {}
+    visited = set()
+    stack = [protocol]
+    while stack:
+        entry = stack.pop()
+        if entry in visited:
+            continue
+        visited.add(entry)
+        stack.extend(child.entry for child in entry.children)
+        if not isinstance(entry, seq.Sequence):
+            continue
+        counts = {}
+        for child in entry.children:
+            if ent.is_hidden(child.name) or isinstance(child.entry, chc.Choice):
+                continue
+            count = counts[child.name] = counts.get(child.name, 0) + 1
+            if count > 1:
+                result.setdefault(child.entry, _duplicate_key(child.name, count))
+    return result
+
+class _Query:
+    """Query the values to be encoded from a decoded json document."""
+    def __init__(self, protocol):
+        self._duplicate_keys = _duplicate_keys(protocol)
+
+    def __call__(self, obj, child, offset, name):
+        """Get the value of a named child of a decoded json object."""
+        from bdec.encode.entry import MissingInstanceError
+        if isinstance(obj, _Item):
+            if obj.name == name:
+                value = obj.value
+            else:
+                # The item is wrapped in an object naming it.
+                return self(obj.value, child, offset, name)
+        elif isinstance(obj, dict):
+            try:
+                value = obj[self._duplicate_keys[child]]
+            except KeyError:
+                try:
+                    value = obj[name]
+                except KeyError:
+                    raise MissingInstanceError(obj, child)
+        else:
+            raise MissingInstanceError(obj, child)
+        return self._get_value(value, obj, child)
+
+    def _get_value(self, value, obj, child):
+        from bdec.encode.entry import MissingInstanceError
+
+        if isinstance(child, sof.SequenceOf):
+            if not isinstance(value, list):
+                raise MissingInstanceError(obj, child)
+            item_name = child.children[0].name
+            return [_Item(item_name, item) for item in value]
+        if isinstance(child, seq.Sequence) and child.value and isinstance(value, dict):
+            return _Object(value)
+        return value
+
+def _encode(protocol, jsondata):
+    if isinstance(jsondata, basestring):
+        value = json.loads(jsondata)
+    else:
+        value = json.load(jsondata)
+    return protocol.encode(_Query(protocol), value)
+
+def encode(protocol, jsondata):
+    """Encode a json string or file object to binary data.
+
+    Returns a bdec.data.Data instance of the encoded data.
+    """
+    return join(_encode(protocol, jsondata))
+
+def encode_to_file(protocol, jsondata, output):
+    """Encode a json string or file object, writing the binary data to a file."""
+    write(_encode(protocol, jsondata), output)
@@ -0,0 +1,121 @@
+#   Copyright (C) 2010 Henry Ludemann
+#
+#   This file is part of the bdec decoder library.
+#
+#   The bdec decoder library is free software; you can redistribute it
+#   and/or modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 2.1 of the License, or (at your option) any later version.
+#
+#   The bdec decoder library is distributed in the hope that it will be
+#   useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public
+#   License along with this library; if not, see
+#   <http://www.gnu.org/licenses/>.
+
+#!/usr/bin/env python
+import StringIO
+import unittest
+
+import bdec.choice as chc
+from bdec.constraints import Equals
+import bdec.data as dt
+from bdec.expression import parse
+import bdec.field as fld
+import bdec.output.columns as cols
+import bdec.sequence as seq
+import bdec.sequenceof as sof
+
+def _records(item):
+    return seq.Sequence('records', [
+        fld.Field('count', 8, fld.Field.INTEGER),
+        sof.SequenceOf('items', item, parse('${count}'))])
+
+def _values(columns):
+    return dict((c.name, [c[i] for i in range(len(c))]) for c in columns)
+
+class TestColumns(unittest.TestCase):
+    def test_fields(self):
+        item = seq.Sequence('item', [
+            fld.Field('id', 8, fld.Field.INTEGER),
+            fld.Field('name', 16, fld.Field.TEXT),
+            fld.Field('unused:', 8),
+            fld.Field('flags', 4, fld.Field.HEX),
+            fld.Field('magic', 4, constraints=[Equals(dt.Data('\x05', 4, 8))])])
+        batches = list(cols.batches(_records(item), dt.Data('\x02\x01ab\x00\xf5\x02cd\x00\x35')))
+        self.assertEqual(1, len(batches))
+        self.assertEqual(['id', 'name', 'flags', 'magic'], [c.name for c in batches[0]])
+        self.assertEqual([cols.INTEGER, cols.TEXT, cols.TEXT, cols.TEXT], [c.kind for c in batches[0]])
+        self.assertEqual({'id':[1, 2], 'name':['ab', 'cd'], 'flags':['f', '3'],
+            'magic':['0101', '0101']}, _values(batches[0]))
+
+    def test_nested_paths(self):
+        item = seq.Sequence('item', [
+            seq.Sequence('header', [fld.Field('width', 8, fld.Field.INTEGER)]),
+            sof.SequenceOf('nested', fld.Field('ignored', 8), 1)])
+        batches = list(cols.batches(_records(item), dt.Data('\x01\x07\x08')))
+        self.assertEqual({'header.width':[7]}, _values(batches[0]))
+
+    def test_choice_options(self):
+        a = seq.Sequence('a', [fld.Field('type', 8, fld.Field.INTEGER, constraints=[Equals(1)]),
+            fld.Field('length', 8, fld.Field.INTEGER)])
+        b = seq.Sequence('b', [fld.Field('type', 8, fld.Field.INTEGER),
+            fld.Field('length', 8, fld.Field.INTEGER),
+            fld.Field('value', 8, fld.Field.INTEGER)])
+        data = dt.Data('\x03\x01\x05\x02\x06\x09\x01\x07')
+        batches = list(cols.batches(_records(chc.Choice('item', [a, b])), data))
+        self.assertEqual({'type':[1, 2, 1], 'length':[5, 6, 7],
+            'value':[None, 9, None]}, _values(batches[0]))
+
+    def test_named_records(self):
+        spec = seq.Sequence('a', [
+            sof.SequenceOf('cats', fld.Field('cat', 8, fld.Field.INTEGER), 1),
+            sof.SequenceOf('dogs', fld.Field('dog', 8, fld.Field.INTEGER), 2)])
+        batches = list(cols.batches(spec, dt.Data('\x01\x02\x03'), records='dogs'))
+        self.assertEqual({'dog':[2, 3]}, _values(batches[0]))
+
+    def test_batch_size(self):
+        item = fld.Field('id', 8, fld.Field.INTEGER)
+        data = dt.Data('\x05' + ''.join(chr(i) for i in range(5)))
+        sizes = [len(batch[0]) for batch in cols.batches(_records(item), data, batch_size=2)]
+        self.assertEqual([2, 2, 1], sizes)
+
+    def test_csv(self):
+        item = seq.Sequence('item', [
+            fld.Field('id', 8, fld.Field.INTEGER),
+            fld.Field('name', 16, fld.Field.TEXT, encoding='latin-1')])
+        output = StringIO.StringIO()
+        cols.to_csv(_records(item), dt.Data('\x02\x01a,\x02\xe9b'), output)
+        self.assertEqual('id,name\r\n1,"a,"\r\n2,\xc3\xa9b\r\n', output.getvalue())
+
+    def test_columnar_file(self):
+        item = seq.Sequence('item', [
+            fld.Field('id', 8, fld.Field.INTEGER),
+            fld.Field('ratio', 32, fld.Field.FLOAT),
+            fld.Field('name', 16, fld.Field.TEXT)])
+        data = dt.Data('\x03' + '\x01\x3f\x80\x00\x00ab' +
+                '\x02\x40\x00\x00\x00cd' + '\x03\x40\x40\x00\x00ef')
+        output = StringIO.StringIO()
+        cols.to_file(_records(item), data, output, batch_size=2)
+        columns = cols.load(StringIO.StringIO(output.getvalue()))
+        self.assertEqual([cols.INTEGER, cols.FLOAT, cols.TEXT], [c.kind for c in columns])
+        self.assertEqual({'id':[1, 2, 3], 'ratio':[1.0, 2.0, 3.0],
+            'name':['ab', 'cd', 'ef']}, _values(columns))
+
+    def test_large_integers(self):
+        item = fld.Field('id', 72, fld.Field.INTEGER)
+        data = dt.Data('\x02' + '\x00' * 8 + '\x01' + '\x01' + '\x00' * 8)
+        output = StringIO.StringIO()
+        cols.to_file(_records(item), data, output, batch_size=1)
+        columns = cols.load(StringIO.StringIO(output.getvalue()))
+        self.assertEqual({'id':['1', str(1 << 64)]}, _values(columns))
+
+    def test_truncated_file(self):
+        item = fld.Field('id', 8, fld.Field.INTEGER)
+        output = StringIO.StringIO()
+        cols.to_file(_records(item), dt.Data('\x01\x01'), output)
+        truncated = StringIO.StringIO(output.getvalue()[:-1])
+        self.assertRaises(cols.ColumnError, cols.load, truncated)
@@ -0,0 +1,142 @@
+#   Copyright (C) 2010 Henry Ludemann
+#
+#   This file is part of the bdec decoder library.
+#
+#   The bdec decoder library is free software; you can redistribute it
+#   and/or modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 2.1 of the License, or (at your option) any later version.
+#
+#   The bdec decoder library is distributed in the hope that it will be
+#   useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public
+#   License along with this library; if not, see
+#   <http://www.gnu.org/licenses/>.
+
+#!/usr/bin/env python
+import json
+import StringIO
+import unittest
+
+import bdec.choice as chc
+from bdec.constraints import ConstraintError, Equals
+import bdec.data as dt
+from bdec.encode.entry import MissingInstanceError
+from bdec.expression import parse
+import bdec.field as fld
+import bdec.output.jsonout as jsonout
+import bdec.sequence as seq
+import bdec.sequenceof as sof
+
+class TestJson(unittest.TestCase):
+    def test_field(self):
+        field = fld.Field("bob", 8)
+        text = jsonout.to_string(field, dt.Data.from_hex('8e'))
+        self.assertEqual('{"bob": "10001110"}\n', text)
+
+    def test_sequence(self):
+        sequence = seq.Sequence("bob", [
+            fld.Field("cat:", 8, fld.Field.INTEGER),
+            fld.Field("dog", 24, fld.Field.TEXT),
+            fld.Field("rat", 8, fld.Field.INTEGER)])
+        text = jsonout.to_string(sequence, dt.Data.from_hex('6e7a697007'))
+        self.assertEqual('{"bob": {"dog": "zip", "rat": 7}}\n', text)
+
+    def test_escaped_text(self):
+        field = fld.Field("bob", 32, fld.Field.TEXT, encoding='latin-1')
+        text = jsonout.to_string(field, dt.Data('a"\n\xe9'))
+        self.assertEqual(u'a"\n\xe9', json.loads(text)['bob'])
+        self.assertEqual('a"\n\xe9', jsonout.encode(field, text).bytes())
+
+    def test_expected_value(self):
+        sequence = seq.Sequence("bob", [
+            fld.Field("cat", 8, constraints=[Equals(dt.Data('c'))]),
+            fld.Field("dog", 8, fld.Field.INTEGER)])
+        text = jsonout.to_string(sequence, dt.Data('c\x05'))
+        self.assertEqual('{"bob": {"cat": null, "dog": 5}}\n', text)
+        self.assertEqual('c\x05', jsonout.encode(sequence, text).bytes())
+
+    def test_sequenceof(self):
+        sequenceof = sof.SequenceOf("bob", fld.Field("cat", 8, fld.Field.INTEGER), 3)
+        text = jsonout.to_string(sequenceof, dt.Data('\x01\x02\x03'))
+        self.assertEqual('{"bob": [1, 2, 3]}\n', text)
+        self.assertEqual('\x01\x02\x03', jsonout.encode(sequenceof, text).bytes())
+
+    def test_sequenceof_choice(self):
+        # The hidden choice isn't output, so the options are named.
+        a = fld.Field('a', 8, fld.Field.INTEGER, constraints=[Equals(1)])
+        b = fld.Field('b', 8, fld.Field.INTEGER)
+        sequenceof = sof.SequenceOf('bob', chc.Choice('cat', [a, b]), 3)
+        text = jsonout.to_string(sequenceof, dt.Data('\x01\x07\x01'))
+        self.assertEqual('{"bob": [{"a": null}, {"b": 7}, {"a": null}]}\n', text)
+        self.assertEqual('\x01\x07\x01', jsonout.encode(sequenceof, text).bytes())
+
+    def test_sequence_value(self):
+        sequence = seq.Sequence('bob', [
+            fld.Field('cat', 8, fld.Field.INTEGER),
+            fld.Field('dog:', 8, fld.Field.INTEGER)],
+            value=parse('${dog:} + 1'))
+        text = jsonout.to_string(sequence, dt.Data('\x01\x02'))
+        self.assertEqual('{"bob": {"cat": 1, "#value": 3}}\n', text)
+        self.assertEqual('\x01\x02', jsonout.encode(sequence, text).bytes())
+
+    def test_duplicate_names(self):
+        sequence = seq.Sequence('a', [
+            fld.Field('x', 8, fld.Field.INTEGER),
+            fld.Field('x', 8, fld.Field.INTEGER),
+            fld.Field('x', 8, fld.Field.INTEGER)])
+        text = jsonout.to_string(sequence, dt.Data('\x01\x02\x03'))
+        self.assertEqual('{"a": {"x": 1, "x#2": 2, "x#3": 3}}\n', text)
+        self.assertEqual({'x':1, 'x#2':2, 'x#3':3}, json.loads(text)['a'])
+        self.assertEqual('\x01\x02\x03', jsonout.encode(sequence, text).bytes())
+
+    def test_non_finite_float(self):
+        field = fld.Field('a', 32, fld.Field.FLOAT)
+        text = jsonout.to_string(field, dt.Data('\x7f\xc0\x00\x00'))
+        self.assertEqual('{"a": null}\n', text)
+        text = jsonout.to_string(field, dt.Data('\x3f\x80\x00\x00'))
+        self.assertEqual('{"a": 1.0}\n', text)
+
+    def test_verbose(self):
+        sequence = seq.Sequence("bob", [
+            fld.Field("cat:", 8, fld.Field.INTEGER),
+            fld.Field("dog", 24, fld.Field.TEXT)])
+        text = jsonout.to_string(sequence, dt.Data.from_hex('6d7a6970'), verbose=True)
+        self.assertEqual('{"bob": {"cat:": 109, "dog": "zip"}}\n', text)
+        self.assertEqual("mzip", jsonout.encode(sequence, text).bytes())
+
+    def test_ndjson(self):
+        item = seq.Sequence('item', [fld.Field('a', 8, fld.Field.INTEGER),
+            fld.Field('b', 8, fld.Field.INTEGER)])
+        spec = seq.Sequence('bob', [fld.Field('count', 8, fld.Field.INTEGER),
+            sof.SequenceOf('items', item, parse('${count}'))])
+        output = StringIO.StringIO()
+        jsonout.to_ndjson(spec, dt.Data('\x02\x01\x02\x03\x04'), output)
+        self.assertEqual('{"a": 1, "b": 2}\n{"a": 3, "b": 4}\n', output.getvalue())
+
+    def test_ndjson_named_records(self):
+        spec = seq.Sequence('bob', [
+            sof.SequenceOf('cats', fld.Field('cat', 8, fld.Field.INTEGER), 1),
+            sof.SequenceOf('dogs', fld.Field('dog', 8, fld.Field.INTEGER), 2)])
+        output = StringIO.StringIO()
+        jsonout.to_ndjson(spec, dt.Data('\x01\x02\x03'), output, records='dogs')
+        self.assertEqual('2\n3\n', output.getvalue())
+
+    def test_output_before_decode_error(self):
+        spec = seq.Sequence('a', [fld.Field('b', 8, fld.Field.INTEGER),
+            fld.Field('c', 8, constraints=[Equals(dt.Data('c'))])])
+        output = StringIO.StringIO()
+        self.assertRaises(ConstraintError, jsonout.to_file, spec,
+                dt.Data('\x05d'), output)
+        self.assertEqual('{"a": {"b": 5, "c": ', output.getvalue())
+
+    def test_encode_missing_entry(self):
+        spec = seq.Sequence('a', [fld.Field('b', 8, fld.Field.INTEGER),
+            fld.Field('c', 8, fld.Field.INTEGER)])
+        output = StringIO.StringIO()
+        self.assertRaises(MissingInstanceError, jsonout.encode_to_file, spec,
+                '{"a": {"b": 5}}', output)
+        self.assertEqual('\x05', output.getvalue())
@@ -18,11 +18,13 @@
 #   <http://www.gnu.org/licenses/>.
 
 #!/usr/bin/env python
+import StringIO
 import unittest
 
 import bdec.choice as chc
-from bdec.constraints import Equals
+from bdec.constraints import ConstraintError, Equals
 import bdec.data as dt
+from bdec.encode.entry import MissingInstanceError
 import bdec.entry as ent
 from bdec.expression import parse
 import bdec.field as fld
@@ -99,6 +101,31 @@ class TestXml(unittest.TestCase):
         text = xml.to_string(spec, dt.Data('\x00'), verbose=True)
         self.assertEqual('<blah>\n    <_hidden><!-- hex (1 bytes): 00 --></_hidden>\n</blah>\n', text)
 
+    def test_escaped_text(self):
+        spec = fld.Field('a', 48, fld.Field.TEXT)
+        text = xml.to_string(spec, dt.Data('\x01<&>\t\x1f'))
+        self.assertEqual('<a>?&lt;&amp;&gt;\t?</a>\n', text)
+
+    def test_unencodable_text(self):
+        spec = fld.Field('a', 16, fld.Field.TEXT, encoding='utf-8')
+        buffer = StringIO.StringIO()
+        xml.to_file(spec, dt.Data('\xc3\xa9'), buffer, encoding='ascii')
+        self.assertEqual('<a>&#233;</a>\n', buffer.getvalue())
+
+    def test_large_sequenceof(self):
+        # The output is written in batches; test the output is written
+        # correctly when it crosses several batches.
+        spec = sof.SequenceOf('a', fld.Field('b', 8, fld.Field.INTEGER), 10000)
+        text = xml.to_string(spec, dt.Data('\x07' * 10000))
+        self.assertEqual('<a>' + '\n    <b>7</b>' * 10000 + '\n</a>\n', text)
+
+    def test_output_before_decode_error(self):
+        spec = seq.Sequence('a', [fld.Field('b', 8, fld.Field.INTEGER),
+            fld.Field('c', 8, fld.Field.INTEGER, constraints=[Equals(1)])])
+        buffer = StringIO.StringIO()
+        self.assertRaises(ConstraintError, xml.to_file, spec, dt.Data('\x05\x02'), buffer)
+        self.assertEqual('<a>\n    <b>5</b>\n    <c>', buffer.getvalue())
+
     def test_field_with_expected_value(self):
         a = fld.Field('a', 8, fld.Field.INTEGER, constraints=[Equals(0)])
         spec = seq.Sequence('blah', [a])
@@ -144,6 +171,38 @@ class TestXml(unittest.TestCase):
                 value=parse('${b}'))
         self.assertEqual('\x05', xml.encode(a, '<a><b>5</b>5</a>').bytes())
 
+    def test_encode_large_sequenceof(self):
+        # The xml is parsed in sections; test encoding a document larger than
+        # a single section.
+        spec = sof.SequenceOf('a', fld.Field('b', 8, fld.Field.INTEGER), 20000)
+        text = '<a>' + '<b>7</b>' * 20000 + '</a>'
+        self.assertEqual('\x07' * 20000, xml.encode(spec, StringIO.StringIO(text)).bytes())
+
+    def test_encode_sequenceof_in_choice(self):
+        # The first option fails on the second item, so the choice has to
+        # encode the items again.
+        a = sof.SequenceOf('items', fld.Field('x', 8, fld.Field.INTEGER, constraints=[Equals(1)]), 2)
+        b = sof.SequenceOf('items', fld.Field('x', 16, fld.Field.INTEGER), 2)
+        spec = chc.Choice('c', [a, b])
+        data = xml.encode(spec, '<items><x>1</x><x>2</x></items>')
+        self.assertEqual('\x00\x01\x00\x02', data.bytes())
+
+    def test_encode_to_file(self):
+        spec = seq.Sequence('a', [fld.Field('b', 8, fld.Field.INTEGER),
+            fld.Field('c', 4, fld.Field.INTEGER)])
+        output = StringIO.StringIO()
+        xml.encode_to_file(spec, '<a><b>5</b><c>15</c></a>', output)
+        self.assertEqual('\x05\xf0', output.getvalue())
+
+    def test_encode_to_file_error(self):
+        # The data encoded before the error should have been written.
+        spec = seq.Sequence('a', [fld.Field('b', 8, fld.Field.INTEGER),
+            fld.Field('c', 8, fld.Field.INTEGER)])
+        output = StringIO.StringIO()
+        self.assertRaises(MissingInstanceError, xml.encode_to_file, spec,
+                '<a><b>5</b></a>', output)
+        self.assertEqual('\x05', output.getvalue())
+
     def test_sequenceof_choice(self):
         a = sof.SequenceOf('a', chc.Choice('b', [
                 fld.Field('b1', length=8, constraints=[Equals(3)]),
@@ -17,19 +17,18 @@
 #   License along with this library; if not, see
 #   <http://www.gnu.org/licenses/>.
 
+import codecs
+import collections
 import logging
-import operator
+import re
 import string
 import StringIO
-import xml.dom.minidom
-import xml.sax.saxutils
-import xml.sax.xmlreader
+import xml.parsers.expat
 
 from bdec.constraints import Equals
-from bdec.encode.entry import MissingInstanceError
 import bdec.entry as ent
 import bdec.choice as chc
-from bdec.data import Data
+from bdec.data import join, write
 import bdec.field as fld
 from bdec.sequence import Sequence
 import bdec.sequenceof as sof
@@ -41,33 +40,21 @@ def escape_name(name):
         name = '_' + name
     return name.replace(' ', '-').replace('(', '_').replace(')', '_').replace(':', '_').replace('/', '_')
 
-class _XMLGenerator(xml.sax.saxutils.XMLGenerator):
-    def comment(self, text):
-        self._out.write('<!-- %s -->' % text)
-
 class UnknownIntegerError(Exception):
     def __str__(self):
         return 'Sequence has unknown integer value'
 
-def _unknown_integer_error():
-    raise UnknownIntegerError()
-
-def _escape_char(character):
-    # The list of 'safe' xml characters is from http://www.w3.org/TR/REC-xml/#NT-Char
-    ordinal = ord(character)
-    if ordinal >= 0x20:
-        return character
-    if ordinal in [0x9, 0xa, 0xd]:
-        return character
-    return '?'
+# The list of 'safe' xml characters is from http://www.w3.org/TR/REC-xml/#NT-Char
+_INVALID_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
 
 def xml_strip(text):
     """Replace chracters that cannot be represented in xml."""
-    return ''.join(_escape_char(char) for char in text)
+    return _INVALID_CHARS.sub('?', text)
 
-def _print_whitespace(handler, offset):
-    handler.ignorableWhitespace('\n')
-    handler.ignorableWhitespace(' ' * offset)
+def _escape_text(text):
+    """Escape a string to be included as xml character data."""
+    return _INVALID_CHARS.sub('?', text).replace('&', '&amp;') \
+            .replace('>', '&gt;').replace('<', '&lt;')
 
 def _has_expected_value(entry):
     for constraint in entry.constraints:
@@ -75,130 +62,333 @@ def _has_expected_value(entry):
             return True
     return False
 
+# The number of pieces of xml text to collect before writing to the output.
+_BATCH_SIZE = 10000
+
+class _Tags(dict):
+    """Map entry names to their xml start and end tags, and if they are hidden."""
+    def __missing__(self, name):
+        escaped = escape_name(name)
+        result = self[name] = (u'<%s>' % escaped, u'</%s>' % escaped, ent.is_hidden(name))
+        return result
+
+class _Indents(dict):
+    """Map an offset to the whitespace preceding elements at that offset."""
+    def __missing__(self, offset):
+        result = self[offset] = u'\n' + u' ' * offset
+        return result
+
+class _ExpectedValues(dict):
+    """Map entries to whether they have an expected value."""
+    def __missing__(self, entry):
+        result = self[entry] = _has_expected_value(entry)
+        return result
+
 def to_file(decoder, binary, output, encoding="utf-8", verbose=False):
-    handler = _XMLGenerator(output, encoding)
+    """Decode binary data, writing the xml representation to a file.
+
+    The xml is collected and written to the output in batches; any xml
+    generated before a decode error is written before the error is raised.
+    """
+    encode = codecs.getincrementalencoder(encoding)('xmlcharrefreplace').encode
+    tags = _Tags()
+    indents = _Indents()
+    expected_values = _ExpectedValues()
+    pieces = []
+    write = pieces.append
+
     offset = 0
     is_first = True
     hidden_count = 0
     has_children = False
-    for is_starting, name, entry, data, value in decoder.decode(binary):
-        # If we have an entry that is hidden, all entries under that should
-        # also be hidden.
-        if is_starting:
-            if hidden_count or ent.is_hidden(name):
-                hidden_count += 1
-        is_hidden = hidden_count != 0
-        if not is_starting and hidden_count:
-            hidden_count -= 1
-
-        if not verbose and (is_hidden or isinstance(entry, chc.Choice)):
-            # By default, we don't output hidden or choice entries.
-            continue
-
-        if is_starting:
-            if not is_first:
-                _print_whitespace(handler, offset)
-            is_first = False
-
-            handler.startElement(escape_name(name), xml.sax.xmlreader.AttributesImpl({}))
-            offset = offset + 4
-            has_children = False
-        else:
-            # An element is ending; we only include the surrounding whitespace
-            # if the entry has visible children (otherwise we try an keep the
-            # value compact with the entries). This means strings with leading
-            # and trailing whitespace can be represented (and produces nicer
-            # xml).
-            if value is not None and not _has_expected_value(entry):
+    try:
+        for is_starting, name, entry, data, value in decoder.decode(binary):
+            start, end, is_hidden = tags[name]
+
+            # If we have an entry that is hidden, all entries under that should
+            # also be hidden.
+            if is_starting:
+                if hidden_count or is_hidden:
+                    hidden_count += 1
+            is_hidden = hidden_count != 0
+            if not is_starting and hidden_count:
+                hidden_count -= 1
+
+            if not verbose and (is_hidden or isinstance(entry, chc.Choice)):
+                # By default, we don't output hidden or choice entries.
+                continue
+
+            if is_starting:
+                if not is_first:
+                    write(indents[offset])
+                is_first = False
+
+                write(start)
+                offset = offset + 4
+                has_children = False
+            else:
+                # An element is ending; we only include the surrounding whitespace
+                # if the entry has visible children (otherwise we try an keep the
+                # value compact with the entries). This means strings with leading
+                # and trailing whitespace can be represented (and produces nicer
+                # xml).
+                if value is not None and not expected_values[entry]:
+                    if has_children:
+                        write(indents[offset])
+                    write(_escape_text(unicode(value)))
+
+                if verbose and data:
+                    write(u'<!-- %s -->' % str(data))
+                offset = offset - 4
                 if has_children:
-                    _print_whitespace(handler, offset)
-
-                text = xml_strip(unicode(value))
-                handler.characters(text)
-
-            if verbose and data:
-                handler.comment(str(data))
-            offset = offset - 4
-            if has_children:
-                _print_whitespace(handler, offset)
-            handler.endElement(escape_name(name))
+                    write(indents[offset])
+                write(end)
 
-            has_children = True
-    handler.ignorableWhitespace('\n')
+                has_children = True
+                if len(pieces) > _BATCH_SIZE:
+                    output.write(encode(u''.join(pieces)))
+                    del pieces[:]
+        write(u'\n')
+    finally:
+        output.write(encode(u''.join(pieces)))
 
 def to_string(decoder, binary, verbose=False):
     buffer  = StringIO.StringIO()
     to_file(decoder, binary, buffer, verbose=verbose)
     return buffer.getvalue()
 
-class _SequenceOfEntry:
-    """A class to iterate over xml children entries from a sequenceof. """
-    def __init__(self, node):
-        self.childNodes = [node]
+# The number of bytes of xml to parse at a time when encoding.
+_READ_SIZE = 65536
+
+class _Element:
+    """An xml element whose contents are parsed as they are queried."""
+    def __init__(self, reader, name):
+        self.tagName = name
+        self.is_complete = False
+        self.has_children = False
+        self.children = []
+        self._reader = reader
+        self._text = []
+        self._named = {}
+
+    def add_child(self, child):
+        self.has_children = True
+        self.children.append(child)
+        if self._named is not None:
+            try:
+                self._named[child.tagName].append(child)
+            except KeyError:
+                self._named[child.tagName] = [child]
+
+    def add_text(self, text):
+        if self._text is not None:
+            self._text.append(text)
+
+    def read(self):
+        """Parse more of the document."""
+        self._reader.read()
+
+    def find(self, name):
+        """Return the first child element with the given name, or None."""
+        while 1:
+            try:
+                return self._named[name][0]
+            except KeyError:
+                if self.is_complete:
+                    return None
+                self.read()
+
+    def text(self):
+        """Get the text content of the element."""
+        while not self.is_complete:
+            self.read()
+        return ''.join(self._text)
+
+    def get_integer(self):
+        text = self.text()
+        if not text.strip():
+            raise UnknownIntegerError()
+        return int(text)
+
+    def discard_children(self):
+        """Discard child elements once they have been removed.
+
+        The children can no longer be found by name, and the element's text
+        is no longer available."""
+        self.children = collections.deque(self.children)
+        self._named = None
+        self._text = None
 
     def __repr__(self):
-        return 'Sequenceof node %s' % self.childNodes[0]
-
+        return "<xml element '%s'>" % self.tagName
 
-def _query_element(obj, child, offset, name):
-    """
-    Get a named child-element of a node.
 
-    If the child has no sub-elements itself, return the element text contents.
-    """
-    try:
-        childNodes = obj.childNodes
-    except AttributeError:
-        raise MissingInstanceError(obj, child)
-
-    name = escape_name(name)
-    for child_node in childNodes:
-        if child_node.nodeType == xml.dom.Node.ELEMENT_NODE and child_node.tagName == name:
-            return _get_element_value(child_node, child)
-
-    raise MissingInstanceError(obj, child)
-
-def _get_element_value(element, entry):
-    """Get an instance that can be encoded for a given xml element node.
+class _SequenceOfEntry:
+    """An item in a sequenceof, whose only child is the item element."""
+    def __init__(self, element):
+        self.element = element
 
-    element -- The xml element to be encoded.
-    entry -- The entry this element represents.
-    """
-    if isinstance(entry, sof.SequenceOf):
-        # This element represents a sequence of, so we'll return an
-        # object to iterate over the children.
-        return list(_SequenceOfEntry(n) for n in element.childNodes if n.nodeType == xml.dom.Node.ELEMENT_NODE)
+    def find(self, name):
+        if self.element.tagName == name:
+            return self.element
+        return None
 
-    text = ""
-    has_children = False
-    for child in element.childNodes:
-        if child.nodeType == xml.dom.Node.ELEMENT_NODE:
-            has_children = True
-        elif child.nodeType == xml.dom.Node.TEXT_NODE:
-            text += child.data
-
-    if isinstance(entry, Sequence) and entry.value:
-        if text.strip():
-            element.__int__ = lambda: int(text)
+    def __repr__(self):
+        return 'Sequenceof node %s' % self.element
+
+
+class _SequenceOfItems:
+    """Iterate over the items in a sequenceof element as they are parsed."""
+    def __init__(self, element, should_discard):
+        self._element = element
+        self._should_discard = should_discard
+        if should_discard:
+            element.discard_children()
+
+    def __iter__(self):
+        element = self._element
+        if self._should_discard:
+            # Each item is discarded once the next item is requested; by then
+            # the previous item has been encoded.
+            while 1:
+                while not element.children and not element.is_complete:
+                    element.read()
+                if not element.children:
+                    break
+                yield _SequenceOfEntry(element.children[0])
+                element.children.popleft()
         else:
-            element.__int__ = _unknown_integer_error
-
-    if has_children:
-        # This element has sub-elements, so return the high-level element
-        # itself.
-        return element
-
-    # No sub-elements; this element is a 'value' type.
-    return text
+            i = 0
+            while 1:
+                while len(element.children) <= i and not element.is_complete:
+                    element.read()
+                if len(element.children) <= i:
+                    break
+                yield _SequenceOfEntry(element.children[i])
+                i += 1
+
+
+class _XmlReader:
+    """Parse an xml document incrementally as its elements are required."""
+    def __init__(self, source):
+        self._source = source
+        self._parser = xml.parsers.expat.ParserCreate()
+        self._parser.buffer_text = True
+        self._parser.StartElementHandler = self._start_element
+        self._parser.EndElementHandler = self._end_element
+        self._parser.CharacterDataHandler = self._characters
+        self._parser.StartCdataSectionHandler = self._start_cdata
+        self._parser.EndCdataSectionHandler = self._end_cdata
+        self._is_cdata = False
+        self.document = _Element(self, None)
+        self._open = [self.document]
+
+    def read(self):
+        data = self._source.read(_READ_SIZE)
+        self._parser.Parse(data, not data)
+        if not data:
+            self.document.is_complete = True
+
+    def _start_element(self, name, attributes):
+        element = _Element(self, name)
+        self._open[-1].add_child(element)
+        self._open.append(element)
+
+    def _end_element(self, name):
+        self._open.pop().is_complete = True
+
+    def _characters(self, text):
+        # Text in CDATA sections isn't included in an element's text.
+        if not self._is_cdata:
+            self._open[-1].add_text(text)
+
+    def _start_cdata(self):
+        self._is_cdata = True
+
+    def _end_cdata(self):
+        self._is_cdata = False
+
+
+def _choice_entries(entry):
+    """Return the entries that can be encoded within a choice.
+
+    A choice may encode its options several times, so the values of these
+    entries have to be kept until the whole choice has been encoded."""
+    def reachable(entries):
+        result = set()
+        stack = list(entries)
+        while stack:
+            entry = stack.pop()
+            if entry not in result:
+                result.add(entry)
+                stack.extend(child.entry for child in entry.children)
+        return result
+    choices = [e for e in reachable([entry]) if isinstance(e, chc.Choice)]
+    return reachable(child.entry for choice in choices for child in choice.children)
+
+class _Query:
+    """Query the values to be encoded from a streamed xml document."""
+    def __init__(self, protocol):
+        self._choice_entries = _choice_entries(protocol)
+
+    def __call__(self, obj, child, offset, name):
+        """
+        Get a named child-element of a node.
+
+        If the child has no sub-elements itself, return the element text contents.
+        """
+        from bdec.encode.entry import MissingInstanceError
+        if not isinstance(obj, (_Element, _SequenceOfEntry)):
+            raise MissingInstanceError(obj, child)
+        element = obj.find(escape_name(name))
+        if element is None:
+            raise MissingInstanceError(obj, child)
+        return self._get_element_value(element, child)
+
+    def _get_element_value(self, element, entry):
+        """Get an instance that can be encoded for a given xml element.
+
+        element -- The xml element to be encoded.
+        entry -- The entry this element represents.
+        """
+        if isinstance(entry, sof.SequenceOf):
+            # This element represents a sequence of, so we'll return an
+            # object to iterate over the children. Unless a choice may need to
+            # encode them again, the items are discarded once encoded.
+            return _SequenceOfItems(element, entry not in self._choice_entries)
+
+        while not element.has_children and not element.is_complete:
+            element.read()
+        if isinstance(entry, Sequence) and entry.value:
+            element.__int__ = element.get_integer
+
+        if element.has_children:
+            # This element has sub-elements, so return the high-level element
+            # itself.
+            return element
+
+        # No sub-elements; this element is a 'value' type.
+        return element.text()
+
+def _encode(protocol, xmldata):
+    if isinstance(xmldata, basestring):
+        xmldata = StringIO.StringIO(xmldata)
+    reader = _XmlReader(xmldata)
+    return protocol.encode(_Query(protocol), reader.document)
 
 def encode(protocol, xmldata):
     """
     Encode an xml string or file object to binary data.
 
-    Returns an iterator to data objects representing the encoded structure.
+    Returns a bdec.data.Data instance of the encoded data.
     """
-    if isinstance(xmldata, basestring):
-        xmldata = StringIO.StringIO(xmldata)
-    document = xml.dom.minidom.parse(xmldata)
-    return reduce(operator.add, protocol.encode(_query_element, document), Data())
+    return join(_encode(protocol, xmldata))
 
+def encode_to_file(protocol, xmldata, output):
+    """Encode an xml string or file object, writing the binary data to a file.
+
+    The xml is parsed as it is encoded, and the binary data written as it is
+    generated, so large documents don't have to be held in memory. Any data
+    encoded before an error is found will have been written to the output.
+    """
+    write(_encode(protocol, xmldata), output)
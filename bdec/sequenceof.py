@@ -74,8 +74,8 @@ class SequenceOf(bdec.entry.Entry):
         self.count = count
         self.end_entries = end_entries
 
-    def _validate(self):
-        bdec.entry.Entry._validate(self)
+    def _validate(self, arrays=False):
+        bdec.entry.Entry._validate(self, arrays)
         for entry in self.end_entries:
             assert isinstance(entry, bdec.entry.Entry), "%s isn't an entry instance!" % str(entry)
 
@@ -17,9 +17,17 @@
 #   License along with this library; if not, see
 #   <http://www.gnu.org/licenses/>.
 
+import cPickle
+import hashlib
+import os
 import os.path
+import stat
 from StringIO import StringIO
 
+# The environment variable naming the directory used to cache loaded
+# specifications when load_specs isn't passed a cache directory.
+CACHE_DIR_VARIABLE = 'BDEC_CACHE_DIR'
+
 class LoadError(Exception):
     """Base class for all loading errors."""
     pass
@@ -117,18 +125,112 @@ def _resolve(decoder, references, lookup, should_remove_unused):
     return decoder, common
 
 def _load_spec(filename, contents, format, references):
-    import bdec.spec.asn1 as asn1
-    import bdec.spec.xmlspec as xmlspec
-    loaders = {'xml':xmlspec, 'asn1':asn1}
-    try:
-        loader = loaders[format]
-    except KeyError:
+    # The loaders are only imported when they are used; the asn1 loader in
+    # particular is slow to import.
+    if format == 'xml':
+        import bdec.spec.xmlspec as loader
+    elif format == 'asn1':
+        import bdec.spec.asn1 as loader
+    else:
         raise LoadError("Unknown specification format '%s'!" % filename)
 
     decoder, lookup = loader.load(filename, contents, references)
     return decoder, lookup
 
-def load_specs(specs, main_name=None, should_remove_unused=False):
+def _cache_key(specs, main_name, should_remove_unused):
+    """Create the cache key for a list of (filename, contents, format) specs.
+
+    The key is a hash of the contents of the specifications, the options
+    used to load them, and the bdec version."""
+    import bdec
+    key = hashlib.sha1()
+    key.update(repr((bdec.__version__, main_name, should_remove_unused)))
+    for filename, contents, format in specs:
+        if isinstance(contents, unicode):
+            contents = contents.encode('utf-8')
+        key.update(repr((filename, format, len(contents))))
+        key.update(contents)
+    return key.hexdigest()
+
+def _user_cache_dir(cache_dir):
+    """Get the directory holding the current user's cached specifications.
+
+    Each user has their own directory within the cache directory, so a cache
+    directory can be shared (eg: one in /tmp) without users loading each
+    other's cached specifications."""
+    if hasattr(os, 'getuid'):
+        user = str(os.getuid())
+    else:
+        import getpass
+        user = getpass.getuser()
+    return os.path.join(cache_dir, 'user-%s' % user)
+
+def _is_private(info):
+    """Check that a file or directory can only be modified by the current user.
+
+    info -- The os.stat result of the file or directory.
+    """
+    if hasattr(os, 'getuid') and info.st_uid != os.getuid():
+        return False
+    return not info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+def _read_cache(filename):
+    # Unpickling a file can run arbitrary code, so only cache files that
+    # nobody else could have written are loaded.
+    try:
+        info = os.lstat(os.path.dirname(filename))
+    except OSError:
+        return None
+    if not stat.S_ISDIR(info.st_mode) or not _is_private(info):
+        return None
+    try:
+        cache = open(filename, 'rb')
+    except IOError:
+        return None
+    try:
+        info = os.fstat(cache.fileno())
+        if not stat.S_ISREG(info.st_mode) or not _is_private(info):
+            return None
+        try:
+            return cPickle.load(cache)
+        except Exception:
+            # The cache file is unreadable (eg: it was truncated, or was
+            # written by an incompatible version); the specification will
+            # be loaded again.
+            return None
+    finally:
+        cache.close()
+
+def _write_cache(filename, result):
+    try:
+        data = cPickle.dumps(result, cPickle.HIGHEST_PROTOCOL)
+    except (cPickle.PicklingError, RuntimeError, TypeError):
+        # Some specifications cannot be pickled (eg: they are nested too
+        # deeply); they won't be cached.
+        return
+    import tempfile
+    directory = os.path.dirname(filename)
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0700)
+        info = os.lstat(directory)
+        if not stat.S_ISDIR(info.st_mode) or not _is_private(info):
+            # Others could replace our cache files; don't write them.
+            return
+        # Write to a temporary file first, so concurrent loads never see a
+        # partially written cache.
+        handle, temp = tempfile.mkstemp(dir=directory)
+        try:
+            os.write(handle, data)
+        finally:
+            os.close(handle)
+        os.rename(temp, filename)
+    except (IOError, OSError):
+        # Failing to write the cache shouldn't stop the specification from
+        # being used.
+        pass
+
+def load_specs(specs, main_name=None, should_remove_unused=False, cache_dir=None):
     """Load a specification from disk.
 
     When more than one specification is passed in, the entries from each
@@ -149,22 +251,49 @@ def load_specs(specs, main_name=None, should_remove_unused=False):
       a UnspecifiedMainDecoderError will be thrown).
     should_remove_unused -- Should the loader remove any entries that are
       unused by the main decoder.
+    cache_dir -- The directory used to cache the loaded specification. If
+      the specifications haven't changed since they were last loaded, the
+      cached entries are used instead of loading them again. If None, the
+      directory is taken from the BDEC_CACHE_DIR environment variable; if
+      that isn't set, the specification isn't cached. The cache files are
+      kept in a private directory for each user within the cache directory,
+      and are only used if no other user can modify them.
     return -- (decoder, common, lookup)
     """
     from bdec.spec.references import References
 
-    references = References()
-    decoders = []
-    lookup = {}
+    # Read the contents of all of the specifications, so they can be hashed
+    # when looking up the cache.
+    loaded = []
     for filename, contents, format in specs:
         if contents is None:
-            contents = open(filename, 'r')
-        elif isinstance(contents, basestring):
-            contents = StringIO(contents)
+            spec = open(filename, 'r')
+            try:
+                contents = spec.read()
+            finally:
+                spec.close()
+        elif not isinstance(contents, basestring):
+            contents = contents.read()
 
         if format is None:
             format = os.path.splitext(filename)[1][1:]
-        d, l = _load_spec(filename, contents, format, references)
+        loaded.append((filename, contents, format))
+
+    if cache_dir is None:
+        cache_dir = os.environ.get(CACHE_DIR_VARIABLE) or None
+    cache = None
+    if cache_dir is not None:
+        cache = os.path.join(_user_cache_dir(cache_dir),
+                _cache_key(loaded, main_name, should_remove_unused) + '.pickle')
+        result = _read_cache(cache)
+        if result is not None:
+            return result
+
+    references = References()
+    decoders = []
+    lookup = {}
+    for filename, contents, format in loaded:
+        d, l = _load_spec(filename, StringIO(contents), format, references)
         if d:
             decoders.append(d)
         lookup.update(l)
@@ -189,5 +318,7 @@ def load_specs(specs, main_name=None, should_remove_unused=False):
         decoder = decoders[0]
 
     decoder, common = _resolve(decoder, references, lookup, should_remove_unused)
+    if cache is not None:
+        _write_cache(cache, (decoder, common, lookup))
     return decoder, common, lookup
 
@@ -27,6 +27,7 @@ import bdec.sequence as seq
 from bdec.spec import LoadError, xmlspec
 from bdec.spec.ebnf import parse
 import os.path
+import StringIO
 from pyparsing import Word, nums, alphanums, StringEnd, \
     ParseException, Optional, Combine, oneOf, alphas,\
     QuotedString, empty, lineno, SkipTo
@@ -80,12 +81,65 @@ def _create_tag(klass, is_constructed, number):
 def _parse_number(s, l, t):
     return int(t[0])
 
+_GENERIC_SPEC_FILENAME = os.path.join(os.path.dirname(__file__), '..', '..', 'specs', 'asn1.ber.xml')
+
+# The text of the generic asn.1 decoding specification, read when first used.
+_generic_spec_text = None
+
+# The asn.1 grammar and the names of its parse elements, created when first
+# used (see _get_grammar).
+_grammar = None
+
+# The loaders currently parsing a specification. The grammar is shared, so
+# its parse actions are passed to the innermost loader.
+_active_loaders = []
+
+def _dispatch(name):
+    def _action(s, l, t):
+        return _active_loaders[-1]._actions[name](s, l, t)
+    return _action
+
+def _get_grammar():
+    """Get the asn.1 grammar, creating it on first use.
+
+    Returns a tuple of (parser, parse element names)."""
+    global _grammar
+    if _grammar is None:
+        table = {
+                'bstring' : Combine("'" + Word('01') + "'B"),
+                'xmlbstring' : Word('01'),
+                'hstring' : Combine("'" + Word('abcdef' + nums) + "'H"),
+                'xmlhstring' : Word('abcdef' + nums),
+                'number' : Word(nums),
+                'typereference' : Word(alphanums + '-'),
+                'modulereference' : Word(alphanums + '-'),
+                'realnumber' : Combine(Word(nums) + Optional('.' + Word(nums)) + Optional(oneOf('eE') + Word(nums))),
+                'empty' : empty,
+                #'identifier' : Combine(oneOf(alphas) + Optional(Word(alphanums + '-'))),
+                'identifier' : Word(alphanums + '-'),
+                'cstring' : QuotedString('"', escChar='"'),
+                'xmlcstring' : empty, # FIXME
+                }
+        table['number'].setParseAction(_parse_number)
+
+        # Load the ebnf for the ASN.1 format, so we know how to parse the specification.
+        ebnf = open(os.path.join(os.path.dirname(__file__), 'asn1.ebnf'), 'r').read()
+        parsers = parse(ebnf, table)
+        parser = parsers['ModuleDefinition'] + StringEnd()
+        parser.ignore('--' + SkipTo('\n'))
+
+        names = [name for name in parsers if name not in table]
+        for name in names:
+            parsers[name].setParseAction(_dispatch(name))
+        _grammar = (parser, names)
+    return _grammar
+
 class _Loader:
     """A class for loading asn1 specifications."""
 
     def __init__(self, filename, references):
         self._references = references
-        self._parser, parsers, self._source_lookup = self._load_ebnf()
+        self._source_lookup = self._load_generic_spec()
 
         # Default for all handlers will be to fail on 'not implemented'. We
         # then have to manually go through and enable all handlers explicitly.
@@ -94,8 +148,8 @@ class _Loader:
             def _handler(text, location, tokens):
                 raise NotImplementedError(name, tokens, filename, lineno(location, text))
             return _handler
-        for name, entry in parsers.items():
-            entry.setParseAction(not_implemented_handler(name))
+        parser, names = _get_grammar()
+        self._actions = actions = dict((name, not_implemented_handler(name)) for name in names)
         self._common_entries = {}
 
         # Default handler to pass the childrens tokens from a parser element.
@@ -110,82 +164,62 @@ class _Loader:
                     if not isinstance(entry, ent.Child) and not isinstance(entry, ent.Entry):
                         raise NotImplementedError(name, tokens, filename, lineno(l, t))
                 return tokens
-            parsers[name].setParseAction(allow_entries_with_name)
-
-        parsers['ModuleDefinition'].setParseAction(self._create_module)
-        parsers['DefinitiveIdentifier'].setParseAction(lambda s,l,t:t[1:-1])
-        parsers['ModuleIdentifier'].setParseAction(pass_children)
-        parsers['TagDefault'].setParseAction(self._accept_empty)
-        parsers['ExtensionDefault'].setParseAction(self._accept_empty)
-        parsers['Exports'].setParseAction(self._accept_empty)
-        parsers['Imports'].setParseAction(self._accept_empty)
-        parsers['AssignmentList'].setParseAction(pass_children)
-        parsers['IntegerType'].setParseAction(self._create_integer)
-        parsers['BuiltinType'].setParseAction(pass_children)
-        parsers['Type'].setParseAction(pass_children)
-        parsers['NamedType'].setParseAction(self._set_entry_name)
+            actions[name] = allow_entries_with_name
+
+        actions['ModuleDefinition'] = self._create_module
+        actions['DefinitiveIdentifier'] = lambda s,l,t:t[1:-1]
+        actions['ModuleIdentifier'] = pass_children
+        actions['TagDefault'] = self._accept_empty
+        actions['ExtensionDefault'] = self._accept_empty
+        actions['Exports'] = self._accept_empty
+        actions['Imports'] = self._accept_empty
+        actions['AssignmentList'] = pass_children
+        actions['IntegerType'] = self._create_integer
+        actions['BuiltinType'] = pass_children
+        actions['Type'] = pass_children
+        actions['NamedType'] = self._set_entry_name
         entries('ComponentType')
-        parsers['ComponentTypeList'].setParseAction(lambda s,l,t:t[0::2])
+        actions['ComponentTypeList'] = lambda s,l,t:t[0::2]
         entries('RootComponentTypeList')
         entries('ComponentTypeLists')
-        parsers['SequenceType'].setParseAction(self._create_sequence)
-        parsers['TypeAssignment'].setParseAction(self._set_type_name)
+        actions['SequenceType'] = self._create_sequence
+        actions['TypeAssignment'] = self._set_type_name
         entries('Assignment')
         entries('ModuleBody')
-        parsers['SignedNumber'].setParseAction(self._parse_integer)
-        parsers['BooleanType'].setParseAction(self._create_boolean)
-        parsers['NamedNumberList'].setParseAction(self._create_named_numeric_list)
+        actions['SignedNumber'] = self._parse_integer
+        actions['BooleanType'] = self._create_boolean
+        actions['NamedNumberList'] = self._create_named_numeric_list
 
         # Ignore the object identifiers. What should we do with these?
-        parsers['NameForm'].setParseAction(lambda s,l,t:[])
-        parsers['DefinitiveObjIdComponent'].setParseAction(lambda s,l,t:[])
-        parsers['DefinitiveObjIdComponentList'].setParseAction(lambda s,l,t:[])
-        parsers['DefinitiveNumberForm'].setParseAction(lambda s,l,t:[])
-        parsers['DefinitiveNameAndNumberForm'].setParseAction(lambda s,l,t:[])
+        actions['NameForm'] = lambda s,l,t:[]
+        actions['DefinitiveObjIdComponent'] = lambda s,l,t:[]
+        actions['DefinitiveObjIdComponentList'] = lambda s,l,t:[]
+        actions['DefinitiveNumberForm'] = lambda s,l,t:[]
+        actions['DefinitiveNameAndNumberForm'] = lambda s,l,t:[]
 
         # Enumeration entries.
-        parsers['NamedNumber'].setParseAction(lambda s, l, t: {'name': t[0], 'value': t[2]})
-        parsers['EnumerationItem'].setParseAction(pass_children)
-        parsers['Enumeration'].setParseAction(lambda s, l, t: {'items':t[::2]})
-        parsers['RootEnumeration'].setParseAction(pass_children)
-        parsers['Enumerations'].setParseAction(self._create_enumeration)
-        parsers['EnumeratedType'].setParseAction(lambda s, l, t: t[2])
-        parsers['ExceptionSpec'].setParseAction(self._accept_empty)
+        actions['NamedNumber'] = lambda s, l, t: {'name': t[0], 'value': t[2]}
+        actions['EnumerationItem'] = pass_children
+        actions['Enumeration'] = lambda s, l, t: {'items':t[::2]}
+        actions['RootEnumeration'] = pass_children
+        actions['Enumerations'] = self._create_enumeration
+        actions['EnumeratedType'] = lambda s, l, t: t[2]
+        actions['ExceptionSpec'] = self._accept_empty
 
         # Choice entries
-        parsers['AlternativeTypeList'].setParseAction(lambda s,l,t:t[0::2])
+        actions['AlternativeTypeList'] = lambda s,l,t:t[0::2]
         entries('RootAlternativeTypeList')
         entries('AlternativeTypeLists')
-        parsers['ChoiceType'].setParseAction(self._create_choice)
+        actions['ChoiceType'] = self._create_choice
 
-    def _load_ebnf(self):
+    def _load_generic_spec(self):
         # Load the xml spec that we will use for doing the decoding.
-        asn1_filename = os.path.join(os.path.dirname(__file__), '..', '..', 'specs', 'asn1.ber.xml')
-        generic_spec, lookup = xmlspec.load(asn1_filename, file(asn1_filename, 'r'), self._references)
-
-        table = {
-                'bstring' : Combine("'" + Word('01') + "'B"),
-                'xmlbstring' : Word('01'),
-                'hstring' : Combine("'" + Word('abcdef' + nums) + "'H"),
-                'xmlhstring' : Word('abcdef' + nums),
-                'number' : Word(nums),
-                'typereference' : Word(alphanums + '-'),
-                'modulereference' : Word(alphanums + '-'),
-                'realnumber' : Combine(Word(nums) + Optional('.' + Word(nums)) + Optional(oneOf('eE') + Word(nums))),
-                'empty' : empty,
-                #'identifier' : Combine(oneOf(alphas) + Optional(Word(alphanums + '-'))),
-                'identifier' : Word(alphanums + '-'),
-                'cstring' : QuotedString('"', escChar='"'),
-                'xmlcstring' : empty, # FIXME
-                }
-        table['number'].setParseAction(_parse_number)
-
-        # Load the ebnf for the ASN.1 format, so we know how to parse the specification.
-        parsers = parse(open('bdec/spec/asn1.ebnf', 'r').read(), table)
-        parser = parsers['ModuleDefinition'] + StringEnd()
-        parser.ignore('--' + SkipTo('\n'))
-
-        return parser, dict((name, entry) for name, entry in parsers.items() if name not in table), lookup
+        global _generic_spec_text
+        if _generic_spec_text is None:
+            _generic_spec_text = open(_GENERIC_SPEC_FILENAME, 'r').read()
+        generic_spec, lookup = xmlspec.load(_GENERIC_SPEC_FILENAME,
+                StringIO.StringIO(_generic_spec_text), self._references)
+        return lookup
 
     def _create_named_numeric_list(self, s, l, t):
         value = 0
@@ -234,10 +268,15 @@ class _Loader:
 
     def load(self, text):
         """Load a bdec specification from an asn.1 document."""
+        parser, names = _get_grammar()
+        _active_loaders.append(self)
         try:
-            name, modules =  self._parser.parseString(text)[0]
-        except ParseException, ex:
-            raise Asn1ParseError(ex, self.filename, ex.lineno)
+            try:
+                name, modules = parser.parseString(text)[0]
+            except ParseException, ex:
+                raise Asn1ParseError(ex, self.filename, ex.lineno)
+        finally:
+            _active_loaders.pop()
         common = dict((entry.name, entry) for entry in modules)
         common.update(self._common_entries)
         for module in common.values():
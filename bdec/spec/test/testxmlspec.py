@@ -19,7 +19,11 @@
 
 #!/usr/bin/env python
 
+import cPickle
 import operator
+import os
+import shutil
+import tempfile
 import unittest
 
 import bdec
@@ -1097,6 +1101,74 @@ class TestXml(unittest.TestCase):
         self.assertEqual(dt.Data('\x08\x03'), reduce(operator.add, spec.encode(query, None)))
 
 
+class TestCache(unittest.TestCase):
+    SPEC = '''
+        <protocol>
+          <sequence name="a">
+            <field name="length:" length="8" type="integer" />
+            <field name="b" length="${length:} * 8" type="text" />
+          </sequence>
+        </protocol>'''
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _load(self, text):
+        return load_specs([('<string>', text, 'xml')], cache_dir=self.dir)
+
+    def _cache_files(self):
+        user_dir = os.path.join(self.dir, os.listdir(self.dir)[0])
+        return [os.path.join(user_dir, name) for name in os.listdir(user_dir)]
+
+    def test_cached_spec_is_reused(self):
+        spec, common, lookup = self._load(self.SPEC)
+        self.assertEqual(1, len(self._cache_files()))
+        cached, common, lookup = self._load(self.SPEC)
+        self.assertFalse(cached is spec)
+        self.assertEqual('a', cached.name)
+        self.assertTrue(cached in lookup)
+        self.assertEqual('hi', inst.decode(cached, dt.Data('\x02hi')).b)
+
+    def test_changed_spec_isnt_reused(self):
+        self._load(self.SPEC)
+        spec = self._load(self.SPEC.replace('name="b"', 'name="c"'))[0]
+        self.assertEqual(2, len(self._cache_files()))
+        self.assertEqual('hi', inst.decode(spec, dt.Data('\x02hi')).c)
+
+    def test_bad_cache_is_ignored(self):
+        self._load(self.SPEC)
+        filename = self._cache_files()[0]
+        cache = open(filename, 'wb')
+        cache.write('corrupt')
+        cache.close()
+        spec = self._load(self.SPEC)[0]
+        self.assertEqual('hi', inst.decode(spec, dt.Data('\x02hi')).b)
+
+    def test_cache_is_private(self):
+        self._load(self.SPEC)
+        user_dir = os.path.join(self.dir, os.listdir(self.dir)[0])
+        self.assertEqual(0, os.stat(user_dir).st_mode & 077)
+        self.assertEqual(0, os.stat(self._cache_files()[0]).st_mode & 077)
+
+    def test_writable_cache_isnt_loaded(self):
+        # A cache file that others could have written isn't unpickled.
+        self._load(self.SPEC)
+        filename = self._cache_files()[0]
+        cache = open(filename, 'wb')
+        cPickle.dump('not a spec', cache)
+        cache.close()
+        os.chmod(filename, 0666)
+        spec = self._load(self.SPEC)[0]
+        self.assertEqual('hi', inst.decode(spec, dt.Data('\x02hi')).b)
+
+    def test_load_error_isnt_cached(self):
+        self.assertRaises(LoadError, self._load, '<protocol><field name="a" length="${b}" /></protocol>')
+        self.assertEqual([], os.listdir(self.dir))
+
+
 class TestSave(unittest.TestCase):
     """Test decoding of the xml save functionality.
 
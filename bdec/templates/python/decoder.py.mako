@@ -0,0 +1,364 @@
+## vim:set syntax=mako:
+<%!
+  from bdec.choice import Choice
+  from bdec.field import Field
+  from bdec.sequence import Sequence
+  from bdec.sequenceof import SequenceOf
+ %>\
+#   Portions Copyright (C) 2010 Henry Ludemann
+#   Portions Copyright (c) 2010, PRESENSE Technologies GmbH
+#
+#   This file is part of the bdec decoder library.
+#
+#   The bdec decoder library is free software; you can redistribute it
+#   and/or modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 2.1 of the License, or (at your option) any later version.
+#
+#   The bdec decoder library is distributed in the hope that it will be
+#   useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public
+#   License along with this library; if not, see
+#   <http://www.gnu.org/licenses/>.
+
+"""Decoder for the '${protocol.name}' specification.
+
+This module was generated by the bdec compiler. It decodes to the same events
+as bdec.decode.Decoder, but every entry is decoded by a specialised function.
+"""
+
+import bdec
+import bdec.data as dt
+from bdec.constraints import ConstraintError
+from bdec.entry import DecodeLengthError, EntryDataError
+from bdec.field import FieldDataError
+import bdec.inspect.chooser as chsr
+from bdec.sequenceof import NegativeSequenceofLoop, SequenceEndedEarlyError
+from bdec.sequenceof import SequenceofStoppedBeforeEndEntry
+
+# The type and name of the entries the decoder was generated from, in the
+# order they are found by _get_entries.
+_ENTRIES = [
+%for e in settings.entries():
+    (${repr(e.__class__.__name__)}, ${repr(e.name)}),
+%endfor
+    ]
+
+<%def name="childDecode(entry, child, data='_data', result='_child')" buffered="True">\
+<% outputs = settings.child_outputs(entry, child) %>\
+%if outputs:
+${result} = []
+%endif
+for _event in ${settings.decode_name(child.entry)}(${data}, ${repr(child.name)}, ${result if outputs else 'None'}${settings.call_args(entry, child)}):
+%if is_length_referenced(entry):
+    if not _event[0]:
+        _length += len(_event[3])
+%endif
+    yield _event
+%if outputs:
+${', '.join(outputs)}, = ${result}
+%endif
+</%def>
+
+<%def name="checkConstraints(entry)" buffered="True">\
+%for i, constraint in enumerate(entry.constraints):
+<% inline = settings.inline_constraint(entry, constraint) %>\
+  %if inline:
+if _value ${inline[0]} ${inline[1]}:
+    raise ConstraintError(${settings.entry_variable(entry)}, _value, '${inline[2]}', ${inline[1]})
+  %else:
+${settings.entry_variable(entry)}.constraints[${i}].check(${settings.entry_variable(entry)}, _value, ${settings.constraint_context(entry)})
+  %endif
+%endfor
+</%def>
+
+<%def name="decodeField(entry)" buffered="True">\
+yield (True, _name, ${settings.entry_variable(entry)}, _data, None)
+_field = _data.pop(${settings.value(entry, entry.length)})
+try:
+    _value = ${settings.field_value(entry, '_field')}
+except dt.DataError, _ex:
+    raise FieldDataError(${settings.entry_variable(entry)}, _ex)
+</%def>
+
+<%def name="decodeSequence(entry)" buffered="True">\
+yield (True, _name, ${settings.entry_variable(entry)}, _data, None)
+%for child in entry.children:
+${childDecode(entry, child)}\
+%endfor
+_value = ${settings.value(entry, entry.value) if entry.value is not None else 'None'}
+_field = dt.Data()
+</%def>
+
+<%def name="decodeSequenceOf(entry)" buffered="True">\
+yield (True, _name, ${settings.entry_variable(entry)}, _data, None)
+%if settings.has_local(entry, 'should end'):
+${settings.local(entry, 'should end')} = False
+%endif
+%if entry.count is not None:
+_count = int(${settings.value(entry, entry.count)})
+if _count < 0:
+    raise NegativeSequenceofLoop(${settings.entry_variable(entry)}, _count)
+for _i in xrange(_count):
+  %if entry.end_entries:
+    if ${settings.local(entry, 'should end')}:
+        raise SequenceEndedEarlyError(${settings.entry_variable(entry)})
+  %endif
+%elif entry.end_entries:
+while not ${settings.local(entry, 'should end')}:
+%else:
+while _data:
+%endif
+${childDecode(entry, entry.children[0]) | ws(4)}\
+%if entry.end_entries:
+if not ${settings.local(entry, 'should end')}:
+    raise SequenceofStoppedBeforeEndEntry(${settings.entry_variable(entry)})
+%endif
+_value = None
+_field = dt.Data()
+</%def>
+
+<%def name="decodeChoice(entry)" buffered="True">\
+_possibles = [${settings.entry_variable(entry)}_options[id(_option)] for _option in ${settings.entry_variable(entry)}_chooser.choose(_data)]
+yield (True, _name, ${settings.entry_variable(entry)}, _data, None)
+_failure_expected = False
+if not _possibles:
+    # None of the items match. In this case we want to choose the 'best'
+    # failing option, so we'll examine all of the children.
+    _possibles = range(${len(entry.children)})
+    _failure_expected = True
+# The buffered events of the best option (if it was trial decoded).
+_best_events = None
+if len(_possibles) == 1:
+    _best = _possibles[0]
+else:
+    # We have multiple possibilities. We'll decode them one at a time until
+    # one of them succeeds; if none decode, we'll re-raise the exception of
+    # the 'best guess'. The events are buffered so the best option can be
+    # replayed instead of decoded again.
+    _best = None
+    _best_bits = 0
+    _best_entries = 0
+    for _option in _possibles:
+        _events = []
+        _trial_data = _data.copy()
+        _trial_result = []
+        try:
+            _bits = 0
+            _entries_decoded = 0
+%for i, child in enumerate(entry.children):
+            ${'if' if i == 0 else 'elif'} _option == ${i}:
+                _trial = ${settings.decode_name(child.entry)}(_trial_data, ${repr(child.name)}, ${'_trial_result' if settings.child_outputs(entry, child) else 'None'}${settings.call_args(entry, child)})
+%endfor
+            for _event in _trial:
+                if not _event[0]:
+                    _bits += len(_event[3])
+                    _entries_decoded += 1
+                if _events is not None:
+                    if len(_events) >= _MAX_BUFFERED_EVENTS:
+                        _events = None
+                    else:
+                        if _event[0]:
+                            # The starting data will be popped by the entry.
+                            _event = (True, _event[1], _event[2], _event[3].copy(), None)
+                        _events.append(_event)
+
+            # We successfully decoded the entry!
+            _best = _option
+            _best_bits = _bits
+            _best_events = _events
+            _best_result = _trial_result
+            _best_error = None
+            break
+        except bdec.DecodeError, _ex:
+            if (_best is None or _bits > _best_bits or
+                    (_bits == _best_bits and _entries_decoded > _best_entries)):
+                _best = _option
+                _best_bits = _bits
+                _best_entries = _entries_decoded
+                _best_events = _events
+                _best_error = _ex
+
+if _best_events is not None:
+    # Replay the buffered decode of the best option.
+    for _event in _best_events:
+%if is_length_referenced(entry):
+        if not _event[0]:
+            _length += len(_event[3])
+%endif
+        yield _event
+    if _best_error is not None:
+        raise _best_error
+    _data.pop(_best_bits)
+%for i, child in enumerate(entry.children):
+  %if settings.child_outputs(entry, child):
+    if _best == ${i}:
+        ${', '.join(settings.child_outputs(entry, child))}, = _best_result
+  %endif
+%endfor
+else:
+    # Decode the best option.
+%for i, child in enumerate(entry.children):
+    ${'if' if i == 0 else 'elif'} _best == ${i}:
+${childDecode(entry, child) | ws(8)}\
+%endfor
+assert not _failure_expected
+_value = None
+_field = dt.Data()
+</%def>
+
+<%def name="decodeEntry(entry)" buffered="True">\
+<% inputs = [settings.local(entry, p.name) for p in settings.inputs(entry)] %>\
+<% outputs = [settings.local(entry, p.name) for p in settings.outputs(entry)] %>\
+def ${settings.decode_name(entry)}(_data, _name, _result${''.join(', %s' % name for name in inputs)}):
+%for name, initial in settings.local_variables(entry):
+    ${name} = ${initial}
+%endfor
+%if entry.length is not None:
+    try:
+        _data = _data.pop(${settings.value(entry, entry.length)})
+    except dt.DataError, _ex:
+        raise EntryDataError(${settings.entry_variable(entry)}, _ex)
+%endif
+%if is_length_referenced(entry):
+    _length = 0
+%endif
+%if isinstance(entry, Field):
+${decodeField(entry) | ws(4)}\
+%elif isinstance(entry, Sequence):
+${decodeSequence(entry) | ws(4)}\
+%elif isinstance(entry, SequenceOf):
+${decodeSequenceOf(entry) | ws(4)}\
+%elif isinstance(entry, Choice):
+${decodeChoice(entry) | ws(4)}\
+%endif
+${checkConstraints(entry) | ws(4)}\
+    yield (False, _name, ${settings.entry_variable(entry)}, _field, _value)
+
+%if is_end_sequenceof(entry) and settings.has_local(entry, 'should end'):
+    ${settings.local(entry, 'should end')} = True
+%endif
+%if is_value_referenced(entry) and settings.has_local(entry, entry.name):
+    ${settings.local(entry, entry.name)} = int(_value)
+%endif
+%if is_length_referenced(entry) and settings.has_local(entry, entry.name + ' length'):
+    ${settings.local(entry, entry.name + ' length')} = _length + len(_field)
+%endif
+%if entry.length is not None:
+    if len(_data) != 0:
+        raise DecodeLengthError(${settings.entry_variable(entry)}, _data)
+%endif
+%if outputs:
+    _result[:] = [${', '.join(outputs)}]
+%endif
+</%def>
+
+# The maximum number of events buffered while trial decoding a choice option.
+# Options with more events will be decoded again when chosen.
+_MAX_BUFFERED_EVENTS = 10000
+
+class _LazyChooser:
+    """Create the chooser for a choice the first time it is used."""
+    def __init__(self, entries):
+        self._entries = entries
+        self._chooser = None
+
+    def choose(self, data):
+        if self._chooser is None:
+            self._chooser = chsr.Chooser(self._entries)
+        return self._chooser.choose(data)
+
+def _get_options(choice):
+    """Map the id of the choice's child entries to the first child index."""
+    result = {}
+    for i, child in enumerate(choice.children):
+        result.setdefault(id(child.entry), i)
+    return result
+
+def _divide_with_rounding(numerator, denominator, should_round_up):
+    result = numerator / denominator
+    if numerator % denominator and should_round_up:
+        result += 1
+    return result
+
+def _iter_inner_entries(entry, common):
+    for child in entry.children:
+        if child.entry not in common:
+            for sub_child in _iter_inner_entries(child.entry, common):
+                yield sub_child
+    yield entry
+
+def _get_entries(spec, common):
+    """Return the entries of a specification in the order they were generated.
+
+    This walks the specification in the same order as the compiler."""
+    entries = set(common)
+    entries.add(spec)
+    entries = list(entries)
+    entries.sort(key=lambda a:a.name)
+
+    result = []
+    found = set()
+    for entry in entries:
+        for inner in _iter_inner_entries(entry, entries):
+            if inner not in found:
+                found.add(inner)
+                result.append(inner)
+    if [(e.__class__.__name__, e.name) for e in result] != _ENTRIES:
+        raise Exception("Specification '%s' doesn't match the specification "
+                "the decoder was generated from!" % spec.name)
+    return result
+
+def _create_decoders(_entries):
+    """Create the decode functions for the given entries.
+
+    Returns a dictionary of entry to decode function."""
+%for i, e in enumerate(settings.entries()):
+    ${settings.entry_variable(e)} = _entries[${i}]
+  %if isinstance(e, Choice):
+    ${settings.entry_variable(e)}_chooser = _LazyChooser([child.entry for child in ${settings.entry_variable(e)}.children])
+    ${settings.entry_variable(e)}_options = _get_options(${settings.entry_variable(e)})
+  %endif
+%endfor
+
+%for e in settings.entries():
+${decodeEntry(e) | ws(4)}\
+%endfor
+    return {
+%for e in settings.entries():
+        ${settings.entry_variable(e)} : ${settings.decode_name(e)},
+%endfor
+        }
+
+
+class Decoder:
+    """Decode data using the generated functions.
+
+    Has the same interface as bdec.decode.Decoder.
+    """
+    def __init__(self, spec, common=[]):
+        """Construct a decoder instance.
+
+        spec -- The specification the decoder was generated from.
+        common -- The common entries of the specification.
+        """
+        self.entry = spec
+        self._decoders = _create_decoders(_get_entries(spec, common))
+        self._inputs = [
+%for p in settings.inputs(protocol):
+            ${repr(p.name)},
+%endfor
+            ]
+
+    def decode(self, data, context={}, name=None):
+        """Return an iterator of (is_starting, name, Entry, data, value) tuples.
+
+        See bdec.decode.Decoder.decode.
+        """
+        if name is None:
+            name = self.entry.name
+        inputs = [context[param] for param in self._inputs]
+        return self._decoders[self.entry](data, name, [], *inputs)
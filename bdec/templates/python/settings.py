@@ -0,0 +1,211 @@
+#   Copyright (C) 2010 Henry Ludemann
+#   Copyright (C) 2010 PRESENSE Technologies GmbH
+#
+#   This file is part of the bdec decoder library.
+#
+#   The bdec decoder library is free software; you can redistribute it
+#   and/or modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 2.1 of the License, or (at your option) any later version.
+#
+#   The bdec decoder library is distributed in the hope that it will be
+#   useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public
+#   License along with this library; if not, see
+#   <http://www.gnu.org/licenses/>.
+
+import keyword
+import operator
+
+from bdec.constraints import Equals, Maximum, Minimum
+from bdec.expression import ArithmeticExpression, ReferenceExpression, \
+        Constant, UndecodedReferenceError, RoundUpDivisionExpression
+import bdec.field as fld
+import bdec.inspect.param as prm
+from bdec.inspect.type import ShouldEndType
+import bdec.sequence as seq
+
+# The generated code prefixes its own variables with an underscore, so the
+# escaped names only need to avoid the python keywords and the (lower case)
+# builtins and modules used by the generated code.
+keywords = keyword.kwlist + ['bdec', 'chsr', 'dt', 'id', 'int', 'len',
+        'range', 'xrange']
+
+_OPERATORS = {
+        operator.__div__ : '/',
+        operator.__mod__ : '%',
+        operator.__mul__ : '*',
+        operator.__sub__ : '-',
+        operator.__add__ : '+',
+        operator.lshift : '<<',
+        operator.rshift : '>>',
+        }
+
+_entries = []
+def entries():
+    """Return all entries in the order they are bound when loading.
+
+    The generated module walks the specification in the same order to map
+    its functions to the entry instances."""
+    if not _entries:
+        found = set()
+        for entry in iter_entries():
+            if entry not in found:
+                found.add(entry)
+                _entries.append(entry)
+    return _entries
+
+_indexes = {}
+def entry_variable(entry):
+    """Get the name of the generated variable holding an entry instance."""
+    if not _indexes:
+        _indexes.update((e, i) for i, e in enumerate(entries()))
+    return '_entry%i' % _indexes[entry]
+
+_escaped_types = {}
+def escaped_type(entry):
+    if not _escaped_types:
+        embedded = [e for e in entries() if e not in common]
+        names = esc_names([e.name for e in common], esc_name)
+        names += esc_names([e.name for e in embedded], esc_name, names)
+        _escaped_types.update(zip(common + embedded, names))
+    return _escaped_types[entry]
+
+_decode_names = {}
+def decode_name(entry):
+    if not _decode_names:
+        # Escape the function names together, as names that only differ by
+        # case can escape to the same function name.
+        names = esc_names(['decode ' + escaped_type(e) for e in entries()], function)
+        _decode_names.update(zip(entries(), names))
+    return _decode_names[entry]
+
+_params = []
+def _decode_params():
+    """The parameters used by the generated decoder.
+
+    These are the same parameters used by bdec.decode.Decoder."""
+    if not _params:
+        _params.append(prm.CachedParameters(prm.CompoundParameters([
+            prm.EndEntryParameters(common),
+            prm.ExpressionParameters(common)])))
+    return _params[0]
+
+def params(entry):
+    return _decode_params().get_params(entry)
+
+def inputs(entry):
+    return [p for p in params(entry) if p.direction == p.IN]
+
+def outputs(entry):
+    return [p for p in params(entry) if p.direction == p.OUT]
+
+_local_names = {}
+def _name_map(entry):
+    """Map the parameter and local names of an entry to python variables."""
+    try:
+        return _local_names[entry]
+    except KeyError:
+        names = []
+        for item in params(entry) + list(_decode_params().get_locals(entry)):
+            if item.name not in names:
+                names.append(item.name)
+        forbidden = [decode_name(e) for e in entries()]
+        result = dict(zip(names, esc_names(names, variable, forbidden)))
+        _local_names[entry] = result
+        return result
+
+def local(entry, name):
+    """Get the python variable name for a parameter of an entry."""
+    return _name_map(entry)[name]
+
+def has_local(entry, name):
+    return name in _name_map(entry)
+
+def local_variables(entry):
+    """Return a list of (variable name, initial value) tuples.
+
+    These are the output parameters and locals of an entry."""
+    result = []
+    inputs_names = [p.name for p in inputs(entry)]
+    items = outputs(entry) + list(_decode_params().get_locals(entry))
+    for item in items:
+        if item.name in inputs_names:
+            continue
+        initial = 'False' if isinstance(item.type, ShouldEndType) else 'None'
+        variable_name = local(entry, item.name)
+        if (variable_name, initial) not in result:
+            result.append((variable_name, initial))
+    return result
+
+def call_args(entry, child):
+    """Return a string of the input arguments passed to a child decoder."""
+    passed = zip(_decode_params().get_passed_variables(entry, child), params(child.entry))
+    return ''.join(', %s' % local(entry, ours.name) for ours, theirs in passed
+            if theirs.direction == theirs.IN)
+
+def child_outputs(entry, child):
+    """Return the variable names assigned from the child decoder's results."""
+    passed = zip(_decode_params().get_passed_variables(entry, child), params(child.entry))
+    return [local(entry, ours.name) for ours, theirs in passed
+            if theirs.direction == theirs.OUT]
+
+def constant_value(expr):
+    """Return the value of a constant expression, or None."""
+    try:
+        return expr.evaluate({})
+    except UndecodedReferenceError:
+        return None
+
+def value(entry, expr):
+    """Convert an expression object to python code.
+
+    Constant expressions are evaluated at generation time."""
+    folded = constant_value(expr)
+    if isinstance(folded, (int, long)):
+        return repr(folded)
+    if isinstance(expr, Constant):
+        return repr(expr.value)
+    elif isinstance(expr, ReferenceExpression):
+        return local(entry, expr.param_name())
+    elif isinstance(expr, ArithmeticExpression):
+        return '(%s %s %s)' % (value(entry, expr.left),
+                _OPERATORS[expr.op], value(entry, expr.right))
+    elif isinstance(expr, RoundUpDivisionExpression):
+        return '_divide_with_rounding(%s, %s, %s)' % (value(entry, expr.numerator),
+                value(entry, expr.denominator), expr.should_round_up)
+    raise Exception('Unknown expression %s' % expr)
+
+def _is_integer(entry):
+    if isinstance(entry, fld.Field):
+        return entry.format == fld.Field.INTEGER
+    return isinstance(entry, seq.Sequence) and entry.value is not None
+
+_OPPOSITES = {Minimum:('<', '>='), Maximum:('>', '<='), Equals:('!=', '==')}
+def inline_constraint(entry, constraint):
+    """Return a (comparison, limit, operator) tuple for constraints that can
+    be checked inline, or None if the constraint object must be used."""
+    limit = constant_value(constraint.limit)
+    if _is_integer(entry) and type(constraint) in _OPPOSITES and \
+            isinstance(limit, (int, long)):
+        failed, description = _OPPOSITES[type(constraint)]
+        return failed, repr(limit), description
+    return None
+
+def constraint_context(entry):
+    """Return python code for a dictionary of the entries parameters."""
+    return '{%s}' % ', '.join('%r: %s' % (name, variable) for name, variable
+            in sorted(_name_map(entry).items()))
+
+def field_value(entry, data):
+    """Return python code to convert field data to the fields value."""
+    if entry.format == fld.Field.INTEGER:
+        if entry.encoding == fld.Field.LITTLE_ENDIAN:
+            return '%s.get_little_endian_integer()' % data
+        return 'int(%s)' % data
+    elif entry.format == fld.Field.TEXT:
+        return '%s.text(%r)' % (data, entry.encoding)
+    return '%s.decode_value(%s)' % (entry_variable(entry), data)
@@ -26,6 +26,7 @@ See the create_decoder_classes function.
 
 from ConfigParser import NoOptionError, NoSectionError
 import glob
+import imp
 import itertools
 import os
 import re
@@ -328,6 +329,23 @@ class _PythonDecoder:
             _check_encoded_data(spec, sourcefile, generated_data.bytes(), xml, require_exact_encoding)
 	return xml
 
+class _PythonTemplateDecoder:
+    """Use a decoder generated from the python template for the tests."""
+    TEST_DIR = os.path.join(os.path.dirname(__file__), 'temp')
+    LANGUAGE = "python"
+
+    def _decode_file(self, spec, common, sourcefile, should_check_encoding=True, require_exact_encoding=False):
+        generate(spec, common, self, False)
+        module = imp.load_source('generated_decoder',
+                os.path.join(self.TEST_DIR, 'decoder.py'))
+        decoder = module.Decoder(spec, common)
+        data = dt.Data(sourcefile)
+        try:
+            xml = xmlout.to_string(decoder, data)
+        except bdec.DecodeError, ex:
+            raise ExecuteError(3, ex)
+        return xml
+
 def create_decoder_classes(base_classes, module):
     """
     Return a dictionary of classes derived from unittest.TestCase.
@@ -345,7 +363,8 @@ def create_decoder_classes(base_classes, module):
     base_classes -- a tuple containing (base class, name)
     module -- the module name the generated classes will part of
     """
-    decoders = [(_CDecoder, 'C'), (_PythonDecoder, 'Python')]
+    decoders = [(_CDecoder, 'C'), (_PythonDecoder, 'Python'),
+            (_PythonTemplateDecoder, 'PythonTemplate')]
     result = {}
     for base, prefix in base_classes:
         for decoder, name in decoders:
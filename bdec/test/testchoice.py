@@ -27,8 +27,10 @@ from bdec.expression import ValueResult
 import bdec.choice as chc
 from bdec.constraints import Equals, ConstraintError
 import bdec.data as dt
+import bdec.decode.choice as choice_decoder
 import bdec.field as fld
 import bdec.sequence as seq
+import bdec.sequenceof as sof
 import bdec.expression as expr
 
 
@@ -212,3 +214,75 @@ class TestChoice(unittest.TestCase):
 
         self.assertEqual(dt.Data('\x00'), reduce(operator.add, a.encode(query, {'a':{}})))
         self.assertEqual(dt.Data('\x01asdf'), reduce(operator.add, a.encode(query, {'a':{'footer':'asdf'}})))
+
+    def test_chosen_option_is_decoded_once(self):
+        # When the options cannot be distinguished before decoding, the
+        # successful option shouldn't be decoded a second time.
+        decoded = []
+        def option(name):
+            tag = fld.Field('%s tag' % name, length=8, format=fld.Field.TEXT, constraints=[Equals(name)])
+            def decode_value(data):
+                decoded.append(tag.name)
+                return fld.Field.decode_value(tag, data)
+            tag.decode_value = decode_value
+            return seq.Sequence(name, [
+                fld.Field('%s length:' % name, length=8, format=fld.Field.INTEGER),
+                fld.Field('%s data' % name, length=expr.ValueResult('%s length:' % name) * expr.Constant(8)),
+                tag])
+        a = seq.Sequence('a', [
+            chc.Choice('b', [option('c'), option('d')]),
+            fld.Field('length', length=8, format=fld.Field.INTEGER)])
+
+        results = [(entry.name, value) for is_starting, name, entry, data, value
+                in a.decode(dt.Data('\x01xd\x07')) if not is_starting]
+        self.assertEqual(['c tag', 'd tag'], decoded)
+        self.assertEqual(('d tag', 'd'), results[2])
+        self.assertEqual(('length', 7), results[5])
+
+    def test_deeply_nested_choices(self):
+        # The decode of deeply nested entries shouldn't be limited by the
+        # python recursion limit, even when the options must be trial decoded.
+        end = fld.Field('end', length=8, constraints=[Equals(0)])
+        a = chc.Choice('a', [end])
+        nested = seq.Sequence('nested', [
+            fld.Field('open', length=8, format=fld.Field.INTEGER, constraints=[Equals(1)]),
+            sof.SequenceOf('children', a, 1),
+            fld.Field('close', length=8, format=fld.Field.INTEGER, constraints=[Equals(2)])])
+        unknown = seq.Sequence('unknown', [
+            fld.Field('tag', length=8, format=fld.Field.INTEGER, constraints=[Equals(1)]),
+            sof.SequenceOf('children', a, 1),
+            fld.Field('tail', length=8, format=fld.Field.INTEGER, constraints=[Equals(3)])])
+        a.children = [nested, unknown, end]
+
+        depth = 2000
+        data = dt.Data('\x01' * depth + '\x00' + '\x02' * depth)
+        names = [entry.name for is_starting, name, entry, entry_data, value
+                in a.decode(data) if not is_starting]
+        self.assertEqual(depth, names.count('close'))
+        self.assertEqual(0, names.count('unknown'))
+        self.assertEqual(0, len(data))
+
+    def test_large_nested_trials_arent_buffered(self):
+        # The events of nested trials count towards the events buffered for
+        # an option; when there are too many, the chosen option is decoded
+        # again instead of being replayed.
+        decoded = []
+        tag = fld.Field('c tag', length=8, format=fld.Field.TEXT, constraints=[Equals('c')])
+        def decode_value(data):
+            decoded.append(tag.name)
+            return fld.Field.decode_value(tag, data)
+        tag.decode_value = decode_value
+        item = chc.Choice('item', [seq.Sequence('c', [tag]), fld.Field('d', 8)])
+        a = seq.Sequence('a', [sof.SequenceOf('items', item, 10),
+            fld.Field('a end', length=8, format=fld.Field.TEXT, constraints=[Equals('a')])])
+        b = chc.Choice('b', [a, fld.Field('e', 8)])
+
+        original = choice_decoder.MAX_BUFFERED_EVENTS
+        choice_decoder.MAX_BUFFERED_EVENTS = 50
+        try:
+            results = [(entry.name, value) for is_starting, name, entry, data, value
+                    in b.decode(dt.Data('c' * 10 + 'a')) if not is_starting]
+        finally:
+            choice_decoder.MAX_BUFFERED_EVENTS = original
+        self.assertEqual(20, len(decoded))
+        self.assertEqual(('a end', 'a'), results[-3])
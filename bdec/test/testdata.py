@@ -21,6 +21,7 @@
 
 import operator
 import StringIO
+import tempfile
 import unittest
 
 import bdec
@@ -122,6 +123,24 @@ class TestData(unittest.TestCase):
     def test_equality(self):
         self.assertEqual(dt.Data.from_binary_text('1110'), dt.Data.from_hex('e0').pop(4))
 
+    def test_aligned_equality(self):
+        self.assertEqual(dt.Data('\x0fabc\xf0', 4, 36), dt.Data('\xffabc\xff', 4, 36))
+        self.assertNotEqual(dt.Data('\x0fabc\xf0', 4, 36), dt.Data('\x0fabd\xf0', 4, 36))
+        self.assertNotEqual(dt.Data('\x0fabc\xf0', 4, 36), dt.Data('\x0eabc\xf0', 4, 36))
+        self.assertEqual(dt.Data('\x3c', 2, 6), dt.Data('\xff', 2, 6))
+        self.assertNotEqual(dt.Data('\x3c', 2, 6), dt.Data('\xff', 2, 7))
+
+    def test_unaligned_equality(self):
+        self.assertEqual(dt.Data('\x0fabc\xf0', 4, 36), dt.Data('\x0fabc\xf0', 4, 36).pop(32))
+        self.assertEqual(dt.Data('abc'), dt.Data('\x06\x16\x26\x30', 4, 28))
+        self.assertNotEqual(dt.Data('abd'), dt.Data('\x06\x16\x26\x30', 4, 28))
+
+    def test_hash(self):
+        lookup = {dt.Data('abc') : 1, dt.Data.from_binary_text('101') : 2}
+        self.assertEqual(1, lookup[dt.Data('\x06\x16\x26\x30', 4, 28)])
+        self.assertEqual(2, lookup[dt.Data('\xa0', 0, 3)])
+        self.assertTrue(dt.Data('\xa0', 0, 4) not in lookup)
+
     def test_unaligned_bits(self):
         self.assertEqual(0x2d, int(dt.Data.from_binary_text("010") + dt.Data.from_binary_text("1101")))
 
@@ -160,6 +179,27 @@ class TestData(unittest.TestCase):
         self.assertEqual(4, int(data.pop(8)))
         self.assertEqual('abcd', data.bytes())
 
+    def test_mapped_file(self):
+        buffer = tempfile.TemporaryFile()
+        buffer.write('\x04abcd')
+        data = dt.Data(buffer)
+        self.assertTrue(isinstance(data._buffer, dt._MappedFileBuffer))
+        self.assertEqual(4, int(data.pop(8)))
+        self.assertEqual('abcd', data.pop(32).bytes())
+        self.assertRaises(dt.NotEnoughDataError, int, data.pop(1))
+
+    def test_add_mapped_file(self):
+        buffer = tempfile.TemporaryFile()
+        buffer.write('\x01\x02\x03\x04')
+        data = dt.Data(buffer)
+        data.pop(4)
+        joined = data.pop(20) + dt.Data('\x0f', 4, 8)
+        self.assertEqual('\x10\x20\x3f', joined.bytes())
+
+    def test_empty_file_is_not_mapped(self):
+        data = dt.Data(tempfile.TemporaryFile())
+        self.assertTrue(data.empty())
+
     def test_not_enough_data(self):
         # There was a bug in the size of available data we were popping; check
         # the sizes reported in the exception.
@@ -181,6 +221,20 @@ class TestData(unittest.TestCase):
 
         self.assertRaises(dt.NotEnoughDataError, int, data.pop(1))
 
+    def test_stream_discards_unused_data(self):
+        data = dt.Data(NonSeekable('a' * 300000))
+        data.pop(200000 * 8)
+        self.assertEqual(ord('a'), int(data.pop(8)))
+        self.assertTrue(data._buffer._offset > 0)
+        self.assertEqual(99999 * 8, len(data))
+
+    def test_stream_window(self):
+        data = dt.Data.from_stream(NonSeekable('a' * 300000), 64 * 1024)
+        first = data.pop(8)
+        data.pop(200000 * 8)
+        self.assertEqual(ord('a'), int(data.pop(8)))
+        self.assertRaises(dt.StreamWindowError, int, first)
+
     def test_invalid_binary_text(self):
         try:
             dt.Data.from_binary_text('abcd')
@@ -235,3 +289,58 @@ class TestData(unittest.TestCase):
         a = dt.Data('\x01', 7, 8)
         b = dt.Data('\x0f\xff', 4, 16)
         self.assertEqual('11111 11111111', (a + b).get_binary_text())
+
+    def test_unaligned_integer(self):
+        data = dt.Data.from_hex('12345678')
+        data.pop(3)
+        self.assertEqual(0x12345, int(data.pop(17)))
+        self.assertEqual(0x678, int(data.pop(12)))
+
+    def test_unaligned_bytes(self):
+        data = dt.Data('\x0f\xff\x00', 4, 20)
+        self.assertEqual('\xff\xf0', data.bytes())
+        self.assertEqual(0xf0ff, data.get_little_endian_integer())
+        self.assertEqual('fff0', data.get_hex())
+
+    def test_file_integer(self):
+        buffer = StringIO.StringIO('\x01\x02\x03\x04')
+        data = dt.Data(buffer)
+        data.pop(4)
+        self.assertEqual(0x10203, int(data.pop(20)))
+        self.assertEqual(4, int(data))
+
+    def test_non_seeking_integer(self):
+        data = dt.Data(NonSeekable('\x01\x02\x03\x04'))
+        data.pop(4)
+        self.assertEqual(0x10203, int(data.pop(20)))
+        self.assertEqual(4, int(data))
+
+    def test_join(self):
+        items = [dt.Data('\x01', 7, 8), dt.Data('ab'), dt.Data('\x0f\xff', 4, 16), dt.Data('cd')]
+        self.assertEqual(reduce(operator.add, items), dt.join(items))
+        self.assertEqual('10110 00010110 00101111 11111111 01100011 01100100', dt.join(items).get_binary_text())
+
+    def test_join_empty(self):
+        self.assertEqual(0, len(dt.join([])))
+        self.assertEqual('ab', dt.join([dt.Data(), dt.Data('ab'), dt.Data('', 4, 4)]).bytes())
+
+    def test_join_not_enough_data(self):
+        self.assertRaises(dt.NotEnoughDataError, dt.join, [dt.Data('a'), dt.Data('', 0, 4)])
+
+    def test_write(self):
+        output = StringIO.StringIO()
+        items = [dt.Data('ab'), dt.Data('\x01', 7, 8), dt.Data('\xff', 0, 4)]
+        self.assertEqual(21, dt.write(items, output))
+        self.assertEqual('ab\xf8', output.getvalue())
+
+    def test_write_as_generated(self):
+        # Whole bytes should be written before the rest of the data is
+        # generated.
+        output = StringIO.StringIO()
+        def generate():
+            yield dt.Data('ab')
+            yield dt.Data('\x0f', 4, 8)
+            self.assertEqual('ab', output.getvalue())
+            yield dt.Data('\x0c', 4, 8)
+            self.assertEqual('ab\xfc', output.getvalue())
+        self.assertEqual(24, dt.write(generate(), output))
@@ -97,6 +97,45 @@ class TestExpression(unittest.TestCase):
         self.assertEqual(8, eval("8 * 1 >> 0"))
         self.assertEqual(2, eval("8 / 1 >> 2"))
 
+class TestCompile(unittest.TestCase):
+    def _check(self, text, context):
+        expression = exp.parse(text)
+        self.assertEqual(expression.evaluate(context), expression.compile()(context))
+
+    def test_constant_folding(self):
+        self.assertEqual(42, exp.parse('(5 + 1) * 7').compile()({}))
+        self._check('(4 + 4) * ${a} - len{b} / 2', {'a':3, 'b length':6})
+
+    def test_operators(self):
+        context = {'a':37, 'b':3}
+        for op in ['+', '-', '*', '/', '%', '<<', '>>']:
+            self._check('${a} %s ${b}' % op, context)
+            self._check('${b} %s 2' % op, context)
+
+    def test_round_up_division(self):
+        for should_round_up in [True, False]:
+            expression = exp.RoundUpDivisionExpression(exp.ValueResult('a'),
+                    exp.Constant(8), should_round_up)
+            for value in [-9, 0, 7, 8, 9]:
+                self.assertEqual(expression.evaluate({'a':value}),
+                        expression.compile()({'a':value}))
+
+    def test_missing_reference(self):
+        compiled = exp.parse('${a} * 8 + 1').compile()
+        self.assertRaises(exp.UndecodedReferenceError, compiled, {})
+        self.assertRaises(exp.NullReferenceError, compiled, {'a':None})
+        self.assertRaises(exp.UndecodedReferenceError, exp.parse('${a}').compile(), {})
+
+    def test_slots(self):
+        slots = {'a':0, 'b length':1}
+        compiled = exp.parse('${a} * 8 + len{b}').compile(slots)
+        self.assertEqual(27, compiled([3, 3]))
+        self.assertRaises(exp.UndecodedReferenceError, compiled, [exp.UNSET, 3])
+        self.assertRaises(exp.NullReferenceError, compiled, [None, 3])
+        self.assertRaises(exp.UndecodedReferenceError, exp.parse('${c} + 1').compile(slots), [1, 2])
+        self.assertEqual(3, exp.parse('${a}').compile(slots)([3, 1]))
+        self.assertRaises(exp.UndecodedReferenceError, exp.parse('${a}').compile(slots), [exp.UNSET, 1])
+
 class TestBoolean(unittest.TestCase):
     def test_greater_equal(self):
         self.assertEqual(True, bool("5 >= 3"))
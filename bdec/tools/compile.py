@@ -46,8 +46,13 @@ def usage(program):
     print '                    with the specified name, it will be used as the'
     print '                    template directory. Otherwise it will use the internal'
     print '                    template with the specified name. If not specified a'
-    print '                    C language decoder will be compiled.'
+    print '                    C language decoder will be compiled. Use \'python\' to'
+    print '                    generate a python decoder module.'
     print '  -V                Print the version of the bdec compiler.'
+    print
+    print 'Environment:'
+    print '  BDEC_CACHE_DIR    Cache the loaded specifications in this directory, so'
+    print '                    unchanged specifications load quickly.'
 
 def main():
     try:
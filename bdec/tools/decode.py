@@ -24,12 +24,14 @@ import getopt
 
 import bdec
 import bdec.data as dt
-import bdec.inspect.param
+from bdec.decode import Decoder, UnknownSelectionError
 import bdec.output.xmlout as xmlout
 from bdec.spec import load_specs
 
+_FORMATS = ['xml', 'json', 'ndjson', 'csv', 'columns']
+
 def usage(program):
-    print 'Decode standard input to xml given a bdec specification.'
+    print 'Decode standard input to xml (or json) given a bdec specification.'
     print 'Usage:'
     print '   %s [options] <spec_filename>' % program
     print
@@ -38,38 +40,82 @@ def usage(program):
     print
     print 'Options:'
     print '  -f <filename>     Decode from filename instead of stdin.'
+    print '  --format=<xml|json|ndjson|csv|columns>'
+    print '                    The output format (defaults to xml). The ndjson format'
+    print '                    writes each item of a sequenceof as a json line. The csv'
+    print '                    and columns formats write each item of a sequenceof as a'
+    print '                    row, as csv or to a columnar file (see'
+    print '                    bdec.output.columns).'
     print '  -h, --help        Print this help.'
     print '  -l                Log status messages.'
     print '  --main=<name>     Specify the entry to be used as the decoder.'
+    print '  --profile=<filename>'
+    print '                    Record the time spent decoding each entry. A table is'
+    print '                    printed to stderr, and the results are saved as json to'
+    print '                    the given filename.'
     print '  -q                Quiet output. Only errors will be printed to stderr.'
+    print '  --records=<name>  The sequenceof whose items are written in ndjson, csv, or'
+    print '                    columns output.'
+    print '                    Defaults to the first visible sequenceof.'
     print '  --remove-unused   Remove any entries that are not referenced from the main'
     print '                    entry.'
+    print '  --select=<path,...>'
+    print '                    Only decode the entries with the given paths (eg:'
+    print "                    'png.chunks.chunk'). Other entries are skipped where"
+    print '                    possible.'
+    print '  --stream-window=<bytes>'
+    print '                    Read the input as a stream, buffering at most this many'
+    print '                    bytes.'
     print '  --verbose         Include hidden entries and raw data in the decoded output.'
     print '  -V                Print the version of the bdec compiler.'
+    print
+    print 'Environment:'
+    print '  BDEC_CACHE_DIR    Cache the loaded specifications in this directory, so'
+    print '                    unchanged specifications load quickly.'
 
 def _parse_args():
     verbose = 1
     binary = sys.stdin
     main_spec = None
     should_remove_unused = False
+    window = None
+    profile = None
+    select = None
+    format = 'xml'
+    records = None
     try:
-        opts, args = getopt.getopt(sys.argv[1:], 'f:hlqV', ['help', 'main=', 'remove-unused', 'verbose'])
+        opts, args = getopt.getopt(sys.argv[1:], 'f:hlqV', ['format=', 'help', 'main=', 'profile=', 'records=', 'remove-unused', 'select=', 'stream-window=', 'verbose'])
     except getopt.GetoptError, ex:
         sys.exit("%s\nSee '%s -h' for correct usage." % (ex, sys.argv[0]))
     for opt, arg in opts:
         if opt == '-f':
             binary = open(arg, 'rb')
+        elif opt == '--format':
+            if arg not in _FORMATS:
+                sys.exit("Unknown format '%s'; expected one of %s." % (arg, ', '.join(_FORMATS)))
+            format = arg
         elif opt in ['-h', '--help']:
             usage(sys.argv[0])
             sys.exit(0)
         elif opt == '--main':
             main_spec = arg
+        elif opt == '--profile':
+            profile = arg
+        elif opt == '--records':
+            records = arg
         elif opt == '-q':
             verbose = 0
         elif opt == '--verbose':
             verbose = 2
         elif opt == '--remove-unused':
             should_remove_unused = True
+        elif opt == '--select':
+            select = arg.split(',')
+        elif opt == '--stream-window':
+            try:
+                window = int(arg)
+            except ValueError:
+                sys.exit("Invalid stream window '%s'; expected a number of bytes." % arg)
         elif opt == "-l":
             logging.basicConfig(level=logging.INFO)
         elif opt == '-V':
@@ -81,21 +127,55 @@ def _parse_args():
     if len(args) == 0:
         sys.exit("Missing arguments! See '%s -h' for more info." % sys.argv[0])
 
-    return (main_spec, args, binary, verbose, should_remove_unused)
+    return (main_spec, args, binary, verbose, should_remove_unused, window, profile, select, format, records)
+
 
+def _write_profile(profiler, filename, lookup):
+    if profiler is not None:
+        profiler.write_table(sys.stderr)
+        output = open(filename, 'w')
+        profiler.write_json(output, lookup)
+        output.close()
 
 def main():
-    main_spec, specs, binary, verbose, should_remove_unused = _parse_args()
+    main_spec, specs, binary, verbose, should_remove_unused, window, profile, select, format, records = _parse_args()
     try:
-        decoder, common, lookup = load_specs([(s, None, None) for s in specs], main_spec, should_remove_unused)
+        spec, common, lookup = load_specs([(s, None, None) for s in specs], main_spec, should_remove_unused)
     except bdec.spec.LoadError, ex:
         sys.exit(str(ex))
 
-    data = dt.Data(binary)
+    profiler = None
+    if profile is None and select is None:
+        decoder = spec
+    else:
+        if profile is not None:
+            from bdec.decode.profile import Profiler
+            profiler = Profiler()
+        try:
+            decoder = Decoder(spec, profiler, select)
+        except UnknownSelectionError, ex:
+            sys.exit(str(ex))
+
+    if window is None:
+        data = dt.Data(binary)
+    else:
+        data = dt.Data.from_stream(binary, window)
     try:
         if verbose == 0:
             for item in decoder.decode(data):
                 pass
+        elif format == 'json':
+            import bdec.output.jsonout as jsonout
+            jsonout.to_file(decoder, data, sys.stdout, verbose=(verbose==2))
+        elif format == 'ndjson':
+            import bdec.output.jsonout as jsonout
+            jsonout.to_ndjson(decoder, data, sys.stdout, verbose=(verbose==2), records=records)
+        elif format == 'csv':
+            import bdec.output.columns as columns
+            columns.to_csv(decoder, data, sys.stdout, records=records)
+        elif format == 'columns':
+            import bdec.output.columns as columns
+            columns.to_file(decoder, data, sys.stdout, records=records)
         else:
             xmlout.to_file(decoder, data, sys.stdout, verbose=(verbose==2))
     except bdec.DecodeError, ex:
@@ -104,10 +184,12 @@ def main():
         except KeyError:
             (filename, line_number, column_number) = ('unknown', 0, 0)
 
-        # We include an extra new line, as the xml is unlikely to have finished
-        # on a new line (issue164).
+        # We include an extra new line, as the output is unlikely to have
+        # finished on a new line (issue164).
         print
+        _write_profile(profiler, profile, lookup)
         sys.exit("%s[%i]: %s" % (filename, line_number, str(ex)))
+    _write_profile(profiler, profile, lookup)
 
     try:
         # Test to see if we have data undecoded...
@@ -23,16 +23,24 @@ import sys
 import bdec
 import bdec.data as dt
 from bdec.spec import load_specs
+import bdec.output.jsonout as jsonout
 import bdec.output.xmlout as xmlout
 
 __doc__ = '''%s <spec 1> [spec 2]...
-Encode xml to binary given a bdec specification. It will read the xml to from
-encode from stdin.''' % sys.argv[0]
+Encode xml (or json) to binary given a bdec specification. It will read the
+xml to encode from stdin. The xml is encoded as it is read, and the binary
+data written to stdout as it is encoded.
+
+If the BDEC_CACHE_DIR environment variable is set, the loaded specifications
+are cached in that directory.''' % sys.argv[0]
 
 def main():
     parser = OptionParser(usage=__doc__)
     parser.add_option('-f', dest='filename', help='Read the xml from FILE '
             'instead of stdin.', metavar='FILENAME')
+    parser.add_option('--format', dest='format', help='The format of the '
+            'data to encode; either xml or json (defaults to xml).',
+            choices=['xml', 'json'], default='xml')
     parser.add_option('--main', dest='main', help='Specify the entry to '
             'be encoded instead of the toplevel protocol object.',
             metavar='ENTRY')
@@ -51,19 +59,22 @@ def main():
         sys.exit(str(ex))
 
     if options.filename:
-        xml = file(options.filename, 'rb').read()
+        xml = file(options.filename, 'rb')
     else:
-        xml = sys.stdin.read()
+        xml = sys.stdin
 
     try:
-        binary = xmlout.encode(protocol, xml).bytes()
+        if options.format == 'json':
+            jsonout.encode_to_file(protocol, xml, sys.stdout)
+        else:
+            xmlout.encode_to_file(protocol, xml, sys.stdout)
     except bdec.DecodeError, ex:
         try:
             (filename, line_number, column_number) = lookup[ex.entry]
         except KeyError:
             (filename, line_number, column_number) = ('unknown', 0, 0)
+        sys.stdout.flush()
         sys.exit("%s[%i]: %s" % (filename, line_number, str(ex)))
-    sys.stdout.write(binary)
 
 if __name__ == '__main__':
     main()
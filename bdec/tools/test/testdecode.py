@@ -0,0 +1,63 @@
+#   Copyright (C) 2010 Henry Ludemann
+#
+#   This file is part of the bdec decoder library.
+#
+#   The bdec decoder library is free software; you can redistribute it
+#   and/or modify it under the terms of the GNU Lesser General Public
+#   License as published by the Free Software Foundation; either
+#   version 2.1 of the License, or (at your option) any later version.
+#
+#   The bdec decoder library is distributed in the hope that it will be
+#   useful, but WITHOUT ANY WARRANTY; without even the implied warranty
+#   of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Lesser General Public License for more details.
+#
+#   You should have received a copy of the GNU Lesser General Public
+#   License along with this library; if not, see
+#   <http://www.gnu.org/licenses/>.
+
+import os
+import os.path
+import subprocess
+import sys
+import unittest
+
+import bdec
+
+# Modules that aren't needed to decode with a loaded specification.
+_UNUSED_MODULES = ['pyparsing', 'bdec.encode', 'bdec.spec.asn1',
+        'bdec.spec.ebnf', 'bdec.spec.xmlspec', 'bdec.decode.profile',
+        'xml.dom.minidom', 'bdec.output.jsonout', 'bdec.output.columns',
+        'csv', 'json']
+
+# The maximum time to import the decode tool. This is much longer than it
+# should take, so the test doesn't fail on slow machines.
+_IMPORT_BUDGET = 1.0
+
+_SCRIPT = '''
+import sys
+from timeit import default_timer
+start = default_timer()
+import bdec.tools.decode
+print default_timer() - start
+print ' '.join(name for name, module in sys.modules.items() if module is not None)
+'''
+
+class TestImports(unittest.TestCase):
+    def test_decode_imports(self):
+        # The imports are tested in a new interpreter, as the modules will
+        # already be loaded in this one.
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.path.dirname(os.path.dirname(os.path.abspath(bdec.__file__)))
+        process = subprocess.Popen([sys.executable, '-c', _SCRIPT],
+                stdout=subprocess.PIPE, env=env)
+        output = process.communicate()[0]
+        self.assertEqual(0, process.returncode)
+        seconds, modules = output.splitlines()
+
+        modules = modules.split()
+        self.assertTrue('bdec.tools.decode' in modules)
+        for name in _UNUSED_MODULES:
+            self.assertFalse(name in modules, "'%s' was imported!" % name)
+        self.assertTrue(float(seconds) < _IMPORT_BUDGET,
+                'Importing took %s seconds!' % seconds)
@@ -21,13 +21,14 @@ setup(name='bdec',
       download_url='http://www.protocollogic.com/files/bdec-%s.tar.gz' % bdec.__version__,
       packages=find_packages(exclude=["specs", "specs.*", 'tools', 'tools.*',
           'regression', 'regression.*']),
-      package_data={'bdec': ['templates/c/*']},
+      package_data={'bdec': ['templates/c/*', 'templates/python/*']},
       entry_points={'console_scripts': [
           'bcompile = bdec.tools.compile:main',
           'bdecode = bdec.tools.decode:main',
           'bencode = bdec.tools.encode:main',
           ]},
       install_requires=['pyparsing', 'nose', 'mako'],
+      extras_require={'arrays': ['numpy']},
       zip_safe=True,
       license="GNU LGPL",
       test_suite='nose.collector',